@@ -1,34 +1,17 @@
-import os
-import json
+from state_db import fetchall
+import write_behind
 
-PATH = "data/activity.json"
-
-def init_activity():
-    if not os.path.exists("data"):
-        os.makedirs("data")
-    if not os.path.exists(PATH):
-        with open(PATH, "w") as f:
-            json.dump({}, f)
-def load_activity():
-    init_activity()
-    with open(PATH, "r") as f:
-        return json.load(f)
-
-def save_activity(data):
-    with open(PATH, "w") as f:
-        json.dump(data, f, indent=4)
+MAX_ITEMS = write_behind.ACTIVITY_KEEP
 
 def log_activity(user_id, text):
-    data = load_activity()
-    uid = str(user_id)
-    if uid not in data:
-        data[uid] = []
-    data[uid].append(text)
-    data[uid] = data[uid][-20:]
-
-    save_activity(data)
+    # buffered; written to the activity table by the write-behind flusher
+    write_behind.record_activity(int(user_id), text)
 
 def get_user_activity(user_id):
-    data = load_activity()
-    uid = str(user_id)
-    return data.get(uid, [])
+    uid = int(user_id)
+    rows = fetchall(
+        "SELECT text FROM activity WHERE user_id=? ORDER BY id DESC LIMIT ?",
+        (uid, MAX_ITEMS)
+    )
+    items = [r[0] for r in reversed(rows)] + write_behind.pending_activity(uid)
+    return items[-MAX_ITEMS:]
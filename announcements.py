@@ -1,33 +1,17 @@
-import json
-import os
 from datetime import datetime
-
-PATH = "data/announcements.json"
+from state_db import fetchall, fetchone, transaction
 
 
 # ----------------------------------------------------
-# Init store
+# Load
 # ----------------------------------------------------
-def init_store():
-    if not os.path.exists("data"):
-        os.makedirs("data")
-    if not os.path.exists(PATH):
-        with open(PATH, "w") as f:
-            json.dump([], f)
+def _row_to_dict(row):
+    return {"author": row[0], "text": row[1], "tag": row[2], "timestamp": row[3]}
 
 
-# ----------------------------------------------------
-# Load and save
-# ----------------------------------------------------
 def load_announcements():
-    init_store()
-    with open(PATH, "r") as f:
-        return json.load(f)
-
-
-def save_announcements(data):
-    with open(PATH, "w") as f:
-        json.dump(data, f, indent=4)
+    rows = fetchall("SELECT author, text, tag, timestamp FROM announcements ORDER BY id")
+    return [_row_to_dict(r) for r in rows]
 
 
 # ----------------------------------------------------
@@ -42,17 +26,11 @@ def add_announcement(text, tag="general", author="AAES Bot"):
     exam
     urgent
     """
-    data = load_announcements()
-
-    new = {
-        "author": author,
-        "text": text,
-        "tag": tag.lower(),
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M")
-    }
-
-    data.append(new)
-    save_announcements(data)
+    with transaction() as conn:
+        conn.execute(
+            "INSERT INTO announcements(author, text, tag, timestamp) VALUES (?,?,?,?)",
+            (author, text, tag.lower(), datetime.now().strftime("%Y-%m-%d %H:%M"))
+        )
     return True
 
 
@@ -60,13 +38,17 @@ def add_announcement(text, tag="general", author="AAES Bot"):
 # Delete announcement
 # ----------------------------------------------------
 def delete_announcement(index):
-    data = load_announcements()
-    if index < 0 or index >= len(data):
+    if index < 0:
         return None
-
-    removed = data.pop(index)
-    save_announcements(data)
-    return removed
+    with transaction() as conn:
+        row = conn.execute(
+            "SELECT id, author, text, tag, timestamp FROM announcements ORDER BY id LIMIT 1 OFFSET ?",
+            (index,)
+        ).fetchone()
+        if not row:
+            return None
+        conn.execute("DELETE FROM announcements WHERE id=?", (row[0],))
+    return _row_to_dict(row[1:])
 
 
 # ----------------------------------------------------
@@ -102,23 +84,26 @@ def format_announcements():
 # Return latest flight log
 # ----------------------------------------------------
 def get_latest_flightlog():
-    data = load_announcements()
-    logs = [a for a in data if a["tag"] == "flightlog"]
-
-    if not logs:
+    row = fetchone(
+        "SELECT author, text, tag, timestamp FROM announcements "
+        "WHERE tag='flightlog' ORDER BY id DESC LIMIT 1"
+    )
+    if not row:
         return None
 
-    return logs[-1]
+    return _row_to_dict(row)
 
-    from datetime import datetime
 
 def format_announcements_pretty(limit=10):
-    data = load_announcements()
-    if not data:
+    rows = fetchall(
+        "SELECT author, text, tag, timestamp FROM announcements ORDER BY id DESC LIMIT ?",
+        (limit,)
+    )
+    if not rows:
         return "📭 No announcements yet."
 
     lines = []
-    for a in data[-limit:][::-1]:          # newest first
+    for a in map(_row_to_dict, rows):      # newest first
         tag_icon = {
             "general": "📰",
             "internship": "💼",
@@ -0,0 +1,170 @@
+# answer_cache.py  –  reuse AI answers for repeated questions
+#
+# Questions are normalised (case, punctuation, filler words) and looked up
+# exactly first. Failing that, a 64-permutation MinHash signature of the
+# question's content words is bucketed with LSH (16 bands x 4 rows) and the
+# nearest cached question is reused if it asks the same kind of question
+# (what / why / how …, see question_words) and its content-word Jaccard
+# similarity reaches NEAR_THRESHOLD. Entries expire after TTL seconds; the least
+# recently used ones go first once MAX_ENTRIES is reached.
+import os
+import re
+import time
+import zlib
+import random
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+TTL = int(os.getenv("ANSWER_CACHE_TTL", str(6 * 3600)))
+NEAR_THRESHOLD = float(os.getenv("ANSWER_CACHE_NEAR", "0.8"))
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+_PRIME = (1 << 61) - 1
+_rng = random.Random(1961)
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+_STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "of", "to", "in", "on", "for",
+    "and", "or", "what", "whats", "how", "why", "does", "do", "can", "you", "me", "i",
+    "please", "explain", "describe", "define", "tell", "about", "it", "this", "that",
+    "with", "by", "as", "s", "briefly", "simple", "terms", "give", "meaning", "user",
+}
+
+# kept out of content_words, but they change what is being asked:
+# "why does a wing stall" must not reuse the answer to "what is a wing stall"
+_QUESTION_WORDS = {
+    "what": "what", "whats": "what", "how": "how", "why": "why", "when": "when",
+    "where": "where", "which": "which", "who": "who",
+    "explain": "explain", "describe": "describe", "define": "define",
+}
+
+_lock = threading.Lock()
+_entries = OrderedDict()    # key -> (answer, expires_at, words, signature, question words)
+_bands = {}                 # (band, hash) -> set(keys)
+_stats = {"hits": 0, "near_hits": 0, "misses": 0}
+
+
+# ----------------------------------------------------
+# Normalisation / signatures
+# ----------------------------------------------------
+def normalize(prompt: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", prompt.lower()))
+
+def content_words(key: str) -> frozenset:
+    """Normalised words minus filler/question words."""
+    out = set()
+    for w in key.split():
+        if w in _STOPWORDS:
+            continue
+        if len(w) > 3 and w.endswith("s") and not w.endswith("ss"):
+            w = w[:-1]          # crude plural folding: "nozzles" -> "nozzle"
+        out.add(w)
+    return frozenset(out)
+
+def question_words(key: str) -> frozenset:
+    """The question words of a normalised prompt, e.g. {"why"}."""
+    return frozenset(_QUESTION_WORDS[w] for w in key.split() if w in _QUESTION_WORDS)
+
+def _signature(words: frozenset) -> tuple:
+    hashes = [zlib.crc32(w.encode()) for w in words] or [0]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMS)
+
+def _band_keys(sig: tuple):
+    for i in range(BANDS):
+        yield (i, hash(sig[i * ROWS:(i + 1) * ROWS]))
+
+
+# ----------------------------------------------------
+# Internal bookkeeping (caller holds _lock)
+# ----------------------------------------------------
+def _drop(key: str):
+    entry = _entries.pop(key, None)
+    if not entry:
+        return
+    for bk in _band_keys(entry[3]):
+        keys = _bands.get(bk)
+        if keys:
+            keys.discard(key)
+            if not keys:
+                del _bands[bk]
+
+def _live(key: str, now: float):
+    entry = _entries.get(key)
+    if entry is None:
+        return None
+    if entry[1] < now:
+        _drop(key)
+        return None
+    _entries.move_to_end(key)
+    return entry
+
+
+# ----------------------------------------------------
+# Public API
+# ----------------------------------------------------
+def get(prompt: str) -> Optional[str]:
+    key = normalize(prompt)
+    if not key:
+        return None
+    now = time.time()
+    with _lock:
+        entry = _live(key, now)
+        if entry:
+            _stats["hits"] += 1
+            return entry[0]
+
+        words = content_words(key)
+        asks = question_words(key)
+        if words:
+            sig = _signature(words)
+            candidates = set()
+            for bk in _band_keys(sig):
+                candidates |= _bands.get(bk, set())
+            best, best_sim = None, 0.0
+            for cand in candidates:
+                e = _live(cand, now)
+                if not e or e[4] != asks:
+                    continue
+                sim = len(words & e[2]) / len(words | e[2])
+                if sim > best_sim:
+                    best, best_sim = e, sim
+            if best and best_sim >= NEAR_THRESHOLD:
+                _stats["near_hits"] += 1
+                return best[0]
+
+        _stats["misses"] += 1
+        return None
+
+
+def put(prompt: str, answer: str):
+    key = normalize(prompt)
+    if not key or not answer:
+        return
+    words = content_words(key)
+    sig = _signature(words)
+    with _lock:
+        _drop(key)
+        _entries[key] = (answer, time.time() + TTL, words, sig, question_words(key))
+        if words:
+            for bk in _band_keys(sig):
+                _bands.setdefault(bk, set()).add(key)
+        while len(_entries) > MAX_ENTRIES:
+            _drop(next(iter(_entries)))
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+        _bands.clear()
+
+
+def stats() -> dict:
+    with _lock:
+        out = dict(_stats, size=len(_entries))
+    lookups = out["hits"] + out["near_hits"] + out["misses"]
+    out["hit_rate"] = round((out["hits"] + out["near_hits"]) / lookups, 3) if lookups else 0.0
+    return out
@@ -21,7 +21,9 @@ if sa_json_b64:
     print("✅ service_account.json created from base64 environment")
 else:
     print("⚠️ GOOGLE_SA_JSON_B64 not set - Google Drive will fail")    
-from flask import Flask, request
+import hmac
+import hashlib
+from aiohttp import web
 from telegram import Update
 
 logging.basicConfig(level=logging.INFO)
@@ -31,48 +33,111 @@ TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 if not TOKEN:
     raise RuntimeError("TELEGRAM_BOT_TOKEN not set")
 
-flask_app = Flask(__name__)
-
-@flask_app.route("/")
-def home():
-    return "✈️ AAES Bot is running!", 200
-
-@flask_app.route("/health")
-def health():
-    return {"status": "alive"}, 200
+# Hardcode your actual Render URL (no env var)
+WEBHOOK_URL = "https://aaes-bot.onrender.com/webhook"
+# Telegram echoes this in X-Telegram-Bot-Api-Secret-Token on every webhook call;
+# defaults to a value derived from the bot token so no extra setup is needed
+WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET") or hmac.new(
+    TOKEN.encode(), b"aaes-webhook", hashlib.sha256
+).hexdigest()
+MAX_BODY_BYTES = int(os.getenv("WEBHOOK_MAX_BODY_KB", "256")) * 1024
+RETRY_AFTER_SECONDS = "2"
 
 # Import your existing bot
 import sys
 sys.path.insert(0, os.path.dirname(__file__))
 
 # Build bot application
-from telegram.ext import ApplicationBuilder
-from bot import build_app
+import asyncio
+from bot import build_app, UPDATE_QUEUE_SIZE
 
 telegram_app = build_app()
 
-@flask_app.route("/webhook", methods=["POST"])
-def webhook():
-    update = Update.de_json(request.get_json(), telegram_app.bot)
-    telegram_app.process_update(update)
-    return "ok", 200
+# ---------- routes ----------
+# aiohttp runs on the same event loop as the bot: /webhook only decodes the
+# update and puts it on update_queue, and the Application's own update
+# fetcher dispatches it (concurrently, see build_app) after 200 is returned.
+# Cheap checks come first: the secret header before the body is read, the
+# declared size before parsing, and 429 (Telegram retries later) while the
+# handlers are saturated or the queue is full.
+routes = web.RouteTableDef()
 
-import asyncio
-import re
+@routes.get("/")
+async def home(request):
+    return web.Response(text="✈️ AAES Bot is running!")
 
-def run():
-    # Hardcode your actual Render URL (no env var)
-    webhook_url = "https://aaes-bot.onrender.com/webhook"
-    
+@routes.get("/health")
+async def health(request):
+    return web.json_response({"status": "alive"})
+
+_accepted = 0       # updates put on the queue; minus processor.finished = not handled yet
+
+def _saturated() -> bool:
+    processor = telegram_app.update_processor
+    outstanding = _accepted - processor.finished
+    return outstanding >= processor.max_concurrent_updates + UPDATE_QUEUE_SIZE
+
+def _too_busy():
+    return web.Response(status=429, text="busy", headers={"Retry-After": RETRY_AFTER_SECONDS})
+
+@routes.post("/webhook")
+async def webhook(request):
+    global _accepted
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(token.encode(), WEBHOOK_SECRET.encode()):
+        return web.Response(status=403, text="forbidden")
+    if request.content_length is not None and request.content_length > MAX_BODY_BYTES:
+        return web.Response(status=413, text="too large")
+    if _saturated():
+        return _too_busy()
     try:
-        # Use the bot's synchronous set_webhook method
-        telegram_app.bot.set_webhook(url=webhook_url)
-        logger.info(f"✅ Webhook set: {webhook_url}")
+        update = Update.de_json(await request.json(), telegram_app.bot)
+    except web.HTTPRequestEntityTooLarge:
+        return web.Response(status=413, text="too large")
+    except Exception as e:
+        logger.warning("Ignoring malformed webhook body: %s", e)
+        return web.Response(status=400, text="bad request")
+    try:
+        telegram_app.update_queue.put_nowait(update)
+    except asyncio.QueueFull:
+        return _too_busy()
+    _accepted += 1
+    return web.Response(text="ok")
+
+# ---------- lifecycle ----------
+async def start_bot(_):
+    await telegram_app.initialize()
+    if telegram_app.post_init:
+        await telegram_app.post_init(telegram_app)
+    await telegram_app.start()
+    try:
+        await telegram_app.bot.set_webhook(
+            url=WEBHOOK_URL,
+            allowed_updates=Update.ALL_TYPES,
+            secret_token=WEBHOOK_SECRET
+        )
+        logger.info(f"✅ Webhook set: {WEBHOOK_URL}")
     except Exception as e:
         logger.error(f"❌ Failed to set webhook: {e}")
-    
+
+async def stop_bot(_):
+    await telegram_app.stop()
+    if telegram_app.post_stop:
+        await telegram_app.post_stop(telegram_app)
+    await telegram_app.shutdown()
+    if telegram_app.post_shutdown:
+        await telegram_app.post_shutdown(telegram_app)
+
+def make_web_app() -> web.Application:
+    web_app = web.Application(client_max_size=MAX_BODY_BYTES)
+    web_app.add_routes(routes)
+    web_app.on_startup.append(start_bot)
+    web_app.on_cleanup.append(stop_bot)
+    return web_app
+
+def run():
     port = int(os.getenv("PORT", 10000))
-    flask_app.run(host="0.0.0.0", port=port)
+    web.run_app(make_web_app(), host="0.0.0.0", port=port)
 
 if __name__ == "__main__":
     run()
@@ -0,0 +1,89 @@
+# bench_state_db.py  –  per-call latency of user state before/after pooling and flow_state
+#   python bench_state_db.py [iterations]
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import state_db
+import flow_state
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+
+# ----------------------------------------------------
+# Old behaviour: new connection + CREATE TABLE + commit per call
+# ----------------------------------------------------
+def _legacy_conn(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_state (
+            user_id INTEGER PRIMARY KEY,
+            state   TEXT,
+            data    TEXT
+        )
+    """)
+    conn.commit()
+    return conn
+
+def legacy_get_state(path, user_id):
+    with _legacy_conn(path) as conn:
+        row = conn.execute("SELECT state, data FROM user_state WHERE user_id=?", (user_id,)).fetchone()
+        if not row:
+            return {}
+        return {"state": row[0], "data": json.loads(row[1] or "{}")}
+
+def legacy_set_state(path, user_id, state, data=None):
+    with _legacy_conn(path) as conn:
+        conn.execute(
+            "REPLACE INTO user_state(user_id, state, data) VALUES (?,?,?)",
+            (user_id, state, json.dumps(data or {}))
+        )
+        conn.commit()
+
+
+def _timed(label, fn):
+    t0 = time.perf_counter()
+    for i in range(N):
+        fn(i)
+    us = (time.perf_counter() - t0) / N * 1e6
+    print(f"{label:<28} {us:9.1f} µs/call")
+    return us
+
+async def _timed_async(label, fn):
+    t0 = time.perf_counter()
+    for i in range(N):
+        await fn(i)
+    us = (time.perf_counter() - t0) / N * 1e6
+    print(f"{label:<28} {us:9.1f} µs/call")
+    return us
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    legacy_path = os.path.join(tmp, "legacy.db")
+    pooled_path = Path(tmp) / "pooled.db"
+
+    # point the module at a scratch database (no JSON import)
+    state_db.DB.close()
+    state_db.DB.path = pooled_path
+    state_db.DB.on_create = None
+
+    print(f"{N} iterations, 100 users\n")
+    before_get = _timed("legacy get_state", lambda i: legacy_get_state(legacy_path, i % 100))
+    before_set = _timed("legacy set_state", lambda i: legacy_set_state(legacy_path, i % 100, "ask"))
+    after_get = _timed("flow_state.load (cached)", lambda i: flow_state.load(i % 100))
+    after_set = _timed("flow_state.save", lambda i: flow_state.save(i % 100, "ask"))
+    asyncio.run(_timed_async("flow_state.aload (cached)", lambda i: flow_state.aload(i % 100)))
+
+    print(f"\nget_state speed-up: {before_get / after_get:.1f}x")
+    print(f"set_state speed-up: {before_set / after_set:.1f}x")
+    state_db.DB.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# bench_webhook.py  –  webhook POSTs/s through app.py with Telegram stubbed out
+#   python bench_webhook.py [requests]
+# Bot.get_me / set_webhook are replaced so nothing leaves the machine, and a
+# single no-op handler stands in for the real ones: this measures the
+# request path (secret check, decode, update_queue) rather than the handlers.
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "1:bench")
+
+from aiohttp.test_utils import TestClient, TestServer
+from telegram import Update, User
+from telegram.ext import ExtBot, TypeHandler
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+
+async def _get_me(self, *args, **kwargs):
+    self._bot_user = User(1, "bench", True, username="bench")
+    return self._bot_user
+
+async def _set_webhook(self, *args, **kwargs):
+    return True
+
+ExtBot.get_me = _get_me
+ExtBot.set_webhook = _set_webhook
+
+import app      # noqa: E402  (needs the stubs and token above)
+
+handled = 0
+
+async def _handle(update, context):
+    global handled
+    handled += 1
+
+async def _no_post_init(application):
+    pass
+
+app.telegram_app.handlers.clear()
+app.telegram_app.add_handler(TypeHandler(Update, _handle))
+app.telegram_app.post_init = _no_post_init
+
+
+def _update(i: int) -> dict:
+    return {
+        "update_id": i,
+        "message": {"message_id": i, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "hi"},
+    }
+
+
+async def main():
+    headers = {"X-Telegram-Bot-Api-Secret-Token": app.WEBHOOK_SECRET}
+    async with TestClient(TestServer(app.make_web_app())) as client:
+        async def post(i):
+            r = await client.post("/webhook", json=_update(i), headers=headers)
+            return r.status
+
+        start = time.perf_counter()
+        statuses = await asyncio.gather(*(post(i) for i in range(N)))
+        elapsed = time.perf_counter() - start
+        while handled < statuses.count(200) and time.perf_counter() - start < elapsed + 5:
+            await asyncio.sleep(0.05)
+
+    codes = {s: statuses.count(s) for s in sorted(set(statuses))}
+    print(f"{N} POSTs in {elapsed:.2f}s  ({N / elapsed:,.0f}/s)  status {codes}, handled {handled}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
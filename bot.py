@@ -14,7 +14,6 @@ from telegram.ext import (
     CallbackContext,
     ContextTypes,
 )
-from flask import Flask, request
 from telegram import Bot
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload
@@ -29,15 +28,21 @@ from google.auth import _helpers
 warnings.filterwarnings("ignore", category=DeprecationWarning, module="google.auth")
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup, InputFile, InputMediaPhoto
 import random
-from utils import read_file_content, display_exec_info, list_files_in_folder
+from utils import display_exec_info, list_files_in_folder
 from admin import is_admin, load_admins, add_admin, remove_admin
 from admin_menu import admin_panel_markup
 from formula_reference import add_formula
 add_formula("Aerodynamics", "Lift Force", "L = ½ ρ V² S CL", "Works for subsonic flight")
 add_formula("Thermodynamics", "Ideal Gas Law", "PV = nRT")
 # local modules
-from utils import ai_chat_response, handle_upload, send_drive_file, add_turn, build_prompt
+from utils import ai_chat_response, handle_upload, send_drive_file, add_turn, build_prompt, MessageStreamer, ask_ai
 from drive_search import search_drive, _find_folder_id, _files_in_folder
+import drive_catalog
+import drive_gateway
+import conversation_store
+from callback_dispatch import CallbackRouter
+import broadcast
+from broadcast import start_broadcast, run_broadcast
 from activity import log_activity, get_user_activity
 from announcements import add_announcement, load_announcements
 from helpdesk import add_ticket
@@ -65,10 +70,10 @@ from daily_flight_log import get_daily_fact, should_send_fact, mark_fact_sent
 from exam_mode import exam_mode_active, exam_countdown
 from utils import prettify_answer
 from collections import deque
-from state_db import get_state, set_state
-# uid -> deque of {"role": "user"|"assistant", "text": str, "file": str|None}
-CONVERSATION = {}
-MAX_HISTORY = 10
+from state_db import init_db, arun
+import flow_state
+from flow_state import StateRouter, STAY, goto
+import write_behind
 # ---------- global vars ----------
 
 load_dotenv()
@@ -81,7 +86,6 @@ SERVICE_ACCOUNT_FILE = os.getenv("GOOGLE_SA_PATH", "service_account.json")
 SCOPES = ["https://www.googleapis.com/auth/drive.readonly"]
 
 ADMINS = load_admins() if "load_admins" in globals() else []
-USER_STATE = {}
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 logger = logging.getLogger("aaes-bot")
@@ -217,16 +221,16 @@ async def route_persistent_text(update: Update, context: ContextTypes.DEFAULT_TY
         await update.message.reply_text("Choose level", reply_markup=materials_menu_markup())
 
     elif mapping[text] == "ask_ai":
-        set_state(uid,"ask")
+        await flow_state.asave(uid, "ask")
         await update.message.reply_text("Type your question or upload slides. Use /cancel to return.")
 
     elif mapping[text] == "announcements":
-        data = load_announcements()
+        data = await arun(load_announcements)
         if not data:
             await update.message.reply_text("No announcements yet.", reply_markup=persistent_menu(is_admin(uid)))
         else:
             from announcements import format_announcements_pretty
-            text = format_announcements_pretty(10)
+            text = await arun(format_announcements_pretty, 10)
             await update.message.reply_text(text, parse_mode="Markdown", reply_markup=persistent_menu(is_admin(uid)))
 
     elif mapping[text] == "toolkit":
@@ -236,7 +240,7 @@ async def route_persistent_text(update: Update, context: ContextTypes.DEFAULT_TY
         await update.message.reply_text("AAES Hub", reply_markup=hub_menu_markup())
 
     elif mapping[text] == "helpdesk":
-        set_state(uid,"helpdesk")
+        await flow_state.asave(uid, "helpdesk")
         await update.message.reply_text("Describe your issue. Use /cancel to return to menu.")
     elif mapping[text] == "admin":
         await update.message.reply_text("🔐 Admin Panel", reply_markup=admin_panel_markup())
@@ -250,12 +254,12 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info("Start by %s (%s)", user.full_name, user.id)
 
     uid = user.id
-    subscribe(uid)  # Automatically subscribe the user
+    await arun(subscribe, uid)  # Automatically subscribe the user
     is_user_admin = is_admin(uid)
 
     welcome = "👋 Welcome to *AAES Study Bot*!"
-    if exam_mode_active():  # ✅ Now imported
-        days = exam_countdown()
+    if await arun(exam_mode_active):  # ✅ Now imported
+        days = await arun(exam_countdown)
         if days is not None:
             welcome += f"\n\n🚨 *Exam Mode* – T-Minus **{days}** day{'s' if days != 1 else ''}!"
 
@@ -296,7 +300,7 @@ async def myid_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
 async def reset_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
-    CONVERSATION.pop(uid, None)
+    await arun(conversation_store.clear, uid)
     await update.message.reply_text("🧠 Conversation history cleared.")
 
 # Function to read text content from a DOCX file
@@ -364,10 +368,7 @@ async def send_executive_info(update: Update, context: ContextTypes.DEFAULT_TYPE
         await context.bot.send_message(chat_id=q.message.chat_id, text="Photo not available.")
 
 def get_drive_service():
-    creds = service_account.Credentials.from_service_account_file(
-        SERVICE_ACCOUNT_FILE, scopes=SCOPES
-    )
-    return build('drive', 'v3', credentials=creds)
+    return drive_gateway.service()
 
 async def upload_file_to_telegram(update: Update, context: ContextTypes.DEFAULT_TYPE):
     file_path = 'path/to/your/file.pdf'  # Replace with your file path
@@ -383,758 +384,696 @@ async def upload_file_to_telegram(update: Update, context: ContextTypes.DEFAULT_
         logger.error(f"Failed to upload file: {e}")
         await context.bot.send_message(chat_id=chat_id, text="Failed to upload file.")
 
-async def send_drive_file(file_id, filename, bot, chat_id, caption=""):
-    try:
-        drive_service = get_drive_service()
-
-        request = drive_service.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-        fh.seek(0)
-
-        mime, _ = mimetypes.guess_type(filename)
-        if not mime:
-            mime = "application/octet-stream"
-
-        file_size = fh.getbuffer().nbytes
-        if file_size > 49 * 1024 * 1024:  # 49 MB safety margin
-            file = drive_service.files().get(fileId=file_id, fields="webViewLink").execute()
-            link = file.get("webViewLink", "https://drive.google.com")
-            await bot.send_message(
-                chat_id=chat_id,
-                text=f"📁 *{filename}* is too large for Telegram.\n\n[Download here]({link})",
-                parse_mode=ParseMode.MARKDOWN,
-                disable_web_page_preview=True
-            )
-            return
-
-        await bot.send_document(
-            chat_id=chat_id,
-            document=InputFile(fh, filename=filename),
-            caption=caption or "",
-            parse_mode=ParseMode.MARKDOWN,
-            read_timeout=300,
-            write_timeout=300,
-        )
-
-    except Exception as e:
-        logger.error(f"Failed to send file: {e}")
-        try:
-            file = drive_service.files().get(fileId=file_id, fields="webViewLink").execute()
-            link = file.get("webViewLink", "https://drive.google.com")
-            await bot.send_message(
-                chat_id=chat_id,
-                text=f"⚠️ Could not send *{filename}* directly.\n\n[Download here]({link})",
-                parse_mode=ParseMode.MARKDOWN
-            )
-        except Exception as e2:
-            logger.error(f"Fallback link also failed: {e2}")
-            await bot.send_message(chat_id=chat_id, text="❌ File unavailable.")
-
 
 async def ping_me(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.message.text.strip() == "/ping":
         await update.message.reply_text("🏓 still alive")
 #-----callback router -----
+# Each inline button's callback_data is routed through `callbacks`; see
+# callback_dispatch.py. Handlers get (update, context, *payload).
+callbacks = CallbackRouter()
 
 async def callback_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
-    code = q.data
-    uid = q.from_user.id
+    await callbacks.dispatch(update, context, q.data)
 
-    if code == "menu":
-        await q.edit_message_text("Main menu", reply_markup=InlineKeyboardMarkup([]))
-        await context.bot.send_message(
-            chat_id=q.message.chat_id,
-            text="Choose an option:",
-            reply_markup=persistent_menu(),
-        )
-        return
-
-    if code == "ask_ai":
-        set_state(uid, "ask")
-        await q.edit_message_text("Type your question or upload slides. Use /cancel to return.")
-        return
-
-    if code == "materials":
-        await q.edit_message_text("Choose level", reply_markup=materials_menu_markup())
-        return
+@callbacks.exact("menu")
+async def _cb_menu(update, context):
+    q = update.callback_query
+    await q.edit_message_text("Main menu", reply_markup=InlineKeyboardMarkup([]))
+    await context.bot.send_message(
+        chat_id=q.message.chat_id,
+        text="Choose an option:",
+        reply_markup=persistent_menu(),
+    )
 
-    if code == "materials_global":
-        set_state(uid,"global_search")
-        await q.edit_message_text("Type anything to search all slides and past questions. Use /cancel to return.")
-        return
+@callbacks.exact("ask_ai")
+async def _cb_ask_ai(update, context):
+    q = update.callback_query
+    await flow_state.asave(q.from_user.id, "ask")
+    await q.edit_message_text("Type your question or upload slides. Use /cancel to return.")
 
-    if code.startswith("level_"):
-        USER_STATE[uid] = code
-        await q.edit_message_text("Choose resource type", reply_markup=materials_type_markup())
-        return
+@callbacks.exact("materials")
+async def _cb_materials(update, context):
+    await update.callback_query.edit_message_text("Choose level", reply_markup=materials_menu_markup())
 
-    if code == "materials_slides":
-        set_state(uid,"search_slides")
-        await q.edit_message_text("Type the course name or code to find slides. Use /cancel to return.")
-        return
+@callbacks.exact("materials_global")
+async def _cb_materials_global(update, context):
+    q = update.callback_query
+    await flow_state.asave(q.from_user.id, "global_search")
+    await q.edit_message_text("Type anything to search all slides and past questions. Use /cancel to return.")
 
-    if code == "materials_pastq":
-        set_state(uid,"search_pastq")
-        await q.edit_message_text("Type the course name or code to find past questions. Use /cancel to return.")
-        return
+@callbacks.prefix("level_", str)
+async def _cb_level(update, context, level):
+    q = update.callback_query
+    await flow_state.asave(q.from_user.id, "choose_type", {"level": level})
+    await q.edit_message_text("Choose resource type", reply_markup=materials_type_markup())
 
-    if code == "announcements":
-        data = load_announcements()
-        if not data:
-            await q.edit_message_text("No announcements yet.", reply_markup=InlineKeyboardMarkup([]))
-        else:
-            from announcements import format_announcements_pretty
-            text = format_announcements_pretty(10)
-            await q.edit_message_text(text, parse_mode="Markdown", reply_markup=InlineKeyboardMarkup([]))
-        await context.bot.send_message(
-            chat_id=q.message.chat_id,
-            text="Choose an option:",
-            reply_markup=persistent_menu(),
-        )
-        return
+@callbacks.exact("materials_slides")
+async def _cb_materials_slides(update, context):
+    q = update.callback_query
+    level = (await flow_state.aload(q.from_user.id)).data.get("level")
+    await flow_state.asave(q.from_user.id, "search_slides", {"level": level})
+    await q.edit_message_text("Type the course name or code to find slides. Use /cancel to return.")
 
-        # ---------- internship alerts ----------
-    if code == "internship_alerts":
-        from internship_alerts import last_n
-        alerts = last_n(5)
-        if not alerts:
-            text = "No internship or sponsorship alerts yet."
-        else:
-            text = "💼 *Latest Internship & Sponsorship Alerts*\n\n" + "\n\n".join(
-                    f"• {a}" for a in alerts
-                )
-            kb = [[InlineKeyboardButton("Back ◀️", callback_data="announcements")]]
-            await q.edit_message_text(text, parse_mode="Markdown", reply_markup=InlineKeyboardMarkup(kb))
-            return
-    if code == "toolkit":
-        await q.edit_message_text("Toolkit", reply_markup=toolkit_menu_markup())
-        return
+@callbacks.exact("materials_pastq")
+async def _cb_materials_pastq(update, context):
+    q = update.callback_query
+    await flow_state.asave(q.from_user.id, "search_pastq")
+    await q.edit_message_text("Type the course name or code to find past questions. Use /cancel to return.")
 
-            # ---------- skill flow ----------
+@callbacks.exact("announcements")
+async def _cb_announcements(update, context):
+    q = update.callback_query
+    data = await arun(load_announcements)
+    if not data:
+        await q.edit_message_text("No announcements yet.", reply_markup=InlineKeyboardMarkup([]))
+    else:
+        from announcements import format_announcements_pretty
+        text = await arun(format_announcements_pretty, 10)
+        await q.edit_message_text(text, parse_mode="Markdown", reply_markup=InlineKeyboardMarkup([]))
+    await context.bot.send_message(
+        chat_id=q.message.chat_id,
+        text="Choose an option:",
+        reply_markup=persistent_menu(),
+    )
 
-    if code == "toolkit_skill":
-        skills = list_skills()
-        kb = [[InlineKeyboardButton(s.title(), callback_data=f"skillpick_{s}")] for s in skills]
-        kb.append([InlineKeyboardButton("Back ◀️", callback_data="toolkit")])
-        await q.edit_message_text("Choose a skill to learn:", reply_markup=InlineKeyboardMarkup(kb))
+# ---------- internship alerts ----------
+@callbacks.exact("internship_alerts")
+async def _cb_internship_alerts(update, context):
+    q = update.callback_query
+    from internship_alerts import last_n
+    alerts = await arun(last_n, 5)
+    if not alerts:
+        text = "No internship or sponsorship alerts yet."
+    else:
+        text = "💼 *Latest Internship & Sponsorship Alerts*\n\n" + "\n\n".join(
+                f"• {a}" for a in alerts
+            )
+    kb = [[InlineKeyboardButton("Back ◀️", callback_data="announcements")]]
+    await q.edit_message_text(text, parse_mode="Markdown", reply_markup=InlineKeyboardMarkup(kb))
+
+@callbacks.exact("toolkit")
+async def _cb_toolkit(update, context):
+    await update.callback_query.edit_message_text("Toolkit", reply_markup=toolkit_menu_markup())
+
+# ---------- skill flow ----------
+@callbacks.exact("toolkit_skill")
+async def _cb_toolkit_skill(update, context):
+    skills = list_skills()
+    kb = [[InlineKeyboardButton(s.title(), callback_data=f"skillpick_{s}")] for s in skills]
+    kb.append([InlineKeyboardButton("Back ◀️", callback_data="toolkit")])
+    await update.callback_query.edit_message_text("Choose a skill to learn:", reply_markup=InlineKeyboardMarkup(kb))
+
+@callbacks.prefix("skillpick_", str)
+async def _cb_skill_pick(update, context, skill):
+    q = update.callback_query
+    lessons = get_lessons(skill)
+    if not lessons:
+        await q.edit_message_text("No lessons found for this skill.")
         return
+    prog = (await arun(get_progress, q.from_user.id)).get(skill, {}).get("last", -1)
+    kb = []
+    for idx, les in enumerate(lessons):
+        label = f"Lesson {idx+1}"
+        if idx <= prog:
+            label += " ✅"
+        kb.append([InlineKeyboardButton(label, callback_data=f"skilllesson_{skill}_{idx}")])
+    if prog >= 0 and prog < len(lessons)-1:
+        kb.append([InlineKeyboardButton("▶️ Continue", callback_data=f"skilllesson_{skill}_{prog+1}")])
+        kb.append([InlineKeyboardButton("ℹ️ About this skill", callback_data=f"skillabout_{skill}")])
+    await q.edit_message_text(f"{skill.title()} – pick a lesson:", reply_markup=InlineKeyboardMarkup(kb))
 
-    if code.startswith("skillpick_"):
-        skill = code.split("_", 1)[1]
-        lessons = get_lessons(skill)
-        if not lessons:
-            await q.edit_message_text("No lessons found for this skill.")
-            return
-        uid = q.from_user.id
-        prog = get_progress(uid).get(skill, {}).get("last", -1)
-        kb = []
-        for idx, les in enumerate(lessons):
-            label = f"Lesson {idx+1}"
-            if idx <= prog:
-                label += " ✅"
-            kb.append([InlineKeyboardButton(label, callback_data=f"skilllesson_{skill}_{idx}")])
-        if prog >= 0 and prog < len(lessons)-1:
-            kb.append([InlineKeyboardButton("▶️ Continue", callback_data=f"skilllesson_{skill}_{prog+1}")])
-            kb.append([InlineKeyboardButton("ℹ️ About this skill", callback_data=f"skillabout_{skill}")])
-        await q.edit_message_text(f"{skill.title()} – pick a lesson:", reply_markup=InlineKeyboardMarkup(kb))
+@callbacks.prefix("skillabout_", str)
+async def _cb_skill_about(update, context, skill):
+    q = update.callback_query
+    logger.info("Fetching intro for skill %s", skill)
+    caption, thumb = fetch_skill_intro(skill)
+    logger.info("fetch_skill_intro returned caption=%s thumb=%s", caption, thumb)
+    if not caption and not thumb:
+        await q.answer("No intro available for this skill.")
         return
-
-    if code.startswith("skillabout_"):
-        skill = code.split("_", 1)[1]
-        logger.info("Fetching intro for skill %s", skill)
-        caption, thumb = fetch_skill_intro(skill)
-        logger.info("fetch_skill_intro returned caption=%s thumb=%s", caption, thumb)
-        if not caption and not thumb:
-            await q.answer("No intro available for this skill.")
-            return
     #send photo with caption.
-        if thumb:
-            await context.bot.send_photo(chat_id=q.message.chat_id,photo=open(thumb,"rb"),caption=caption,parse_mode="Markdown")
-            try:
-                os.remove(thumb)
-            except Exception:
-                pass
-        else:
-            await context.bot.send_message(chat_id=q.message.chat_id,text=caption,parse_mode="Markdown")
-        return
+    if thumb:
+        await context.bot.send_photo(chat_id=q.message.chat_id,photo=open(thumb,"rb"),caption=caption,parse_mode="Markdown")
+        try:
+            os.remove(thumb)
+        except Exception:
+            pass
+    else:
+        await context.bot.send_message(chat_id=q.message.chat_id,text=caption,parse_mode="Markdown")
 
-    if code.startswith("skilllesson_"):
-        _, skill, idx_str = code.split("_", 2)
-        idx = int(idx_str)
-        lessons = get_lessons(skill)
-        if idx >= len(lessons):
-            await q.answer("Lesson not found")
-            return
-        lesson = lessons[idx]
-        # send file
-        await q.answer("Opening lesson…")
-        from skill_engine import get_skill_intro
-        caption, thumb = get_skill_intro(skill)
-        await send_drive_file(
-            lesson["id"],
-            lesson["name"],
-            context.bot,
-            q.message.chat_id,
-            caption=caption,
-            thumb_path=thumb
-        )
-# optional clean-up
-        if thumb and os.path.exists(thumb):
-            try:
-                os.remove(thumb)
-            except Exception:
-                pass
-        # ask to mark done
+@callbacks.prefix("skilllesson_", str, int)
+async def _cb_skill_lesson(update, context, skill, idx):
+    q = update.callback_query
+    lessons = get_lessons(skill)
+    if idx >= len(lessons):
+        await q.answer("Lesson not found")
+        return
+    lesson = lessons[idx]
+    # send file
+    await q.answer("Opening lesson…")
+    from skill_engine import get_skill_intro
+    caption, thumb = get_skill_intro(skill)
+    await send_drive_file(
+        lesson["id"],
+        lesson["name"],
+        context.bot,
+        q.message.chat_id,
+        caption=caption,
+        thumb_path=thumb
+    )
+    # optional clean-up
+    if thumb and os.path.exists(thumb):
+        try:
+            os.remove(thumb)
+        except Exception:
+            pass
+    # ask to mark done
+    kb = InlineKeyboardMarkup([
+        [InlineKeyboardButton("✅ Mark Done", callback_data=f"skilldone_{skill}_{idx}")],
+        [InlineKeyboardButton("Back", callback_data=f"skillpick_{skill}")]
+    ])
+    await context.bot.send_message(
+        chat_id=q.message.chat_id,
+        text=f"Lesson {idx+1} of *{skill.title()}* sent.\nTap **Mark Done** when finished.",
+        parse_mode="Markdown",
+        reply_markup=kb
+    )
+
+@callbacks.prefix("skilldone_", str, int)
+async def _cb_skill_done(update, context, skill, idx):
+    q = update.callback_query
+    await arun(set_progress, q.from_user.id, skill, idx)
+    # micro-reward
+    rewards = ["🎉 Great job!", "💪 Keep going!", "🚀 Progress saved!", "🏅 Lesson complete!"]
+    await q.answer(random.choice(rewards), show_alert=True)
+    # quiz?
+    quiz = get_quiz(skill, idx)
+    if quiz:
         kb = InlineKeyboardMarkup([
-            [InlineKeyboardButton("✅ Mark Done", callback_data=f"skilldone_{skill}_{idx}")],
-            [InlineKeyboardButton("Back", callback_data=f"skillpick_{skill}")]
+            [InlineKeyboardButton(opt, callback_data=f"skillquiz_{skill}_{idx}_{i}")]
+            for i, opt in enumerate(quiz["o"])
         ])
         await context.bot.send_message(
             chat_id=q.message.chat_id,
-            text=f"Lesson {idx+1} of *{skill.title()}* sent.\nTap **Mark Done** when finished.",
-            parse_mode="Markdown",
+            text=f"Quick check:\n{quiz['q']}",
             reply_markup=kb
         )
-        return
+    else:
+        # back to skill menu
+        await _cb_skill_pick(update, context, skill)
 
-    if code.startswith("skilldone_"):
-        _, skill, idx_str = code.split("_", 2)
-        idx = int(idx_str)
-        uid = q.from_user.id
-        set_progress(uid, skill, idx)
-        # micro-reward
-        rewards = ["🎉 Great job!", "💪 Keep going!", "🚀 Progress saved!", "🏅 Lesson complete!"]
-        await q.answer(random.choice(rewards), show_alert=True)
-        # quiz?
-        quiz = get_quiz(skill, idx)
-        if quiz:
-            kb = InlineKeyboardMarkup([
-                [InlineKeyboardButton(opt, callback_data=f"skillquiz_{skill}_{idx}_{i}")]
-                for i, opt in enumerate(quiz["o"])
-            ])
-            await context.bot.send_message(
-                chat_id=q.message.chat_id,
-                text=f"Quick check:\n{quiz['q']}",
-                reply_markup=kb
-            )
-        else:
-            # back to skill menu
-            await callback_router(Update(
-                update_id=0,
-                callback_query=type("CQ", (), {"data": f"skillpick_{skill}", "from_user": q.from_user, "message": q.message})
-            ), context)
+@callbacks.prefix("skillquiz_", str, int, int)
+async def _cb_skill_quiz(update, context, skill, idx, choice):
+    q = update.callback_query
+    quiz = get_quiz(skill, idx)
+    if not quiz:
+        await q.answer("No quiz found")
         return
+    correct = quiz["a"]
+    if choice == correct:
+        await q.answer("✅ Correct!", show_alert=True)
+    else:
+        await q.answer(f"❌ Correct answer: {quiz['o'][correct]}", show_alert=True)
+    # back to skill menu
+    await _cb_skill_pick(update, context, skill)
 
-    if code.startswith("skillquiz_"):
-        _, skill, idx_str, choice_str = code.split("_", 3)
-        idx = int(idx_str)
-        choice = int(choice_str)
-        quiz = get_quiz(skill, idx)
-        if not quiz:
-            await q.answer("No quiz found")
-            return
-        correct = quiz["a"]
-        if choice == correct:
-            await q.answer("✅ Correct!", show_alert=True)
-        else:
-            await q.answer(f"❌ Correct answer: {quiz['o'][correct]}", show_alert=True)
-        # back to skill menu
-        await callback_router(Update(
-            update_id=0,
-            callback_query=type("CQ", (), {"data": f"skillpick_{skill}", "from_user": q.from_user, "message": q.message})
-        ), context)
-        return
+@callbacks.prefix("sendfile_", str)
+async def _cb_send_file(update, context, file_id):
+    q = update.callback_query
+    filename = file_id
+    try:
+        for row in q.message.reply_markup.inline_keyboard:
+            for btn in row:
+                if btn.callback_data == q.data:
+                    filename = btn.text.split(" (")[0][2:]
+                    break
+    except Exception:
+        pass
+    await q.answer("Sending file …")
+    try:
+        await send_drive_file(file_id, filename, context.bot, q.message.chat_id)
+    except Exception as e:
+        logger.error(e)
+        await q.edit_message_text("File too large or unavailable.")
 
-    if code.startswith("sendfile_"):
-        file_id = code.replace("sendfile_", "")
-        filename = file_id
-        try:
-            for row in q.message.reply_markup.inline_keyboard:
-                for btn in row:
-                    if btn.callback_data == code:
-                        filename = btn.text.split(" (")[0][2:]
-                        break
-        except Exception:
-            pass
-        await q.answer("Sending file …")
-        try:
-            await send_drive_file(file_id, filename, context.bot, q.message.chat_id)
-        except Exception as e:
-            logger.error(e)
-            await q.edit_message_text("File too large or unavailable.")
-        return
+@callbacks.exact("toolkit_gpa")
+async def _cb_toolkit_gpa(update, context):
+    await update.callback_query.edit_message_text(
+        "Choose GPA type:", reply_markup=gpa_type_markup()
+    )
+
+@callbacks.exact("gpa_semester", "gpa_cumulative")
+async def _cb_gpa_type(update, context):
+    q = update.callback_query
+    await flow_state.asave(q.from_user.id, "gpa", {"type": q.data.split("_")[1]})
+    guide = (
+        "Send your results in this format (one per line):\n"
+        "`Course, Grade/Mark, Credits`\n"
+        "Examples:\n"
+        "Chemistry, 85, 3\n"
+        "Math, B, 4\n"
+        "Physics, 72, 2\n\n"
+        "You can type or upload a file (.txt/.csv/.docx/.pdf)"
+    )
+    await q.edit_message_text(guide, parse_mode="Markdown")
+
+# ---------- formulas ----------
+@callbacks.exact("toolkit_formulas")
+async def _cb_toolkit_formulas(update, context):
+    from formula_reference import category_buttons
+    await update.callback_query.edit_message_text(
+        "Pick a category to view formulas:",
+        reply_markup=category_buttons()
+    )
 
-    if code == "toolkit_gpa":
+async def _show_formula(q, cat: str, idx: int):
+    from formula_reference import get_formulas, formula_detail_buttons
+    formulas = get_formulas(cat)
+    if not formulas and idx == 0:
         await q.edit_message_text(
-            "Choose GPA type:", reply_markup=gpa_type_markup()
+            "No formulas in this category yet.",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("Back ◀️", callback_data="toolkit_formulas")]
+            ])
         )
         return
-
-    if code in ("gpa_semester", "gpa_cumulative"):
-        USER_STATE[uid] = f"gpa_{code.split('_')[1]}"
-        guide = (
-            "Send your results in this format (one per line):\n"
-            "`Course, Grade/Mark, Credits`\n"
-            "Examples:\n"
-            "Chemistry, 85, 3\n"
-            "Math, B, 4\n"
-            "Physics, 72, 2\n\n"
-            "You can type or upload a file (.txt/.csv/.docx/.pdf)"
-        )
-        await q.edit_message_text(guide, parse_mode="Markdown")
+    if idx < 0 or idx >= len(formulas):
+        await q.answer("Out of range")
         return
+    f = formulas[idx]
+    text = f"*{cat}* – {idx+1}/{len(formulas)}\n\n" \
+           f"*{f['name']}*\n`{f['expression']}`"
+    if f["explanation"]:
+        text += f"\n\n_{f['explanation']}_"
+    await q.edit_message_text(
+        text,
+        parse_mode="Markdown",
+        reply_markup=formula_detail_buttons(cat, idx)
+    )
 
-            # ---------- formulas ----------
-    if code == "toolkit_formulas":
-            from formula_reference import category_buttons
-            await q.edit_message_text(
-                "Pick a category to view formulas:",
-                reply_markup=category_buttons()
-            )
-            return
-
-    if code.startswith("formcat_"):
-            cat = code[8:]
-            from formula_reference import format_formula_list, get_formulas, formula_detail_buttons
-            formulas = get_formulas(cat)
-            if not formulas:
-                await q.edit_message_text(
-                    "No formulas in this category yet.",
-                    reply_markup=InlineKeyboardMarkup([
-                        [InlineKeyboardButton("Back ◀️", callback_data="toolkit_formulas")]
-                    ])
-                )
-                return
-            # Show first formula
-            f = formulas[0]
-            text = f"*{cat}* – 1/{len(formulas)}\n\n" \
-                   f"*{f['name']}*\n`{f['expression']}`"
-            if f["explanation"]:
-                text += f"\n\n_{f['explanation']}_"
-            await q.edit_message_text(
-                text,
-                parse_mode="Markdown",
-                reply_markup=formula_detail_buttons(cat, 0)
-            )
-            return
+@callbacks.prefix("formcat_", str)
+async def _cb_formula_category(update, context, cat):
+    await _show_formula(update.callback_query, cat, 0)
 
-    if code.startswith("formnav_"):
-            _, cat, idx_str = code.split("_", 2)
-            idx = int(idx_str)
-            from formula_reference import get_formulas, formula_detail_buttons
-            formulas = get_formulas(cat)
-            if idx < 0 or idx >= len(formulas):
-                await q.answer("Out of range")
-                return
-            f = formulas[idx]
-            text = f"*{cat}* – {idx+1}/{len(formulas)}\n\n" \
-                   f"*{f['name']}*\n`{f['expression']}`"
-            if f["explanation"]:
-                text += f"\n\n_{f['explanation']}_"
-            await q.edit_message_text(
-                text,
-                parse_mode="Markdown",
-                reply_markup=formula_detail_buttons(cat, idx)
-            )
-            return
-    if code == "show_calendar":
-        calendar_id = "YOUR_CALENDAR_IMAGE_FILE_ID_FROM_DRIVE"  # or upload to Drive and get ID
-        try:
-            await context.bot.send_photo(
-                chat_id=q.message.chat_id,
-                photo=calendar_id,
-                caption="📅 *KNUST Academic Calendar*",
-                parse_mode="Markdown"
-           )
-        except Exception:
-            await q.answer("Calendar not available", show_alert=True)
-        return
-
-    if code == "toolkit_timetable":
-        set_state(uid,"await_courses")
-        await q.edit_message_text(
-            "Send your courses in this format:\n"
-            "`Course Code, Credits`\n"
-            "Example:\n"
-            "ME 461, 3\n"
-            "AE 301, 2"
-            "\n\nYou can type or upload a file (.txt/.csv/.docx/.pdf)",
-        )
-        return
+@callbacks.prefix("formnav_", str, int)
+async def _cb_formula_nav(update, context, cat, idx):
+    await _show_formula(update.callback_query, cat, idx)
 
-    if code.startswith("fact_"):
-        fact = code.split("_", 1)[1]
-        await q.answer("Processing your request...")
-        await q.edit_message_text(
-            f"✈️ *Daily Flight Log*\n\n{fact}\n\n*Want to know more?*",
-            parse_mode="Markdown",
-            reply_markup=None
-        )
-        await q.message.reply_text(
-            "🔍 *Looking through slides…*  _This’ll take a sec._",
+@callbacks.exact("show_calendar")
+async def _cb_show_calendar(update, context):
+    q = update.callback_query
+    calendar_id = "YOUR_CALENDAR_IMAGE_FILE_ID_FROM_DRIVE"  # or upload to Drive and get ID
+    try:
+        await context.bot.send_photo(
+            chat_id=q.message.chat_id,
+            photo=calendar_id,
+            caption="📅 *KNUST Academic Calendar*",
             parse_mode="Markdown"
-        )
-        try:
-            answer = await ai_chat_response(fact)
-            await q.message.reply_text(answer, parse_mode="Markdown")
-        except Exception as e:
-            logger.exception("AI response failed")
-            await q.message.reply_text("❌ I couldn’t generate an answer. Try a shorter question or upload slides.")
-
-#---------- AAES Hub ----------
-    if code == "hub":
-        await q.edit_message_text("AAES Hub", reply_markup=hub_menu_markup())
-        return
+       )
+    except Exception:
+        await q.answer("Calendar not available", show_alert=True)
 
-    if code == "hub_about":
-        await send_about_aaes(update, context)
-        return
+@callbacks.exact("toolkit_timetable")
+async def _cb_toolkit_timetable(update, context):
+    q = update.callback_query
+    await flow_state.asave(q.from_user.id, "await_courses")
+    await q.edit_message_text(
+        "Send your courses in this format:\n"
+        "`Course Code, Credits`\n"
+        "Example:\n"
+        "ME 461, 3\n"
+        "AE 301, 2"
+        "\n\nYou can type or upload a file (.txt/.csv/.docx/.pdf)",
+    )
 
-    if code == "hub_execs":
-        # Send the inline keyboard with executive buttons
-        await q.edit_message_text("Meet the Execs", reply_markup=create_executive_buttons())
-        return
+@callbacks.prefix("fact_", str)
+async def _cb_fact(update, context, fact):
+    q = update.callback_query
+    await q.answer("Processing your request...")
+    await q.edit_message_text(
+        f"✈️ *Daily Flight Log*\n\n{fact}\n\n*Want to know more?*",
+        parse_mode="Markdown",
+        reply_markup=None
+    )
+    await q.message.reply_text(
+        "🔍 *Looking through slides…*  _This’ll take a sec._",
+        parse_mode="Markdown"
+    )
+    try:
+        answer = await ai_chat_response(fact, use_cache=True)
+        await q.message.reply_text(answer, parse_mode="Markdown")
+    except Exception as e:
+        logger.exception("AI response failed")
+        await q.message.reply_text("❌ I couldn’t generate an answer. Try a shorter question or upload slides.")
 
-    if code.startswith("exec_info:"):
-        await send_executive_info(update, context)
-        return
+#---------- AAES Hub ----------
+@callbacks.exact("hub")
+async def _cb_hub(update, context):
+    await update.callback_query.edit_message_text("AAES Hub", reply_markup=hub_menu_markup())
 
+callbacks.exact("hub_about")(send_about_aaes)
+callbacks.prefix("exec_info:")(send_executive_info)
 
-    if code == "hub_activity":
-        acts = get_user_activity(uid)
-        if not acts:
-            await q.edit_message_text("You have no recent activity.", reply_markup=hub_menu_markup())
-        else:
-            out = "Recent activity:\n" + "\n".join(f"- {a}" for a in acts)
-            await q.edit_message_text(out, reply_markup=hub_menu_markup())
-        return
+@callbacks.exact("hub_execs")
+async def _cb_hub_execs(update, context):
+    # Send the inline keyboard with executive buttons
+    await update.callback_query.edit_message_text("Meet the Execs", reply_markup=create_executive_buttons())
 
+@callbacks.exact("hub_activity")
+async def _cb_hub_activity(update, context):
+    q = update.callback_query
+    acts = await arun(get_user_activity, q.from_user.id)
+    if not acts:
+        await q.edit_message_text("You have no recent activity.", reply_markup=hub_menu_markup())
+    else:
+        out = "Recent activity:\n" + "\n".join(f"- {a}" for a in acts)
+        await q.edit_message_text(out, reply_markup=hub_menu_markup())
 
-    if code == "helpdesk":
-        set_state(uid,"helpdesk")
-        await q.edit_message_text("Describe your issue. Use /cancel to return to menu.")
-        return
+@callbacks.exact("helpdesk")
+async def _cb_helpdesk(update, context):
+    q = update.callback_query
+    await flow_state.asave(q.from_user.id, "helpdesk")
+    await q.edit_message_text("Describe your issue. Use /cancel to return to menu.")
+
+# ---------- admin panel ----------
+ADMIN_PROMPTS = {
+    "admin_announce":   "Type the announcement text. /cancel to abort.",
+    "admin_internship": "Type the internship/sponsorship text. /cancel to abort.",
+    "admin_fact":       "Type the new Daily Flight Log fact. /cancel to abort.",
+    "admin_add":        "Send the Telegram user ID to promote. /cancel to abort.",
+    "admin_remove":     "Send the Telegram user ID to demote. /cancel to abort.",
+}
+
+@callbacks.exact(*ADMIN_PROMPTS)
+async def _cb_admin_prompt(update, context):
+    q = update.callback_query
+    await flow_state.asave(q.from_user.id, q.data)
+    await q.edit_message_text(ADMIN_PROMPTS[q.data])
 
-        # ---------- admin panel ----------
-    if code == "admin_announce":
-        USER_STATE[uid] = "admin_announce"
-        await q.edit_message_text("Type the announcement text. /cancel to abort.")
-        return
+@callbacks.exact("admin_toggle_exam")
+async def _cb_admin_toggle_exam(update, context):
+    q = update.callback_query
+    from exam_mode import exam_mode_active, activate_exam_mode, deactivate_exam_mode, exam_countdown
+    if await arun(exam_mode_active):
+        await arun(deactivate_exam_mode)
+        text = "📘 Exam Mode is now **OFF**."
+        await q.edit_message_text(text, reply_markup=admin_panel_markup())
+    else:
+        await flow_state.asave(q.from_user.id, "await_exam_date")
+        await q.edit_message_text(
+            "📅 Send the exam date in format `YYYY-MM-DD` (e.g., 2025-05-10)\n/cancel to abort.",
+        parse_mode="Markdown"
+        )
 
-    if code == "admin_internship":
-        USER_STATE[uid] = "admin_internship"
-        await q.edit_message_text("Type the internship/sponsorship text. /cancel to abort.")
-        return
+@callbacks.exact("admin_subs")
+async def _cb_admin_subs(update, context):
+    from notify import list_subscribers
+    n = len(await arun(list_subscribers))
+    await update.callback_query.edit_message_text(f"📊 {n} users are subscribed.", reply_markup=admin_panel_markup())
 
-    if code == "admin_fact":
-        USER_STATE[uid] ="admin_fact"
-        await q.edit_message_text("Type the new Daily Flight Log fact. /cancel to abort.")
-        return
+@callbacks.exact("admin_tickets")
+async def _cb_admin_tickets(update, context):
+    from helpdesk import format_tickets_with_buttons
+    text, markup = await arun(format_tickets_with_buttons, limit=10)
+    await update.callback_query.edit_message_text(text, reply_markup=markup)
 
-    if code == "admin_add":
-        USER_STATE[uid] ="admin_add"
-        await q.edit_message_text("Send the Telegram user ID to promote. /cancel to abort.")
-        return
+@callbacks.prefix("resolve_ticket_", int)
+async def _cb_resolve_ticket(update, context, idx):
+    q = update.callback_query
+    from helpdesk import resolve_ticket
+    ticket = await arun(resolve_ticket, idx)
+    if ticket:
+        await q.answer(f"Ticket #{idx} marked resolved ✅", show_alert=True)
+        # Re-show the list
+        from helpdesk import format_tickets_with_buttons
+        text, markup = await arun(format_tickets_with_buttons, limit=10)
+        await q.edit_message_text(text, reply_markup=markup)
+    else:
+        await q.answer("Ticket not found ❌", show_alert=True)
 
-    if code == "admin_toggle_exam":
-        from exam_mode import exam_mode_active, activate_exam_mode, deactivate_exam_mode, exam_countdown
-        if exam_mode_active():
-            deactivate_exam_mode()
-            text = "📘 Exam Mode is now **OFF**."
-            await q.edit_message_text(text, reply_markup=admin_panel_markup())
-        else:
-            USER_STATE[uid] = "await_exam_date"
-            await q.edit_message_text(
-                "📅 Send the exam date in format `YYYY-MM-DD` (e.g., 2025-05-10)\n/cancel to abort.",
-            parse_mode="Markdown"
-            )
-        return
+# ---------- text / document handlers ----------
+# Text sent while a user is in a flow goes to that flow's handler in
+# `flows`; see flow_state.py. Handlers get (update, context, data) and
+# return STAY, goto(state, data), or None to end the flow.
+flows = StateRouter()
 
-    if code == "admin_remove":
-        USER_STATE[uid] ="admin_remove"
-        await q.edit_message_text("Send the Telegram user ID to demote. /cancel to abort.")
-        return
+def _file_buttons(files):
+    kb = []
+    for f in files[:15]:
+        size_mb = round(int(f.get("size", 0)) / 1024 / 1024, 1)
+        kb.append([
+            InlineKeyboardButton(f"📄 {f['name']} ({size_mb} MB)", callback_data=f"sendfile_{f['id']}")
+        ])
+    return InlineKeyboardMarkup(kb)
 
-    if code == "admin_subs":
-        from notify import list_subscribers
-        n = len(list_subscribers())
-        await q.edit_message_text(f"📊 {n} users are subscribed.", reply_markup=admin_panel_markup())
-        return
+def _find_files(query: str, mode: str, level):
+    # catalog (SQLite) lookups, or Drive API calls until the catalog is built
+    folder_id = _find_folder_id(query)
+    return _files_in_folder(folder_id) if folder_id else search_drive(query, mode=mode, level=level)
 
-    if code == "admin_tickets":
-        from helpdesk import format_tickets_with_buttons
-        text, markup = format_tickets_with_buttons(limit=10)
-        await q.edit_message_text(text, reply_markup=markup)
+async def _reply_with_files(update: Update, query: str, mode: str, level):
+    files = await arun(_find_files, query, mode, level)
+    if not files:
+        await update.message.reply_text("No matching folder or files found.", reply_markup=persistent_menu())
         return
+    await update.message.reply_text(f"Found {len(files)} file(s):", reply_markup=_file_buttons(files))
 
-    if code.startswith("resolve_ticket_"):
-        idx = int(code.split("_")[-1])
-        from helpdesk import resolve_ticket
-        ticket = resolve_ticket(idx)
-        if ticket:
-            await q.answer(f"Ticket #{idx} marked resolved ✅", show_alert=True)
-            # Re-show the list
-            from helpdesk import format_tickets_with_buttons
-            text, markup = format_tickets_with_buttons(limit=10)
-            await q.edit_message_text(text, reply_markup=markup)
-        else:
-            await q.answer("Ticket not found ❌", show_alert=True)
-        return
+def _track_message(uid: int, text: str):
+    log_activity(uid, f"sent: {text}")
+    update_streak(uid)
 
-# ---------- text / document handlers ----------
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = (update.message.text or "").strip()
     uid = update.effective_user.id
-    name = update.effective_user.full_name
 
     try:
-        log_activity(uid, f"sent: {text}")
-        update_streak(uid)
+        await arun(_track_message, uid, text)
     except Exception:
         logger.debug("Activity log failed")
 
     if await route_persistent_text(update, context):
         return
 
-    if text.lower() == "/cancel":
-        USER_STATE.pop(uid, None)
-        await update.message.reply_text("Cancelled", reply_markup=persistent_menu())
+    if text == "GPA Calculator 📊":
+        await update.message.reply_text("How many courses did you take? (send a number)")
+        await flow_state.asave(uid, "gpa_steps")
         return
 
-    if text.lower().startswith("/search "):
-        term = text.split(" ", 1)[1].strip()
-        folder_id = _find_folder_id(term)
-        files = _files_in_folder(folder_id) if folder_id else search_drive(term, mode="all", level=None)
-        if not files:
-            await update.message.reply_text("No matching folder or files found.", reply_markup=persistent_menu())
-            return
-        kb = []
-        for f in files[:15]:
-            size_mb = round(int(f.get("size", 0)) / 1024 / 1024, 1)
-            kb.append([
-                InlineKeyboardButton(f"📄 {f['name']} ({size_mb} MB)", callback_data=f"sendfile_{f['id']}")
-            ])
-        await update.message.reply_text(f"Found {len(files)} file(s):", reply_markup=InlineKeyboardMarkup(kb))
+    if await flows.dispatch(update, context, uid):
         return
 
-    if text == "GPA Calculator 📊" or USER_STATE.get(uid) == "toolkit_gpa":
-        set_state(uid,"toolkit_gpa")
-        await gpa_flow(update, context)
-        return
+    # Send daily quiz if exam mode is active
+    from exam_mode import should_send_quiz_today, get_daily_quiz, mark_quiz_sent
+    if await arun(exam_mode_active) and await arun(should_send_quiz_today):
+        quiz = await arun(get_daily_quiz)
+        await arun(mark_quiz_sent)    # before the job starts, so the next message doesn't queue a second one
+        start_broadcast(
+            context.bot,
+            f"📘 *Daily Exam Quiz*\n\n{quiz}\n\nReply with your answer!",
+            parse_mode="Markdown",
+            label="Daily exam quiz",
+            key=f"exam_quiz:{datetime.now().date()}"
+        )
 
-    if USER_STATE.get(uid) == "helpdesk":
-        add_ticket(uid, name, text)
-        USER_STATE.pop(uid, None)
-        await update.message.reply_text("Thanks. Your issue is logged. Execs will follow up.", reply_markup=persistent_menu())
-        return
+async def cancel_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    uid = update.effective_user.id
+    await flow_state.aclear(uid)
+    await update.message.reply_text("Cancelled", reply_markup=persistent_menu(is_admin(uid)))
 
-    state = get_state(uid).get("state")
-    if state in ("search_slides", "search_pastq", "global_search"):
-        level = None
-        mode = "all"
-        if state == "search_slides":
-            mode = "slides"
-            for k in ("level_100", "level_200", "level_300", "level_400"):
-                if USER_STATE.get(uid) == k:
-                    level = k.split("_")[1]
-                    break
-        elif state == "search_pastq":
-            mode = "pastq"
+async def search_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    term = " ".join(context.args).strip()
+    if not term:
+        await update.message.reply_text("Usage: /search <course or keyword>")
+        return
+    await _reply_with_files(update, term, "all", None)
 
-        query = text.strip()
-        folder_id = _find_folder_id(query)
-        files = _files_in_folder(folder_id) if folder_id else search_drive(query, mode=mode, level=level)
-        USER_STATE.pop(uid, None)
+def _search_flow(mode: str):
+    # the user stays in search mode until they pick something else
+    async def run(update, context, data):
+        await _reply_with_files(update, update.message.text.strip(), mode, data.get("level"))
+        return STAY
+    return run
 
-        if not files:
-            await update.message.reply_text("No matching folder or files found.", reply_markup=persistent_menu())
-            return
+flows.on("search_slides")(_search_flow("slides"))
+flows.on("search_pastq")(_search_flow("pastq"))
+flows.on("global_search")(_search_flow("all"))
 
-        kb = []
-        for f in files[:15]:
-            size_mb = round(int(f.get("size", 0)) / 1024 / 1024, 1)
-            kb.append([
-                InlineKeyboardButton(f"📄 {f['name']} ({size_mb} MB)", callback_data=f"sendfile_{f['id']}")
-            ])
-        await update.message.reply_text(f"Found {len(files)} file(s):", reply_markup=InlineKeyboardMarkup(kb))
-        return
+@flows.on("helpdesk")
+async def _flow_helpdesk(update, context, data):
+    user = update.effective_user
+    await arun(add_ticket, user.id, user.full_name, update.message.text.strip())
+    await update.message.reply_text("Thanks. Your issue is logged. Execs will follow up.", reply_markup=persistent_menu())
 
-    if USER_STATE.get(uid) == "await_courses":
-        try:
-            courses = []
-            for line in text.splitlines():
-                code, cred = line.split(",")
-                courses.append({"code": code.strip(), "credits": int(cred.strip())})
-            from timetable_generator import generate_timetable
-            timetable = generate_timetable(courses)
-            await update.message.reply_text(timetable, parse_mode="Markdown")
-        except Exception:
-            await update.message.reply_text("❌ Invalid format. Use: `Course, Credits`")
-        USER_STATE.pop(uid, None)
-        return
+@flows.on("await_courses")
+async def _flow_timetable(update, context, data):
+    try:
+        courses = []
+        for line in update.message.text.strip().splitlines():
+            code, cred = line.split(",")
+            courses.append({"code": code.strip(), "credits": int(cred.strip())})
+        from timetable_generator import generate_timetable
+        timetable = generate_timetable(courses)
+        await update.message.reply_text(timetable, parse_mode="Markdown")
+    except Exception:
+        await update.message.reply_text("❌ Invalid format. Use: `Course, Credits`")
 
-    # admin panel text inputs
-    admin_state = USER_STATE.get(uid)
-    if admin_state and admin_state.startswith("admin_"):
-        if not is_admin(uid):
-            await update.message.reply_text("❌ Not authorized.")
-            USER_STATE.pop(uid, None)
-            return
+@flows.on("ask")
+async def _flow_ask(update, context, data):
+    uid = update.effective_user.id
+    question = update.message.text.strip()
+    await add_turn(uid, "user", question)
+    thinking = await update.message.reply_text("🔍 *Thinking…*", parse_mode="Markdown")
+    try:
+        streamer = MessageStreamer(thinking)
+        answer = await ask_ai(uid, question, on_partial=streamer.update)
+        await add_turn(uid, "assistant", answer)
+        pretty = prettify_answer(answer)
+        await streamer.finish(pretty, parse_mode="Markdown", disable_web_page_preview=True)
+    except Exception as e:
+        logger.exception("AI response failed")
+        await update.message.reply_text("❌ I couldn’t generate an answer. Try a shorter question or upload slides.")
+    return STAY
 
-        text_in = update.message.text.strip()
-        if text_in.lower() == "/cancel":
-            USER_STATE.pop(uid, None)
-            await update.message.reply_text("Cancelled.", reply_markup=persistent_menu(is_admin(uid)))
-            return
+# ---------- GPA ----------
+async def _reply_gpa(update: Update, gpa_type: str, lines):
+    gpa, qp, creds = calculate_gpa(lines)
+    await update.message.reply_text(
+        f"✅ *{gpa_type.capitalize()} GPA*: **{gpa}**\n"
+        f"Total Quality Points: {qp}\n"
+        f"Total Credits: {creds}",
+        parse_mode="Markdown",
+        reply_markup=persistent_menu(),
+    )
 
-        if USER_STATE.get(uid) == "admin_announce":
-            text = update.message.text.strip()
-            if not text:
-                await update.message.reply_text("Usage: /announce <message>")
-                return
-            add_announcement(text)
-            subs = list_subscribers()
-            count = 0
-            for s in subs:
-                try:
-                    await context.bot.send_message(chat_id=int(s), text=f"📢 {text}")
-                    count += 1
-                except Exception:
-                    pass
-            await update.message.reply_text(f"Posted and sent to {count} subscribers.")
-            USER_STATE.pop(uid, None)
-            return
+@flows.on("gpa")
+async def _flow_gpa(update, context, data):
+    gpa_type = data.get("type", "semester")     # semester | cumulative
+    try:
+        await _reply_gpa(update, gpa_type, update.message.text.strip().splitlines())
+    except ValueError as e:
+        await update.message.reply_text(f"❌ Error: {e}")
 
-        if USER_STATE.get(uid) == "admin_internship":
-            text = update.message.text.strip()
-            if not text:
-                await update.message.reply_text("Usage: /postinternship <text>")
-                return
-            from internship_alerts import add_alert
-            add_alert(text, update.effective_user.id)
-            subs = list_subscribers()
-            count = 0
-            for s in subs:
-                try:
-                    await context.bot.send_message(
-                        chat_id=int(s),
-                        text=f"💼 *Internship / Sponsorship Alert*\n\n{text}",
-                        parse_mode="Markdown"
-                    )
-                    count += 1
-                except Exception:
-                    pass
-            await update.message.reply_text(f"✅ Alert posted and broadcast.")
-            USER_STATE.pop(uid, None)
-            return
+@flows.on("gpa_steps")
+async def _flow_gpa_steps(update, context, data):
+    text = update.message.text.strip()
 
-        if USER_STATE.get(uid) == "admin_fact":
-            text = update.message.text.strip()
-            if not text:
-                await update.message.reply_text("Usage: /addfact <fact>")
-                return
-            from daily_flight_log import add_fact
-            add_fact(text)
-            await update.message.reply_text("✅ Fact added to pool.")
-            USER_STATE.pop(uid, None)
-            return
+    if "n" not in data:
+        try:
+            data["n"] = int(text)
+            data["courses"] = []
+            await update.message.reply_text("Send grade and credit for course 1 in the format:\nA 3")
+            return goto("gpa_steps", data)
+        except ValueError:
+            await update.message.reply_text("Please send a valid number.")
+            return STAY
 
-        if USER_STATE.get(uid) == "admin_add":
-            try:
-                new_id = int(update.message.text.strip())
-                from admin import add_admin
-                if add_admin(new_id):
-                    await update.message.reply_text(f"✅ Added admin `{new_id}`")
-                else:
-                    await update.message.reply_text("ℹ️ Already an admin.")
-            except ValueError:
-                await update.message.reply_text("❌ Send a numeric user ID.")
-            USER_STATE.pop(uid, None)
-            return
+    try:
+        grade, credit = text.upper().split()
+        data["courses"].append([grade, int(credit)])
+    except Exception:
+        await update.message.reply_text("Use format: A 3")
+        return STAY
+    if len(data["courses"]) < data["n"]:
+        await update.message.reply_text(f"Send grade and credit for course {len(data['courses'])+1}:")
+        return goto("gpa_steps", data)
+    grade_map = {"A": 4, "B": 3, "C": 2, "D": 1, "F": 0}
+    total_points = sum(grade_map.get(g, 0) * c for g, c in data["courses"])
+    total_credits = sum(c for _, c in data["courses"])
+    gpa = total_points / total_credits if total_credits else 0
+    await update.message.reply_text(f"Your GPA is **{gpa:.2f}**", parse_mode="Markdown", reply_markup=persistent_menu())
+
+# ---------- exam mode ----------
+@flows.on("await_exam_date")
+async def _flow_exam_date(update, context, data):
+    uid = update.effective_user.id
+    date_str = update.message.text.strip()
+    try:
+        datetime.fromisoformat(date_str)  # validate format
+    except ValueError:
+        await update.message.reply_text("❌ Invalid date. Use format `YYYY-MM-DD`.")
+        return STAY
+    from exam_mode import activate_exam_mode
+    await arun(activate_exam_mode, date_str)
+    await update.message.reply_text(
+        f"✅ Exam Mode activated!\n📅 Countdown started for **{date_str}**.",
+        reply_markup=persistent_menu(is_admin(uid))
+    )
 
-        if USER_STATE.get(uid) == "admin_remove":
-            try:
-                rem_id = int(update.message.text.strip())
-                from admin import remove_admin
-                if remove_admin(rem_id):
-                    await update.message.reply_text(f"✅ Removed admin `{rem_id}`")
-                else:
-                    await update.message.reply_text("ℹ️ Not an admin.")
-            except ValueError:
-                    await update.message.reply_text("❌ Send a numeric user ID.")
-            USER_STATE.pop(uid, None)
-            return
+# ---------- admin panel text inputs ----------
+def _admin_flow(usage: str = ""):
+    """Wrap an admin input handler: re-check the admin, insist on non-empty text."""
+    def wrap(handler):
+        async def run(update, context, data):
+            uid = update.effective_user.id
+            if not is_admin(uid):
+                await update.message.reply_text("❌ Not authorized.")
+                return None
+            text = update.message.text.strip()
+            if usage and not text:
+                await update.message.reply_text(usage)
+                return STAY
+            return await handler(update, context, text)
+        return run
+    return wrap
+
+@flows.on("admin_announce")
+@_admin_flow("Usage: /announce <message>")
+async def _flow_admin_announce(update, context, text):
+    uid = update.effective_user.id
+    await arun(add_announcement, text)
+    start_broadcast(context.bot, f"📢 {text}", label="Announcement", report_chat_id=uid)
+    await update.message.reply_text("Posted. Sending to subscribers in the background…")
 
-    if USER_STATE.get(uid, "").startswith("gpa_"):
-        gpa_type = USER_STATE[uid].split("_")[1]  # semester | cumulative
-        lines = text.splitlines()
-        try:
-            gpa, qp, creds = calculate_gpa(lines)
-            await update.message.reply_text(
-                f"✅ *{gpa_type.capitalize()} GPA*: **{gpa}**\n"
-                f"Total Quality Points: {qp}\n"
-                f"Total Credits: {creds}",
-                parse_mode="Markdown",
-                reply_markup=persistent_menu(),
-            )
-        except ValueError as e:
-            await update.message.reply_text(f"❌ Error: {e}")
-        USER_STATE.pop(uid, None)
-        return
+@flows.on("admin_internship")
+@_admin_flow("Usage: /postinternship <text>")
+async def _flow_admin_internship(update, context, text):
+    uid = update.effective_user.id
+    from internship_alerts import add_alert
+    await arun(add_alert, text, uid)
+    start_broadcast(
+        context.bot,
+        f"💼 *Internship / Sponsorship Alert*\n\n{text}",
+        parse_mode="Markdown",
+        label="Internship alert",
+        report_chat_id=uid
+    )
+    await update.message.reply_text("✅ Alert posted. Broadcasting in the background…")
 
-    # ---------- exam mode ----------
-    if USER_STATE.get(uid) == "await_exam_date":
-        try:
-            from datetime import datetime
-            date_str = text.strip()
-            datetime.fromisoformat(date_str)  # validate format
-            from exam_mode import activate_exam_mode
-            activate_exam_mode(date_str)
-            USER_STATE.pop(uid, None)
-            await update.message.reply_text(
-                f"✅ Exam Mode activated!\n📅 Countdown started for **{date_str}**.",
-                reply_markup=persistent_menu(is_admin(uid))
-            )
-        except ValueError:
-            await update.message.reply_text("❌ Invalid date. Use format `YYYY-MM-DD`.")
-        return
+@flows.on("admin_fact")
+@_admin_flow("Usage: /addfact <fact>")
+async def _flow_admin_fact(update, context, text):
+    from daily_flight_log import add_fact
+    add_fact(text)
+    await update.message.reply_text("✅ Fact added to pool.")
 
-    # ---------- AI chat ----------
-        # ---------- AI chat ----------
-       # ---------- AI chat ----------
-    state = get_state(uid).get("state")
-    if state == "ask":
-        add_turn(uid, "user", text)
-        await update.message.reply_text("🔍 *Thinking…*", parse_mode="Markdown")
-        try:
-            answer = await ai_chat_response(build_prompt(uid))
-            add_turn(uid, "assistant", answer)
-            pretty = prettify_answer(answer)
-            await update.message.reply_text(pretty, parse_mode="Markdown", disable_web_page_preview=True)
-        except Exception as e:
-            logger.exception("AI response failed")
-            await update.message.reply_text("❌ I couldn’t generate an answer. Try a shorter question or upload slides.")
-        return
+@flows.on("admin_add")
+@_admin_flow()
+async def _flow_admin_add(update, context, text):
+    try:
+        new_id = int(text)
+        from admin import add_admin
+        if add_admin(new_id):
+            await update.message.reply_text(f"✅ Added admin `{new_id}`")
+        else:
+            await update.message.reply_text("ℹ️ Already an admin.")
+    except ValueError:
+        await update.message.reply_text("❌ Send a numeric user ID.")
 
-    # Send daily quiz if exam mode is active
-    if exam_mode_active() and should_send_quiz_today():
-        quiz = get_daily_quiz()
-        for uid in list_subscribers():
-            try:
-                await app.bot.send_message(
-                    int(uid),
-                    f"📘 *Daily Exam Quiz*\n\n{quiz}\n\nReply with your answer!",
-                    parse_mode="Markdown"
-                )
-            except Exception as e:
-                logger.warning("Daily quiz failed for %s: %s", uid, e)
-        mark_quiz_sent()
+@flows.on("admin_remove")
+@_admin_flow()
+async def _flow_admin_remove(update, context, text):
+    try:
+        rem_id = int(text)
+        from admin import remove_admin
+        if remove_admin(rem_id):
+            await update.message.reply_text(f"✅ Removed admin `{rem_id}`")
+        else:
+            await update.message.reply_text("ℹ️ Not an admin.")
+    except ValueError:
+        await update.message.reply_text("❌ Send a numeric user ID.")
 
 
 async def handle_docs(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1148,14 +1087,26 @@ async def handle_docs(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("File too large. Send a file below 15 MB.")
         return
 
+    state = await flow_state.aload(uid)
+    if state.name == "gpa":
+        text = await handle_upload(doc, update)
+        if not text:
+            return
+        try:
+            await _reply_gpa(update, state.data.get("type", "semester"), text.splitlines())
+        except Exception as e:
+            await update.message.reply_text(f"❌ Could not parse file: {e}")
+        await flow_state.aclear(uid)
+        return
+
     try:
-        log_activity(uid, f"uploaded {doc.file_name}")
-        await handle_upload(doc, update)
-        file_content = await read_file_content(doc.file_path)
+        await arun(log_activity, uid, f"uploaded {doc.file_name}")
+        file_content = await handle_upload(doc, update)
+        if not file_content:
+            return
 
-        # grab the last user message (if any)
-        history = CONVERSATION.get(uid, [])
-        last_question = next((m["text"] for m in reversed(history) if m["role"] == "user"), None)
+        # the question they just asked, if it was in this session
+        last_question = await arun(conversation_store.last_user_text, uid, max_age=conversation_store.SESSION_SECONDS)
 
         if not last_question:
             await update.message.reply_text(
@@ -1163,14 +1114,15 @@ async def handle_docs(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
 
-        add_turn(uid, "user", last_question, file_content)   # store file with question
-        await update.message.reply_text("📄 *Reading file…*", parse_mode="Markdown")
+        await add_turn(uid, "user", last_question, file_content)   # store file with question
+        reading = await update.message.reply_text("📄 *Reading file…*", parse_mode="Markdown")
 
         try:
-            answer = await ai_chat_response(build_prompt(uid))
-            add_turn(uid, "assistant", answer)
+            streamer = MessageStreamer(reading)
+            answer = await ai_chat_response(await arun(build_prompt, uid), on_partial=streamer.update)
+            await add_turn(uid, "assistant", answer)
             pretty = prettify_answer(answer)
-            await update.message.reply_text(pretty, parse_mode="Markdown")
+            await streamer.finish(pretty, parse_mode="Markdown")
         except Exception as e:
             logger.exception("File AI failed")
             await update.message.reply_text("❌ I couldn’t generate an answer. Try a shorter question or upload slides.")
@@ -1178,26 +1130,6 @@ async def handle_docs(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Error handling document: {e}")
         await update.message.reply_text("Failed to process the file.")
 
-
-
-    if USER_STATE.get(uid, "").startswith("gpa_"):
-        gpa_type = USER_STATE[uid].split("_")[1]
-        try:
-            text = read_file
-            lines = text.splitlines()
-            gpa, qp, creds = calculate_gpa(lines)
-            await update.message.reply_text(
-                f"✅ *{gpa_type.capitalize()} GPA*: **{gpa}**\n"
-                f"Total Quality Points: {qp}\n"
-                f"Total Credits: {creds}",
-                parse_mode="Markdown",
-                reply_markup=persistent_menu(),
-            )
-        except Exception as e:
-            await update.message.reply_text(f"❌ Could not parse file: {e}")
-        USER_STATE.pop(uid, None)
-        return
-
 # ---------- commands ----------
 async def announce_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
@@ -1209,25 +1141,18 @@ async def announce_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not text:
         await update.message.reply_text("Usage: /announce <message>")
         return
-    add_announcement(text)
-    subs = list_subscribers()
-    count = 0
-    for s in subs:
-        try:
-            await context.bot.send_message(chat_id=int(s), text=f"AAES Announcement\n\n{text}")
-            count += 1
-        except Exception:
-            pass
-    await update.message.reply_text(f"Posted and sent to {count} subscribers.")
+    await arun(add_announcement, text)
+    start_broadcast(context.bot, f"AAES Announcement\n\n{text}", label="Announcement", report_chat_id=uid)
+    await update.message.reply_text("Posted. Sending to subscribers in the background…")
 
 async def join_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
-    subscribe(uid)
+    await arun(subscribe, uid)
     await update.message.reply_text("You will receive AAES announcements. Use /leave to stop.")
 
 async def leave_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
-    unsubscribe(uid)
+    await arun(unsubscribe, uid)
     await update.message.reply_text("You will not receive announcements.")
 
 async def execs_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1235,7 +1160,7 @@ async def execs_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def profile_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
-    p = get_profile(uid)
+    p = await arun(get_profile, uid)
     if not p:
         await update.message.reply_text("No profile found. Use /setprofile name|program|level")
         return
@@ -1252,9 +1177,9 @@ async def setprofile_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Provide name, program and level separated by |")
         return
     uid = update.effective_user.id
-    update_profile(uid, "name", payload[0].strip())
-    update_profile(uid, "program", payload[1].strip())
-    update_profile(uid, "level", payload[2].strip())
+    await arun(update_profile, uid, "name", payload[0].strip())
+    await arun(update_profile, uid, "program", payload[1].strip())
+    await arun(update_profile, uid, "level", payload[2].strip())
     await update.message.reply_text("Profile updated.")
 # bot.py
 async def postinternship_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
@@ -1266,66 +1191,21 @@ async def postinternship_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Usage: `/postinternship <text>`")
         return
     from internship_alerts import add_alert
-    add_alert(text, update.effective_user.id)
+    await arun(add_alert, text, update.effective_user.id)
     # broadcast
-    from notify import list_subscribers
-    for uid in list_subscribers():
-        try:
-            await ctx.bot.send_message(
-                int(uid),
-                f"💼 *Internship / Sponsorship Alert*\n\n{text}",
-                parse_mode="Markdown"
-            )
-        except Exception:
-            pass
-    await update.message.reply_text("✅ Alert posted and broadcast.")
-
-
-# ---------- GPA flow ----------
-GPA_STATE = {}   # uid -> {"step": 1..n, "courses": []}
-
-async def gpa_flow(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    uid = update.effective_user.id
-    text = update.message.text.strip()
-
-    if uid not in GPA_STATE:
-        GPA_STATE[uid] = {"step": 1, "courses": []}
-        await update.message.reply_text("How many courses did you take? (send a number)")
-        return
-
-    state = GPA_STATE[uid]
-
-    if state["step"] == 1:
-        try:
-            n = int(text)
-            state["n"] = n
-            state["step"] = 2
-            await update.message.reply_text("Send grade and credit for course 1 in the format:\nA 3")
-        except ValueError:
-            await update.message.reply_text("Please send a valid number.")
-        return
+    start_broadcast(
+        ctx.bot,
+        f"💼 *Internship / Sponsorship Alert*\n\n{text}",
+        parse_mode="Markdown",
+        label="Internship alert",
+        report_chat_id=update.effective_user.id
+    )
+    await update.message.reply_text("✅ Alert posted. Broadcasting in the background…")
 
-    if state["step"] == 2:
-        try:
-            grade, credit = text.upper().split()
-            credit = int(credit)
-            state["courses"].append((grade, credit))
-            if len(state["courses"]) == state["n"]:
-                grade_map = {"A": 4, "B": 3, "C": 2, "D": 1, "F": 0}
-                total_points = sum(grade_map.get(g, 0) * c for g, c in state["courses"])
-                total_credits = sum(c for _, c in state["courses"])
-                gpa = total_points / total_credits if total_credits else 0
-                await update.message.reply_text(f"Your GPA is **{gpa:.2f}**", parse_mode="Markdown", reply_markup=persistent_menu())
-                del GPA_STATE[uid]
-            else:
-                await update.message.reply_text(f"Send grade and credit for course {len(state['courses'])+1}:")
-        except Exception:
-            await update.message.reply_text("Use format: A 3")
-        return
 
 async def continue_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
-    prog = get_progress(uid)
+    prog = await arun(get_progress, uid)
     if not prog:
         await update.message.reply_text("You haven't started any skill yet.")
         return
@@ -1361,7 +1241,7 @@ async def addquiz_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     from exam_mode import add_quiz
-    add_quiz(question)
+    await arun(add_quiz, question)
     await update.message.reply_text("✅ Quiz question added to pool.")
 
 # bot.py
@@ -1382,7 +1262,33 @@ async def tickets_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Not authorized.")
         return
     from helpdesk import format_tickets
-    await update.message.reply_text(format_tickets(limit=10))
+    await update.message.reply_text(await arun(format_tickets, limit=10))
+
+async def cachestats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("❌ Not authorized.")
+        return
+    import answer_cache
+    s = answer_cache.stats()
+    await update.message.reply_text(
+        f"🧠 AI answer cache\n"
+        f"Entries: {s['size']}\n"
+        f"Hits: {s['hits']} exact, {s['near_hits']} near\n"
+        f"Misses: {s['misses']}\n"
+        f"Hit rate: {s['hit_rate']:.0%}"
+    )
+
+async def routestats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("❌ Not authorized.")
+        return
+    rows = callbacks.stats()[:15]
+    if not rows:
+        await update.message.reply_text("No button taps recorded yet.")
+        return
+    lines = [f"{r['route']}: {r['calls']}× avg {r['avg_ms']} ms, max {r['max_ms']} ms"
+             + (f", {r['errors']} errors" if r["errors"] else "") for r in rows]
+    await update.message.reply_text("⏱ Button routes\n\n" + "\n".join(lines))
 
     # ---------- scheduler integration ----------
 
@@ -1390,6 +1296,7 @@ async def tickets_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from daily_flight_log import get_daily_fact, should_send_fact, mark_fact_sent
 from notify import list_subscribers
+from datetime import datetime
 
 # Create scheduler instance
 scheduler = AsyncIOScheduler()
@@ -1405,31 +1312,34 @@ async def send_daily_flight_log(app):
 
     fact = get_daily_fact()
     logger.info(f"Fact to be sent: {fact}")
-    subscribers = list_subscribers()
-    logger.info(f"Sending daily flight log to {len(subscribers)} subscribers")
-
-    for uid in subscribers:
-        try:
-            # Encode the fact text in callback_data
-            encoded_fact = encode_fact(fact)
-            keyboard = [
-                [InlineKeyboardButton("Want to know more?", callback_data=f"fact_more")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await app.bot.send_message(
-                int(uid),
-                fact,
-                parse_mode="Markdown",
-                reply_markup=reply_markup
-            )
-            logger.ingo(f"Sent daily flight log to {uid}")
-        except Exception as e:
-            logger.warning(f"Failed to send daily fact to {uid}: {e}")
+    keyboard = [
+        [InlineKeyboardButton("Want to know more?", callback_data=f"fact_more")]
+    ]
+    await run_broadcast(
+        app.bot,
+        fact,
+        parse_mode="Markdown",
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        label="Daily flight log",
+        key=f"flight_log:{datetime.now().date()}",
+        on_done="mark_fact_sent"
+    )
 
-    mark_fact_sent()
+# ---------- drive catalog ----------
+async def refresh_drive_catalog():
+    try:
+        await asyncio.to_thread(drive_catalog.refresh_catalog)
+    except Exception as e:
+        logger.warning("Drive catalog refresh failed: %s", e)
 
 async def post_init(application):
     """Initialize scheduler after bot is ready."""
+    init_db()
+    write_behind.start()
+    broadcast.register_hook("mark_fact_sent", mark_fact_sent)
+    resumed = await broadcast.resume_broadcasts(application.bot)
+    if resumed:
+        logger.info("Resumed %d unfinished broadcasts", resumed)
     scheduler.add_job(
         send_daily_flight_log,
         'cron',
@@ -1437,6 +1347,13 @@ async def post_init(application):
         minute=0,
         args=[application]
     )
+    # first run builds the catalog in the background, later runs apply the Changes feed
+    scheduler.add_job(
+        refresh_drive_catalog,
+        'interval',
+        minutes=drive_catalog.REFRESH_MINUTES,
+        next_run_time=datetime.now()
+    )
     scheduler.start()
     logger.info("Scheduler started - Daily Flight Log will send at 08:00")
 
@@ -1487,12 +1404,31 @@ executives = [
 ]
 
 # ---------- app builder ----------
+from telegram.ext import SimpleUpdateProcessor
+
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "256"))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))
+
+class CountingUpdateProcessor(SimpleUpdateProcessor):
+    """Runs updates concurrently like concurrent_updates(True), and counts the finished ones."""
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self.finished = 0
+
+    async def process_update(self, update, coroutine):
+        try:
+            await super().process_update(update, coroutine)
+        finally:
+            self.finished += 1
+
 def build_app():
     app = (
         ApplicationBuilder()
         .token(TOKEN)
         .post_init(post_init)
-        .concurrent_updates(True)
+        .concurrent_updates(CountingUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .update_queue(asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE))
         .build()
     )
 
@@ -1514,8 +1450,12 @@ def build_app():
     app.add_handler(CommandHandler("addfact", addfact_cmd))
     app.add_handler(CommandHandler("postinternship", postinternship_cmd))
     app.add_handler(CommandHandler("tickets", tickets_cmd))
+    app.add_handler(CommandHandler("cachestats", cachestats_cmd))
+    app.add_handler(CommandHandler("routestats", routestats_cmd))
     app.add_handler(CommandHandler("ping", ping_me))
     app.add_handler(CommandHandler("reset", reset_cmd))
+    app.add_handler(CommandHandler("cancel", cancel_cmd))
+    app.add_handler(CommandHandler("search", search_cmd))
     from voice_handler import handle_voice
     app.add_handler(MessageHandler(filters.VOICE | filters.AUDIO, handle_voice))
     async def error_handler(update, context):
@@ -1535,13 +1475,6 @@ def build_app():
     app.add_error_handler(error_handler)
 
     return app
-app_flask = Flask(__name__)
-
-@app_flask.route("/wake")
-def wake():
-    # send /ping to yourself via the bot
-    bot.send_message(chat_id=1836471542, text="/ping")
-    return "ok", 200
 
 def run():
     app = build_app()
@@ -0,0 +1,293 @@
+# broadcast.py  –  send one message to many subscribers in the background
+#
+# start_broadcast() returns immediately; the job runs as an asyncio task.
+# All broadcasts share one rate limiter kept under Telegram's ~30 msg/s
+# global bot limit, and at most CONCURRENCY sends are in flight. RetryAfter
+# pauses every sender for the requested time, users who blocked the bot are
+# unsubscribed, and the admin who started the job gets a progress message
+# that is edited as the job runs and ends with delivered / failed counts.
+#
+# Jobs are durable: the message and every recipient's status live in
+# broadcast_jobs / broadcast_recipients, so a job cut off by a redeploy is
+# picked up again by resume_broadcasts() at start-up. A recipient is marked
+# "sending" before the message goes out, and a resumed job only sends to
+# recipients still "pending" – nobody gets the same broadcast twice, at the
+# cost of possibly missing the few whose send was in flight at the crash.
+# Each job has a key (by default label + day + text hash); starting a job
+# whose key already exists does nothing.
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from datetime import date
+from typing import Iterable, Optional, Callable
+
+from telegram import InlineKeyboardMarkup
+from telegram.error import Forbidden, BadRequest, RetryAfter, TimedOut, NetworkError
+
+from notify import list_subscribers, unsubscribe
+from state_db import transaction, fetchall, aexecute
+
+logger = logging.getLogger("aaes-bot")
+
+RATE = float(os.getenv("BROADCAST_RATE", "25"))          # messages per second, all jobs together
+CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+MAX_ATTEMPTS = 3
+PROGRESS_INTERVAL = 5.0                                   # seconds between progress edits
+KEEP_DAYS = 30                                            # finished jobs kept this long for de-duplication
+
+_tasks = set()          # keep references so running jobs are not garbage-collected
+_running = set()        # job ids with a live task in this process
+_hooks = {}             # name -> callable run when a job finishes (must survive restarts, so by name)
+
+
+def register_hook(name: str, fn: Callable):
+    """Make `fn` available as on_done=name for jobs, including resumed ones."""
+    _hooks[name] = fn
+
+
+# ----------------------------------------------------
+# Global pacing
+# ----------------------------------------------------
+class _RateLimiter:
+    """Spaces sends 1/RATE seconds apart; pause() holds everyone back after a RetryAfter."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = None
+
+    async def wait(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float):
+        now = asyncio.get_running_loop().time()
+        self._next = max(self._next, now + seconds)
+
+_limiter = _RateLimiter(RATE)
+
+
+# ----------------------------------------------------
+# One recipient
+# ----------------------------------------------------
+async def _send_one(bot, chat_id: int, text: str, kwargs: dict) -> str:
+    """Returns "sent", "removed" or "failed"."""
+    for attempt in range(MAX_ATTEMPTS):
+        await _limiter.wait()
+        try:
+            await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+            return "sent"
+        except RetryAfter as e:
+            _limiter.pause(e.retry_after)
+            await asyncio.sleep(e.retry_after)
+        except Forbidden:
+            # blocked the bot or deactivated the account
+            await asyncio.to_thread(unsubscribe, chat_id)
+            return "removed"
+        except BadRequest as e:
+            if "chat not found" in str(e).lower():
+                await asyncio.to_thread(unsubscribe, chat_id)
+                return "removed"
+            logger.warning("Broadcast to %s rejected: %s", chat_id, e)
+            return "failed"
+        except (TimedOut, NetworkError) as e:
+            logger.info("Broadcast to %s attempt %d failed: %s", chat_id, attempt + 1, e)
+            await asyncio.sleep(2 ** attempt)
+        except Exception as e:
+            logger.warning("Broadcast to %s failed: %s", chat_id, e)
+            return "failed"
+    return "failed"
+
+
+# ----------------------------------------------------
+# Persistence
+# ----------------------------------------------------
+def _pack_options(kwargs: dict) -> str:
+    options = dict(kwargs)
+    markup = options.get("reply_markup")
+    if markup is not None:
+        options["reply_markup"] = markup.to_dict()
+    return json.dumps(options)
+
+def _unpack_options(raw: str) -> dict:
+    options = json.loads(raw)
+    if options.get("reply_markup"):
+        options["reply_markup"] = InlineKeyboardMarkup.de_json(options["reply_markup"], None)
+    return options
+
+def default_key(label: str, text: str) -> str:
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+    return f"{label}:{date.today()}:{digest}"
+
+def _create_job(key, label, text, options, report_chat_id, on_done, recipients) -> Optional[int]:
+    """Insert the job and its recipients in one transaction; None if the key exists."""
+    with transaction() as conn:
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO broadcast_jobs"
+            "(key, label, text, options, report_chat_id, on_done, created) VALUES (?,?,?,?,?,?,?)",
+            (key, label, text, options, report_chat_id, on_done, int(time.time()))
+        )
+        if not cur.rowcount:
+            return None
+        job_id = cur.lastrowid
+        conn.executemany(
+            "INSERT OR IGNORE INTO broadcast_recipients(job_id, user_id) VALUES (?,?)",
+            [(job_id, int(r)) for r in recipients]
+        )
+    return job_id
+
+def _load_job(job_id: int) -> dict:
+    with transaction() as conn:
+        label, text, options, report_chat_id, on_done = conn.execute(
+            "SELECT label, text, options, report_chat_id, on_done FROM broadcast_jobs WHERE id=?",
+            (job_id,)
+        ).fetchone()
+        rows = conn.execute(
+            "SELECT user_id, status FROM broadcast_recipients WHERE job_id=?", (job_id,)
+        ).fetchall()
+    return {"label": label, "text": text, "options": _unpack_options(options),
+            "report_chat_id": report_chat_id, "on_done": on_done, "recipients": rows}
+
+def _finish_job(job_id: int):
+    """Mark the job done and drop its recipient rows; the job row stays for de-duplication."""
+    with transaction() as conn:
+        conn.execute("UPDATE broadcast_jobs SET status='done' WHERE id=?", (job_id,))
+        conn.execute("DELETE FROM broadcast_recipients WHERE job_id=?", (job_id,))
+        conn.execute(
+            "DELETE FROM broadcast_jobs WHERE status='done' AND created < ?",
+            (int(time.time()) - KEEP_DAYS * 86400,)
+        )
+
+async def _mark(job_id: int, chat_id: int, status: str):
+    await aexecute(
+        "UPDATE broadcast_recipients SET status=? WHERE job_id=? AND user_id=?",
+        (status, job_id, chat_id)
+    )
+
+
+# ----------------------------------------------------
+# Whole job
+# ----------------------------------------------------
+async def _report(bot, chat_id, message, text):
+    try:
+        if message is None:
+            return await bot.send_message(chat_id=chat_id, text=text)
+        await message.edit_text(text)
+        return message
+    except Exception as e:
+        logger.debug("Broadcast progress update skipped: %s", e)
+        return message
+
+async def _run_job(bot, job_id: int) -> dict:
+    """Send a stored job to its pending recipients, recording each outcome."""
+    job = await asyncio.to_thread(_load_job, job_id)
+    label, text, report_chat_id = job["label"], job["text"], job["report_chat_id"]
+    counts = {"sent": 0, "failed": 0, "removed": 0}
+    targets = []
+    for chat_id, status in job["recipients"]:
+        if status == "pending":
+            targets.append(chat_id)
+        elif status == "sending":       # in flight when the process died; not resent
+            counts["failed"] += 1
+        else:
+            counts[status] += 1
+    total = len(job["recipients"])
+    logger.info("%s: sending to %d of %d recipients", label, len(targets), total)
+
+    progress = None
+    if report_chat_id:
+        progress = await _report(bot, report_chat_id, None, f"📤 {label}: sending to {total} subscribers…")
+
+    slots = asyncio.Semaphore(CONCURRENCY)
+
+    async def worker(chat_id):
+        async with slots:
+            await _mark(job_id, chat_id, "sending")
+            result = await _send_one(bot, chat_id, text, job["options"])
+            await _mark(job_id, chat_id, result)
+            counts[result] += 1
+
+    jobs = asyncio.gather(*(worker(c) for c in targets))
+    while report_chat_id and not jobs.done():
+        await asyncio.wait([jobs], timeout=PROGRESS_INTERVAL)
+        if not jobs.done():
+            done = sum(counts.values())
+            progress = await _report(bot, report_chat_id, progress, f"📤 {label}: {done}/{total} processed…")
+    await jobs
+
+    logger.info("%s finished: %d delivered, %d failed, %d unsubscribed",
+                label, counts["sent"], counts["failed"], counts["removed"])
+    if report_chat_id:
+        await _report(
+            bot, report_chat_id, progress,
+            f"✅ {label} finished\n"
+            f"Delivered: {counts['sent']}/{total}\n"
+            f"Failed: {counts['failed']}\n"
+            f"Removed (blocked the bot): {counts['removed']}"
+        )
+    await asyncio.to_thread(_finish_job, job_id)
+    hook = _hooks.get(job["on_done"]) if job["on_done"] else None
+    if hook:
+        hook()
+    return counts
+
+async def _run_tracked(bot, job_id: int) -> Optional[dict]:
+    if job_id in _running:
+        return None
+    _running.add(job_id)
+    try:
+        return await _run_job(bot, job_id)
+    finally:
+        _running.discard(job_id)
+
+async def run_broadcast(bot, text: str, *,
+                        recipients: Optional[Iterable] = None,
+                        label: str = "Broadcast",
+                        key: Optional[str] = None,
+                        report_chat_id: Optional[int] = None,
+                        on_done: Optional[str] = None,
+                        **send_kwargs) -> Optional[dict]:
+    """
+    Store and send `text` to every recipient (default: all subscribers).
+    Returns the counts, or None if a job with the same key already exists.
+    on_done names a hook from register_hook().
+    """
+    targets = list(recipients) if recipients is not None else await asyncio.to_thread(list_subscribers)
+    key = key or default_key(label, text)
+    job_id = await asyncio.to_thread(
+        _create_job, key, label, text, _pack_options(send_kwargs), report_chat_id, on_done, targets
+    )
+    if job_id is None:
+        logger.info("%s: job %s already exists, not sending again", label, key)
+        if report_chat_id:
+            await _report(bot, report_chat_id, None, f"ℹ️ {label}: this message was already broadcast.")
+        return None
+    return await _run_tracked(bot, job_id)
+
+def _spawn(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+def start_broadcast(bot, text: str, **kwargs) -> asyncio.Task:
+    """Run run_broadcast() in the background and return its task."""
+    return _spawn(run_broadcast(bot, text, **kwargs))
+
+async def resume_broadcasts(bot) -> int:
+    """Restart every job left unfinished by a previous process; returns how many."""
+    rows = await asyncio.to_thread(fetchall, "SELECT id, label FROM broadcast_jobs WHERE status='running'")
+    for job_id, label in rows:
+        logger.info("Resuming broadcast %d (%s)", job_id, label)
+        _spawn(_run_tracked(bot, job_id))
+    return len(rows)
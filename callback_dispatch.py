@@ -0,0 +1,132 @@
+# callback_dispatch.py  –  routes inline-button callback_data to handlers
+#
+# Handlers register for an exact code ("menu") or a prefix ("skillpick_").
+# Exact codes are a dict lookup; prefixes live in a character trie, so
+# finding the longest matching prefix costs one step per character of the
+# callback data no matter how many routes exist. For prefix routes the rest
+# of the data is split on "_" into the declared payload types, from the
+# right so the leading field may itself contain "_": "formnav_Fluid_Flow_3"
+# with types (str, int) calls handler(update, ctx, "Fluid_Flow", 3).
+# Every route's call count and latency is recorded.
+import os
+import time
+import logging
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger("aaes-bot")
+
+SLOW_MS = float(os.getenv("CALLBACK_SLOW_MS", "2000"))
+
+
+class _Route:
+    __slots__ = ("name", "handler", "types", "calls", "errors", "total", "worst")
+
+    def __init__(self, name: str, handler: Callable, types: Tuple[type, ...]):
+        self.name = name
+        self.handler = handler
+        self.types = types
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.worst = 0.0
+
+
+class CallbackRouter:
+    def __init__(self):
+        self._exact: Dict[str, _Route] = {}
+        self._trie: dict = {}           # char -> subtree; the key None holds a route
+
+    # ---------- registration ----------
+    def exact(self, *codes: str):
+        """Decorator: handler(update, context) for each of the given codes."""
+        def register(handler):
+            for code in codes:
+                self._exact[code] = _Route(code, handler, ())
+            return handler
+        return register
+
+    def prefix(self, prefix: str, *types: type):
+        """Decorator: handler(update, context, *payload) for data starting with prefix."""
+        def register(handler):
+            node = self._trie
+            for ch in prefix:
+                node = node.setdefault(ch, {})
+            node[None] = _Route(prefix + "*", handler, types)
+            return handler
+        return register
+
+    # ---------- lookup ----------
+    def resolve(self, data: str) -> Tuple[Optional[_Route], str]:
+        """(route, rest of data after the prefix) or (None, data)."""
+        route = self._exact.get(data)
+        if route:
+            return route, ""
+        best, cut = None, 0
+        node = self._trie
+        for i, ch in enumerate(data):
+            node = node.get(ch)
+            if node is None:
+                break
+            if None in node:
+                best, cut = node[None], i + 1
+        return best, data[cut:]
+
+    @staticmethod
+    def parse(route: _Route, rest: str) -> tuple:
+        """Split the payload into route.types; the first field keeps any further "_"."""
+        if not route.types:
+            return ()
+        parts = rest.rsplit("_", len(route.types) - 1)
+        if len(parts) != len(route.types):
+            raise ValueError(f"expected {len(route.types)} fields, got {rest!r}")
+        return tuple(t(p) for t, p in zip(route.types, parts))
+
+    # ---------- dispatch ----------
+    async def dispatch(self, update, context, data: str) -> bool:
+        """Run the handler for `data`; False if no route matched or the payload was malformed."""
+        route, rest = self.resolve(data or "")
+        if route is None:
+            logger.debug("No callback route for %r", data)
+            return False
+        try:
+            args = self.parse(route, rest)
+        except ValueError as e:
+            logger.warning("Bad callback payload for %s: %s", route.name, e)
+            return False
+
+        start = time.perf_counter()
+        try:
+            await route.handler(update, context, *args)
+        except Exception:
+            route.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            route.calls += 1
+            route.total += elapsed
+            route.worst = max(route.worst, elapsed)
+            if elapsed * 1000 > SLOW_MS:
+                logger.info("Slow callback %s: %.0f ms", route.name, elapsed * 1000)
+        return True
+
+    def stats(self) -> list:
+        """Per-route [{"route", "calls", "errors", "avg_ms", "max_ms"}], busiest first."""
+        routes = list(self._exact.values()) + list(self._prefix_routes(self._trie))
+        out = [
+            {
+                "route": r.name,
+                "calls": r.calls,
+                "errors": r.errors,
+                "avg_ms": round(r.total / r.calls * 1000, 1),
+                "max_ms": round(r.worst * 1000, 1),
+            }
+            for r in routes if r.calls
+        ]
+        return sorted(out, key=lambda s: s["calls"], reverse=True)
+
+    def _prefix_routes(self, node: dict):
+        for key, child in node.items():
+            if key is None:
+                yield child
+            else:
+                yield from self._prefix_routes(child)
@@ -0,0 +1,148 @@
+# context_builder.py  –  assemble the LLM prompt under a token ceiling
+#
+# The prompt is built newest-first: the current question always goes in,
+# then the uploaded-file chunks that best match it, then as many recent
+# turns as still fit, then a rolling extractive summary of turns that have
+# already left the history buffer. Token counts are estimated (~4 chars per
+# token for Llama-family tokenizers), which is close enough for a budget.
+import os
+import re
+from typing import List, Dict, Optional
+
+import answer_cache
+
+TOKEN_BUDGET = int(os.getenv("AI_CONTEXT_TOKENS", "2000"))
+SUMMARY_TOKENS = int(os.getenv("AI_SUMMARY_TOKENS", "200"))
+FILE_SHARE = 0.5            # at most this share of the budget goes to file excerpts
+CHUNK_CHARS = 800
+CHARS_PER_TOKEN = 4
+
+
+# ----------------------------------------------------
+# Token helpers
+# ----------------------------------------------------
+def count_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def truncate(text: str, tokens: int) -> str:
+    limit = tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    return text[:max(limit - 1, 0)].rstrip() + "…"
+
+
+# ----------------------------------------------------
+# Rolling summary
+# ----------------------------------------------------
+def _gist(text: str, chars: int = 160) -> str:
+    """First sentence of a turn, shortened."""
+    first = re.split(r"(?<=[.!?])\s|\n", text.strip(), maxsplit=1)[0]
+    return truncate(first, chars // CHARS_PER_TOKEN)
+
+def fold_into_summary(summary: str, turn: Dict) -> str:
+    """Add an evicted turn to the summary, dropping the oldest lines past SUMMARY_TOKENS."""
+    who = "Student" if turn["role"] == "user" else "Tutor"
+    lines = [ln for ln in summary.splitlines() if ln]
+    lines.append(f"- {who}: {_gist(turn['text'])}")
+    while len(lines) > 1 and count_tokens("\n".join(lines)) > SUMMARY_TOKENS:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+# ----------------------------------------------------
+# File chunk retrieval
+# ----------------------------------------------------
+def chunk_text(text: str) -> List[str]:
+    """Split text into ~CHUNK_CHARS pieces along line breaks."""
+    out, cur = [], ""
+    for para in re.split(r"\n\s*\n|\n", text):
+        para = para.strip()
+        if not para:
+            continue
+        if cur and len(cur) + len(para) + 1 > CHUNK_CHARS:
+            out.append(cur)
+            cur = ""
+        cur = f"{cur}\n{para}" if cur else para
+        while len(cur) > CHUNK_CHARS:
+            out.append(cur[:CHUNK_CHARS])
+            cur = cur[CHUNK_CHARS:]
+    if cur:
+        out.append(cur)
+    return out
+
+def relevant_chunks(question: str, files: List[str], tokens: int) -> List[str]:
+    """File chunks ranked by overlap with the question, within `tokens`."""
+    q_words = answer_cache.content_words(answer_cache.normalize(question))
+    scored = []
+    for fi, text in enumerate(files):
+        for ci, chunk in enumerate(chunk_text(text)):
+            words = answer_cache.content_words(answer_cache.normalize(chunk))
+            overlap = len(q_words & words)
+            # ties (e.g. a vague question) favour the start of the newest file
+            scored.append((overlap, fi, -ci, chunk))
+    scored.sort(reverse=True)
+    if scored and scored[0][0] > 0:
+        scored = [s for s in scored if s[0] > 0]
+
+    picked, used = [], 0
+    for _, fi, neg_ci, chunk in scored:
+        cost = count_tokens(chunk)
+        if used + cost > tokens:
+            continue
+        picked.append((-fi, -neg_ci, chunk))
+        used += cost
+    return [chunk for _, _, chunk in sorted(picked)]     # back in reading order
+
+
+# ----------------------------------------------------
+# Prompt assembly
+# ----------------------------------------------------
+def _line(turn: Dict) -> str:
+    return f"{turn['role'].capitalize()}: {turn['text']}"
+
+def build_context(turns: List[Dict], summary: str = "", budget: Optional[int] = None) -> str:
+    """
+    turns: oldest-first [{"role", "text", "file"}], the last one being the
+    current question. Returns one prompt string of at most ~`budget` tokens.
+    """
+    if not turns:
+        return ""
+    budget = budget or TOKEN_BUDGET
+    current, history = turns[-1], list(turns[:-1])
+
+    question = truncate(_line(current), budget // 2)
+    left = budget - count_tokens(question)
+
+    files = [t["file"] for t in reversed(turns) if t.get("file")]
+    excerpts = relevant_chunks(current["text"], files, int(left * FILE_SHARE)) if files else []
+    file_block = ""
+    if excerpts:
+        file_block = "Relevant excerpts from the uploaded file:\n" + "\n…\n".join(excerpts)
+        left -= count_tokens(file_block)
+
+    # keep room for the summary of whatever does not fit below
+    reserve = SUMMARY_TOKENS + 10 if (summary or history) else 0
+    left -= reserve
+    recent = []
+    while history:
+        line = _line(history[-1])
+        cost = count_tokens(line) + 1
+        if cost > left:
+            break
+        recent.insert(0, line)
+        left -= cost
+        history.pop()
+    for turn in history:        # did not fit: keep only their gist
+        summary = fold_into_summary(summary, turn)
+    left += reserve
+
+    parts = []
+    if summary:
+        summary_block = "Earlier in this conversation:\n" + summary
+        if count_tokens(summary_block) <= left:
+            parts.append(summary_block)
+    if file_block:
+        parts.append(file_block)
+    parts.extend(recent)
+    parts.append(question)
+    return "\n\n".join(parts)
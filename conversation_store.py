@@ -0,0 +1,168 @@
+# conversation_store.py  –  per-user AI conversation history
+#
+# Turns are written through to the conversation_turns table, so history
+# survives restarts. RAM holds only recently active users: an LRU of compact
+# per-user records, bounded by MAX_USERS and MAX_BYTES. An evicted (or
+# never-loaded) user is read back from SQLite on their next message.
+# Uploaded-file text is stored zlib-compressed and capped at FILE_MAX_CHARS.
+# Each turn carries its time; turns from the last SESSION_SECONDS make up
+# the current session, which decides whether an upload can pick up the
+# last question and whether a question counts as stand-alone.
+import os
+import time
+import zlib
+import threading
+from collections import OrderedDict, deque
+from typing import List, Dict, Optional
+
+import context_builder
+from state_db import transaction, fetchall, fetchone, execute
+
+MAX_HISTORY = 10
+MAX_USERS = int(os.getenv("CONVERSATION_MAX_USERS", "500"))
+MAX_BYTES = int(os.getenv("CONVERSATION_MAX_MB", "32")) * 1024 * 1024
+FILE_MAX_CHARS = 60_000
+SESSION_SECONDS = int(os.getenv("CONVERSATION_SESSION_MIN", "10")) * 60
+
+_lock = threading.Lock()
+_users = OrderedDict()      # uid -> _History, least recently used first
+_bytes = 0
+
+
+class _History:
+    __slots__ = ("turns", "summary", "size")
+
+    def __init__(self, turns, summary: str):
+        self.turns = deque(turns, maxlen=MAX_HISTORY)   # (role, text, zlib(file) | None, ts)
+        self.summary = summary
+        self.size = sum(_turn_size(t) for t in self.turns) + len(summary)
+
+
+def _turn_size(turn) -> int:
+    return len(turn[1]) + (len(turn[2]) if turn[2] else 0) + 64
+
+def _pack_file(file_text: Optional[str]) -> Optional[bytes]:
+    if not file_text:
+        return None
+    return zlib.compress(file_text[:FILE_MAX_CHARS].encode("utf-8"), 6)
+
+def _unpack(turn) -> Dict:
+    role, text, blob, _ = turn
+    return {"role": role, "text": text,
+            "file": zlib.decompress(blob).decode("utf-8") if blob else None}
+
+
+# ----------------------------------------------------
+# Cache management (caller holds _lock)
+# ----------------------------------------------------
+def _load(uid: int) -> _History:
+    hist = _users.get(uid)
+    if hist is not None:
+        _users.move_to_end(uid)
+        return hist
+    rows = fetchall(
+        "SELECT role, text, file, ts FROM conversation_turns WHERE user_id=? ORDER BY id DESC LIMIT ?",
+        (uid, MAX_HISTORY)
+    )
+    row = fetchone("SELECT summary FROM conversation_summary WHERE user_id=?", (uid,))
+    hist = _History([tuple(r) for r in reversed(rows)], row[0] if row else "")
+    _admit(uid, hist)
+    return hist
+
+def _admit(uid: int, hist: _History):
+    global _bytes
+    _users[uid] = hist
+    _bytes += hist.size
+    _trim()
+
+def _trim():
+    # the most recently used user always stays
+    global _bytes
+    while len(_users) > 1 and (len(_users) > MAX_USERS or _bytes > MAX_BYTES):
+        _, old = _users.popitem(last=False)
+        _bytes -= old.size
+
+def _resize(hist: _History, delta: int):
+    global _bytes
+    hist.size += delta
+    _bytes += delta
+
+
+# ----------------------------------------------------
+# Public API
+# ----------------------------------------------------
+def add_turn(uid: int, role: str, text: str, file_text: Optional[str] = None):
+    turn = (role, text, _pack_file(file_text), int(time.time()))
+    with _lock:
+        hist = _load(uid)
+        with transaction() as conn:
+            conn.execute(
+                "INSERT INTO conversation_turns(user_id, role, text, file, ts) VALUES (?,?,?,?,?)",
+                (uid, *turn)
+            )
+            if len(hist.turns) == MAX_HISTORY:
+                evicted = hist.turns[0]
+                summary = context_builder.fold_into_summary(hist.summary, _unpack(evicted))
+                conn.execute(
+                    "INSERT OR REPLACE INTO conversation_summary(user_id, summary) VALUES (?,?)",
+                    (uid, summary)
+                )
+                conn.execute(
+                    "DELETE FROM conversation_turns WHERE user_id=? AND id <= "
+                    "(SELECT id FROM conversation_turns WHERE user_id=? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                    (uid, uid, MAX_HISTORY)
+                )
+                _resize(hist, len(summary) - len(hist.summary) - _turn_size(evicted))
+                hist.summary = summary
+        hist.turns.append(turn)
+        _resize(hist, _turn_size(turn))
+        _users.move_to_end(uid)
+        _trim()
+
+
+def get_turns(uid: int) -> List[Dict]:
+    """Oldest-first [{"role", "text", "file"}]."""
+    with _lock:
+        return [_unpack(t) for t in _load(uid).turns]
+
+
+def get_summary(uid: int) -> str:
+    with _lock:
+        return _load(uid).summary
+
+
+def length(uid: int) -> int:
+    with _lock:
+        return len(_load(uid).turns)
+
+
+def session_length(uid: int) -> int:
+    """Turns from the last SESSION_SECONDS."""
+    since = time.time() - SESSION_SECONDS
+    with _lock:
+        return sum(1 for t in _load(uid).turns if t[3] >= since)
+
+
+def last_user_text(uid: int, max_age: Optional[float] = None) -> Optional[str]:
+    """The user's latest message, or None if there is none newer than max_age seconds."""
+    since = time.time() - max_age if max_age is not None else 0
+    with _lock:
+        for role, text, _, ts in reversed(_load(uid).turns):
+            if role == "user":
+                return text if ts >= since else None
+    return None
+
+
+def clear(uid: int):
+    global _bytes
+    with _lock:
+        hist = _users.pop(uid, None)
+        if hist is not None:
+            _bytes -= hist.size
+        execute("DELETE FROM conversation_turns WHERE user_id=?", (uid,))
+        execute("DELETE FROM conversation_summary WHERE user_id=?", (uid,))
+
+
+def stats() -> dict:
+    with _lock:
+        return {"users_in_memory": len(_users), "bytes_in_memory": _bytes}
@@ -0,0 +1,215 @@
+# drive_catalog.py  –  local copy of the Drive folder/file tree
+#
+# build_catalog() lists every file once; refresh_catalog() then applies only
+# the delta from the Drive Changes API (startPageToken feed). Folder lookups
+# and recursive folder listings are answered from SQLite without any API call.
+import os
+import logging
+import threading
+from pathlib import Path
+from typing import List, Dict, Optional
+from rapidfuzz import process, fuzz
+import drive_gateway
+from state_db import Database
+
+logger = logging.getLogger("aaes-bot")
+
+FOLDER_MIME = "application/vnd.google-apps.folder"
+FUZZY_SCORE_MIN = 60
+REFRESH_MINUTES = int(os.getenv("DRIVE_CATALOG_REFRESH_MINUTES", "10"))
+
+FILE_FIELDS = "id,name,mimeType,parents,size,modifiedTime,md5Checksum,webViewLink,trashed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS drive_items (
+    id            TEXT PRIMARY KEY,
+    name          TEXT NOT NULL,
+    mime_type     TEXT NOT NULL,
+    size          INTEGER NOT NULL DEFAULT 0,
+    modified_time TEXT,
+    md5           TEXT,
+    link          TEXT
+);
+CREATE INDEX IF NOT EXISTS drive_items_mime ON drive_items(mime_type);
+CREATE TABLE IF NOT EXISTS drive_parents (
+    parent_id TEXT NOT NULL,
+    child_id  TEXT NOT NULL,
+    PRIMARY KEY (parent_id, child_id)
+);
+CREATE INDEX IF NOT EXISTS drive_parents_child ON drive_parents(child_id);
+CREATE TABLE IF NOT EXISTS catalog_meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+DB = Database(Path(__file__).with_name("drive_catalog.db"), SCHEMA)
+
+_sync_lock = threading.Lock()
+_folders_lock = threading.Lock()
+_folders = None          # cached [(id, name)] for fuzzy folder lookup
+
+
+# ----------------------------------------------------
+# Meta helpers
+# ----------------------------------------------------
+def _get_meta(key: str) -> Optional[str]:
+    row = DB.fetchone("SELECT value FROM catalog_meta WHERE key=?", (key,))
+    return row[0] if row else None
+
+def _set_meta(conn, key: str, value: str):
+    conn.execute("INSERT OR REPLACE INTO catalog_meta(key, value) VALUES (?,?)", (key, value))
+
+def is_ready() -> bool:
+    """True once a full build has completed."""
+    return _get_meta("start_page_token") is not None
+
+
+# ----------------------------------------------------
+# Writing items
+# ----------------------------------------------------
+def _upsert(conn, f: Dict):
+    conn.execute(
+        "INSERT OR REPLACE INTO drive_items(id, name, mime_type, size, modified_time, md5, link) "
+        "VALUES (?,?,?,?,?,?,?)",
+        (f["id"], f["name"], f["mimeType"], int(f.get("size", 0)), f.get("modifiedTime"),
+         f.get("md5Checksum"), f.get("webViewLink", f"https://drive.google.com/file/d/{f['id']}/view"))
+    )
+    conn.execute("DELETE FROM drive_parents WHERE child_id=?", (f["id"],))
+    conn.executemany(
+        "INSERT OR IGNORE INTO drive_parents(parent_id, child_id) VALUES (?,?)",
+        [(p, f["id"]) for p in f.get("parents", [])]
+    )
+
+def _remove(conn, file_id: str):
+    conn.execute("DELETE FROM drive_items WHERE id=?", (file_id,))
+    conn.execute("DELETE FROM drive_parents WHERE child_id=?", (file_id,))
+
+def _invalidate_folders():
+    global _folders
+    with _folders_lock:
+        _folders = None
+
+
+# ----------------------------------------------------
+# Full build and incremental refresh
+# ----------------------------------------------------
+def build_catalog() -> int:
+    """List every file visible to the service account and replace the catalog."""
+    with _sync_lock:
+        drive = drive_gateway.service()
+        # take the token first so changes made during the listing are replayed later
+        token = drive.changes().getStartPageToken().execute()["startPageToken"]
+        items = []
+        page_token = None
+        while True:
+            res = drive.files().list(
+                q="trashed=false",
+                fields=f"nextPageToken, files({FILE_FIELDS})",
+                pageSize=1000,
+                pageToken=page_token
+            ).execute()
+            items.extend(res.get("files", []))
+            page_token = res.get("nextPageToken")
+            if not page_token:
+                break
+
+        with DB.transaction() as conn:
+            conn.execute("DELETE FROM drive_items")
+            conn.execute("DELETE FROM drive_parents")
+            for f in items:
+                _upsert(conn, f)
+            _set_meta(conn, "start_page_token", token)
+        _invalidate_folders()
+        logger.info("Drive catalog built: %d items", len(items))
+        return len(items)
+
+
+def refresh_catalog() -> int:
+    """Apply the Drive Changes feed since the last sync. Builds the catalog on first run."""
+    token = _get_meta("start_page_token")
+    if token is None:
+        return build_catalog()
+
+    with _sync_lock:
+        drive = drive_gateway.service()
+        changed = 0
+        with DB.transaction() as conn:
+            while token:
+                res = drive.changes().list(
+                    pageToken=token,
+                    fields=f"nextPageToken, newStartPageToken, changes(fileId, removed, file({FILE_FIELDS}))",
+                    pageSize=1000
+                ).execute()
+                for ch in res.get("changes", []):
+                    f = ch.get("file")
+                    if ch.get("removed") or not f or f.get("trashed"):
+                        _remove(conn, ch["fileId"])
+                    else:
+                        _upsert(conn, f)
+                    changed += 1
+                if res.get("newStartPageToken"):
+                    _set_meta(conn, "start_page_token", res["newStartPageToken"])
+                    break
+                token = res.get("nextPageToken")
+        if changed:
+            _invalidate_folders()
+            logger.info("Drive catalog refreshed: %d changes", changed)
+        return changed
+
+
+# ----------------------------------------------------
+# Lookups
+# ----------------------------------------------------
+def _folder_names():
+    global _folders
+    with _folders_lock:
+        if _folders is None:
+            _folders = DB.fetchall("SELECT id, name FROM drive_items WHERE mime_type=?", (FOLDER_MIME,))
+        return _folders
+
+def find_folder_id(query: str) -> Optional[str]:
+    """Exact (case-insensitive) or fuzzy folder match."""
+    folders = _folder_names()
+    if not folders:
+        return None
+    q = query.lower()
+    for fid, name in folders:
+        if name.lower() == q:
+            return fid
+    match = process.extractOne(query, [name for _, name in folders], scorer=fuzz.WRatio)
+    if match and match[1] >= FUZZY_SCORE_MIN:
+        return folders[match[2]][0]
+    return None
+
+def files_in_folder(folder_id: str) -> List[Dict]:
+    """Every non-folder file under folder_id (recursive)."""
+    rows = DB.fetchall(
+        """
+        WITH RECURSIVE tree(id) AS (
+            SELECT ?
+            UNION
+            SELECT p.child_id FROM drive_parents p JOIN tree t ON p.parent_id = t.id
+        )
+        SELECT i.id, i.name, i.link, i.size FROM drive_items i
+        JOIN tree t ON i.id = t.id
+        WHERE i.mime_type != ?
+        ORDER BY i.name
+        """,
+        (folder_id, FOLDER_MIME)
+    )
+    return [{"id": r[0], "name": r[1], "link": r[2], "size": r[3]} for r in rows]
+
+def get_file(file_id: str) -> Optional[Dict]:
+    row = DB.fetchone(
+        "SELECT id, name, mime_type, size, modified_time, md5, link FROM drive_items WHERE id=?",
+        (file_id,)
+    )
+    if not row:
+        return None
+    return {"id": row[0], "name": row[1], "mimeType": row[2], "size": row[3],
+            "modifiedTime": row[4], "md5Checksum": row[5], "link": row[6]}
+
+
+if __name__ == "__main__":
+    print(f"✅ Drive catalog: {build_catalog()} items")
@@ -0,0 +1,82 @@
+# drive_gateway.py  –  the one Google Drive client for the whole process
+#
+# The service-account key is read once, the Drive v3 discovery document comes
+# from the copy bundled with google-api-python-client (parsed once, no HTTP
+# round trip), and every thread gets its own service object on top of its own
+# keep-alive AuthorizedHttp session, since httplib2 connections are not
+# thread-safe. Async code uses aexecute()/arun(), which hop to a worker thread.
+import os
+import json
+import asyncio
+import logging
+import threading
+from typing import Callable
+
+import httplib2
+import google_auth_httplib2
+from google.oauth2 import service_account
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build, build_from_document
+
+logger = logging.getLogger("aaes-bot")
+
+SERVICE_ACCOUNT_FILE = os.getenv("GOOGLE_SA_PATH", "service_account.json")
+SCOPES = ["https://www.googleapis.com/auth/drive.readonly"]
+HTTP_TIMEOUT = int(os.getenv("DRIVE_HTTP_TIMEOUT", "60"))
+
+_lock = threading.Lock()
+_local = threading.local()
+_creds = None
+_discovery = None
+
+
+def credentials():
+    global _creds
+    if _creds is None:
+        with _lock:
+            if _creds is None:
+                _creds = service_account.Credentials.from_service_account_file(
+                    SERVICE_ACCOUNT_FILE, scopes=SCOPES
+                )
+    return _creds
+
+
+def _discovery_doc():
+    global _discovery
+    if _discovery is None:
+        with _lock:
+            if _discovery is None:
+                doc = discovery_cache.get_static_doc("drive", "v3")
+                _discovery = json.loads(doc) if doc else None
+    return _discovery
+
+
+def service():
+    """Drive v3 service for the calling thread (built on first use)."""
+    drive = getattr(_local, "drive", None)
+    if drive is None:
+        http = google_auth_httplib2.AuthorizedHttp(credentials(), http=httplib2.Http(timeout=HTTP_TIMEOUT))
+        doc = _discovery_doc()
+        if doc is not None:
+            drive = build_from_document(doc, http=http)
+        else:
+            # library without bundled discovery docs: fetch it once per thread
+            drive = build("drive", "v3", http=http, cache_discovery=False)
+        _local.drive = drive
+    return drive
+
+
+# ----------------------------------------------------
+# Async facade
+# ----------------------------------------------------
+async def arun(fn: Callable, *args, **kwargs):
+    """Run a blocking Drive helper in a worker thread."""
+    return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+async def aexecute(make_request: Callable):
+    """
+    Build and execute a request off the event loop, e.g.
+        await aexecute(lambda d: d.files().get(fileId=fid, fields="name"))
+    """
+    return await asyncio.to_thread(lambda: make_request(service()).execute())
@@ -1,39 +1,17 @@
-import os
-import json
 from datetime import datetime, timedelta
 import random
-
-PATH = "data/exam_mode.json"
-
-# ----------------------------------------------------
-# Initialize storage
-# ----------------------------------------------------
-def _init():
-    if not os.path.exists("data"):
-        os.makedirs("data")
-
-    if not os.path.exists(PATH):
-        with open(PATH, "w") as f:
-            json.dump({
-                "active": False,
-                "exam_date": "",
-                "last_quiz_sent": "",
-                "quizzes": []
-            }, f)
-
+from state_db import get_setting, set_setting, execute, fetchall
 
 # ----------------------------------------------------
-# Load / Save
+# Load (settings rows + quiz pool as one dict)
 # ----------------------------------------------------
 def load_exam():
-    _init()
-    with open(PATH, "r") as f:
-        return json.load(f)
-
-
-def save_exam(data):
-    with open(PATH, "w") as f:
-        json.dump(data, f, indent=4)
+    return {
+        "active": get_setting("exam.active", False),
+        "exam_date": get_setting("exam.exam_date", ""),
+        "last_quiz_sent": get_setting("exam.last_quiz_sent", ""),
+        "quizzes": [r[0] for r in fetchall("SELECT question FROM exam_quizzes ORDER BY id")]
+    }
 
 
 # ----------------------------------------------------
@@ -44,10 +22,8 @@ def activate_exam_mode(exam_date_str):
     exam_date_str format: YYYY-MM-DD
     Example: 2025-05-10
     """
-    data = load_exam()
-    data["active"] = True
-    data["exam_date"] = exam_date_str
-    save_exam(data)
+    set_setting("exam.active", True)
+    set_setting("exam.exam_date", exam_date_str)
     return True
 
 
@@ -55,10 +31,8 @@ def activate_exam_mode(exam_date_str):
 # Deactivate Exam Mode
 # ----------------------------------------------------
 def deactivate_exam_mode():
-    data = load_exam()
-    data["active"] = False
-    data["exam_date"] = ""
-    save_exam(data)
+    set_setting("exam.active", False)
+    set_setting("exam.exam_date", "")
     return True
 
 
@@ -66,20 +40,20 @@ def deactivate_exam_mode():
 # Check if active
 # ----------------------------------------------------
 def exam_mode_active():
-    return load_exam().get("active", False)
+    return get_setting("exam.active", False)
 
 
 # ----------------------------------------------------
 # Countdown Engine
 # ----------------------------------------------------
 def exam_countdown():
-    data = load_exam()
+    exam_date_str = get_setting("exam.exam_date", "")
 
-    if not data["active"] or not data["exam_date"]:
+    if not exam_mode_active() or not exam_date_str:
         return None
 
     today = datetime.now().date()
-    exam_date = datetime.fromisoformat(data["exam_date"]).date()
+    exam_date = datetime.fromisoformat(exam_date_str).date()
     days_left = (exam_date - today).days
 
     if days_left < 0:
@@ -106,9 +80,7 @@ DEFAULT_QUIZZES = [
 
 
 def get_daily_quiz():
-    data = load_exam()
-
-    quizzes = data.get("quizzes", [])
+    quizzes = [r[0] for r in fetchall("SELECT question FROM exam_quizzes")]
     if not quizzes:
         quizzes = DEFAULT_QUIZZES
 
@@ -116,12 +88,7 @@ def get_daily_quiz():
 
 
 def add_quiz(question):
-    data = load_exam()
-    if "quizzes" not in data:
-        data["quizzes"] = []
-
-    data["quizzes"].append(question)
-    save_exam(data)
+    execute("INSERT INTO exam_quizzes(question) VALUES (?)", (question,))
     return True
 
 
@@ -129,12 +96,9 @@ def add_quiz(question):
 # Prevent double sending per day
 # ----------------------------------------------------
 def should_send_quiz_today():
-    data = load_exam()
     today = str(datetime.now().date())
-    return data.get("last_quiz_sent", "") != today
+    return get_setting("exam.last_quiz_sent", "") != today
 
 
 def mark_quiz_sent():
-    data = load_exam()
-    data["last_quiz_sent"] = str(datetime.now().date())
-    save_exam(data)
+    set_setting("exam.last_quiz_sent", str(datetime.now().date()))
@@ -7,7 +7,7 @@ from docx import Document
 # Read PDF and DOCX files safely
 # ----------------------------------------------------
 def extract_text_from_file(path):
-    text = ""
+    parts = []
 
     # PDF
     if path.endswith(".pdf"):
@@ -17,7 +17,7 @@ def extract_text_from_file(path):
                 for page in reader.pages:
                     content = page.extract_text()
                     if content:
-                        text += content + "\n"
+                        parts.append(content)
         except Exception:
             return ""
 
@@ -25,12 +25,11 @@ def extract_text_from_file(path):
     elif path.endswith(".docx"):
         try:
             doc = Document(path)
-            for para in doc.paragraphs:
-                text += para.text + "\n"
+            parts = [para.text for para in doc.paragraphs]
         except Exception:
             return ""
 
-    return text.strip()
+    return "\n".join(parts).strip()
 
 
 # ----------------------------------------------------
@@ -0,0 +1,32 @@
+# file_id_cache.py  –  Drive file id -> Telegram file_id
+#
+# After the first upload of a Drive file, Telegram's file_id is stored here
+# together with the Drive version it was made from (md5Checksum, or
+# modifiedTime for Google-native files). Later sends reuse the file_id, so
+# nothing is downloaded or uploaded again until the Drive file changes.
+import time
+from typing import Optional
+
+from state_db import execute, fetchone
+
+
+def file_version(meta: dict) -> str:
+    return meta.get("md5Checksum") or meta.get("modifiedTime") or ""
+
+def get_file_id(drive_id: str, version: str) -> Optional[str]:
+    """Cached Telegram file_id, or None if missing or made from an older version."""
+    row = fetchone("SELECT version, tg_file_id FROM telegram_files WHERE drive_id=?", (drive_id,))
+    if not row or not version or row[0] != version:
+        return None
+    return row[1]
+
+def put_file_id(drive_id: str, version: str, tg_file_id: str):
+    if not version:
+        return
+    execute(
+        "INSERT OR REPLACE INTO telegram_files(drive_id, version, tg_file_id, ts) VALUES (?,?,?,?)",
+        (drive_id, version, tg_file_id, int(time.time()))
+    )
+
+def forget(drive_id: str):
+    execute("DELETE FROM telegram_files WHERE drive_id=?", (drive_id,))
@@ -0,0 +1,124 @@
+# flow_state.py  –  per-user conversation flow ("ask", "helpdesk", "admin_fact", …)
+#
+# Each user has at most one flow state: a name plus a small JSON dict, kept
+# in the user_state table with an LRU in front. Idle users are cached as
+# well, so an ordinary message costs one dict lookup and no SQLite read, and
+# a transition is a single write. StateRouter maps each state name to the
+# handler that consumes the user's next text message in that state; one
+# user's messages go through it one at a time (updates run concurrently),
+# so two quick replies in the same flow can't overwrite each other's data.
+import os
+import json
+import asyncio
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Callable, Dict, NamedTuple, Optional
+
+from state_db import fetchone, execute
+
+CACHE_SIZE = int(os.getenv("FLOW_STATE_CACHE_SIZE", "5000"))
+
+_lock = threading.Lock()
+_cache = OrderedDict()      # uid -> (name | None, data as JSON text), least recently used first
+
+
+class State(NamedTuple):
+    name: Optional[str]
+    data: dict
+
+
+# ----------------------------------------------------
+# Store
+# ----------------------------------------------------
+def _remember(uid: int, entry: tuple):
+    # caller holds _lock
+    _cache[uid] = entry
+    _cache.move_to_end(uid)
+    while len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+
+def _cached(uid: int) -> Optional[tuple]:
+    with _lock:
+        entry = _cache.get(uid)
+        if entry is not None:
+            _cache.move_to_end(uid)
+        return entry
+
+def _state(entry: tuple) -> State:
+    # handlers get their own copy of data, so a failed transition leaves the cache intact
+    return State(entry[0], json.loads(entry[1]))
+
+def load(uid: int) -> State:
+    entry = _cached(uid)
+    if entry is None:
+        row = fetchone("SELECT state, data FROM user_state WHERE user_id=?", (uid,))
+        entry = (row[0], row[1] or "{}") if row else (None, "{}")
+        with _lock:
+            _remember(uid, entry)
+    return _state(entry)
+
+def save(uid: int, name: Optional[str], data: Optional[dict] = None):
+    """Move the user to state `name` (None = idle) in one write."""
+    raw = json.dumps(data or {})
+    if name is None:
+        execute("DELETE FROM user_state WHERE user_id=?", (uid,))
+    else:
+        execute("REPLACE INTO user_state(user_id, state, data) VALUES (?,?,?)", (uid, name, raw))
+    with _lock:
+        _remember(uid, (name, raw))
+
+def clear(uid: int):
+    save(uid, None)
+
+async def aload(uid: int) -> State:
+    entry = _cached(uid)
+    if entry is not None:
+        return _state(entry)
+    return await asyncio.to_thread(load, uid)
+
+async def asave(uid: int, name: Optional[str], data: Optional[dict] = None):
+    await asyncio.to_thread(save, uid, name, data)
+
+async def aclear(uid: int):
+    await asyncio.to_thread(save, uid, None)
+
+
+# ----------------------------------------------------
+# Router
+# ----------------------------------------------------
+STAY = object()     # handler result: keep the current state and data unchanged
+
+def goto(name: Optional[str], data: Optional[dict] = None) -> tuple:
+    """Handler result: move to another state (returning None goes idle)."""
+    return name, data or {}
+
+class StateRouter:
+    def __init__(self):
+        self._handlers: Dict[str, Callable] = {}
+        self._locks = weakref.WeakValueDictionary()     # uid -> asyncio.Lock while in use
+
+    def on(self, *names: str):
+        """Decorator: handler(update, context, data) for text sent in any of these states."""
+        def register(handler):
+            for name in names:
+                self._handlers[name] = handler
+            return handler
+        return register
+
+    async def dispatch(self, update, context, uid: int) -> bool:
+        """Run the handler for the user's state; False if the state has no text handler."""
+        lock = self._locks.get(uid)
+        if lock is None:
+            lock = self._locks[uid] = asyncio.Lock()
+        async with lock:
+            state = await aload(uid)
+            handler = self._handlers.get(state.name)
+            if handler is None:
+                return False
+            result = await handler(update, context, state.data)
+            if result is STAY:
+                return True
+            name, data = result if result else (None, None)
+            await asave(uid, name, data)
+            return True
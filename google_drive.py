@@ -1,19 +1,11 @@
-import os
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
-SERVICE_ACCOUNT_FILE = "service_account.json"
-SCOPES = ["https://www.googleapis.com/auth/drive.readonly"]
-creds = service_account.Credentials.from_service_account_file(
-    SERVICE_ACCOUNT_FILE, scopes=SCOPES
-)
-drive = build("drive", "v3", credentials=creds)
+import drive_gateway
 
 
 def list_files(folder_id):
     try:
-        results = drive.files().list(
+        results = drive_gateway.service().files().list(
             q=f"'{folder_id}' in parents and trashed = false",
             pageSize=1000,
             fields="files(id,name,mimeType,webViewLink)"
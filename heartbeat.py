@@ -1,21 +1,23 @@
-from flask import Flask
-import requests
+from aiohttp import web, ClientSession
 import os
-import time
-
-app = Flask(__name__)
 
 TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
-CHAT_ID = os.getenv('1836471542')  # Replace with your chat ID
+CHAT_ID = os.getenv('HEARTBEAT_CHAT_ID', '1836471542')  # Replace with your chat ID
+
+routes = web.RouteTableDef()
 
-@app.route('/heartbeat')
-def heartbeat():
+@routes.get('/heartbeat')
+async def heartbeat(request):
     try:
-        requests.get(f"https://api.telegram.org/bot{TOKEN}/sendMessage",
-                   params={'chat_id': CHAT_ID, 'text': 'Heartbeat: Bot is still running.'})
-        return "Heartbeat sent successfully", 200
+        async with ClientSession() as session:
+            async with session.get(f"https://api.telegram.org/bot{TOKEN}/sendMessage",
+                                   params={'chat_id': CHAT_ID, 'text': 'Heartbeat: Bot is still running.'}) as r:
+                r.raise_for_status()
+        return web.Response(text="Heartbeat sent successfully")
     except Exception as e:
-        return f"Failed to send heartbeat: {e}", 500
+        return web.Response(text=f"Failed to send heartbeat: {e}", status=500)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=12345)  # Run on localhost
\ No newline at end of file
+    app = web.Application()
+    app.add_routes(routes)
+    web.run_app(app, host='0.0.0.0', port=12345)  # Run on localhost
@@ -1,56 +1,42 @@
-import os
-import json
 from datetime import datetime
-
-PATH = "data/helpdesk.json"
-
-# ----------------------------------------------------
-# Ensure file exists
-# ----------------------------------------------------
-def _init():
-    if not os.path.exists("data"):
-        os.makedirs("data")
-    if not os.path.exists(PATH):
-        with open(PATH, "w", encoding="utf-8") as f:
-            json.dump([], f)
+from state_db import fetchall, transaction
 
 # ----------------------------------------------------
-# Load / Save
+# Load
 # ----------------------------------------------------
 def load_tickets():
-    _init()
-    with open(PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-def save_tickets(data):
-    with open(PATH, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+    rows = fetchall("SELECT user_id, name, text, status, timestamp FROM helpdesk_tickets ORDER BY id")
+    return [
+        {"user_id": r[0], "name": r[1], "text": r[2], "status": r[3], "timestamp": r[4]}
+        for r in rows
+    ]
 
 # ----------------------------------------------------
 # Add a new ticket
 # ----------------------------------------------------
 def add_ticket(uid, name, text):
-    tickets = load_tickets()
-    tickets.append({
-        "user_id": uid,
-        "name": name,
-        "text": text,
-        "status": "pending",
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M")
-    })
-    save_tickets(tickets)
+    with transaction() as conn:
+        conn.execute(
+            "INSERT INTO helpdesk_tickets(user_id, name, text, status, timestamp) VALUES (?,?,?,?,?)",
+            (uid, name, text, "pending", datetime.now().strftime("%Y-%m-%d %H:%M"))
+        )
     return True
 
 # ----------------------------------------------------
 # Mark ticket resolved
 # ----------------------------------------------------
 def resolve_ticket(index):
-    tickets = load_tickets()
-    if index < 0 or index >= len(tickets):
+    if index < 0:
         return None
-    tickets[index]["status"] = "resolved"
-    save_tickets(tickets)
-    return tickets[index]
+    with transaction() as conn:
+        row = conn.execute(
+            "SELECT id, user_id, name, text, timestamp FROM helpdesk_tickets ORDER BY id LIMIT 1 OFFSET ?",
+            (index,)
+        ).fetchone()
+        if not row:
+            return None
+        conn.execute("UPDATE helpdesk_tickets SET status='resolved' WHERE id=?", (row[0],))
+    return {"user_id": row[1], "name": row[2], "text": row[3], "status": "resolved", "timestamp": row[4]}
 
 # ----------------------------------------------------
 # Format tickets for admin panel (with buttons)
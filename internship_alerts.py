@@ -1,33 +1,18 @@
-import json, os, time
+import time
 from typing import List, Dict
-
-PATH = "data/internship_alerts.json"
-
-def _init():
-    os.makedirs("data", exist_ok=True)
-    if not os.path.exists(PATH):
-        with open(PATH, "w") as f:
-            json.dump([], f)
+from state_db import execute, fetchall
 
 def load_alerts() -> List[Dict]:
-    _init()
-    with open(PATH) as f:
-        return json.load(f)
-
-def save_alerts(data):
-    with open(PATH, "w") as f:
-        json.dump(data, f, indent=4)
+    rows = fetchall("SELECT text, ts, posted_by FROM internship_alerts ORDER BY id")
+    return [{"text": r[0], "ts": r[1], "posted_by": r[2]} for r in rows]
 
 def add_alert(text: str, posted_by: int) -> bool:
-    alerts = load_alerts()
-    alerts.append({
-        "text": text,
-        "ts": int(time.time()),
-        "posted_by": posted_by
-    })
-    save_alerts(alerts)
+    execute(
+        "INSERT INTO internship_alerts(text, ts, posted_by) VALUES (?,?,?)",
+        (text, int(time.time()), posted_by)
+    )
     return True
 
 def last_n(n: int = 5) -> List[str]:
-    alerts = load_alerts()
-    return [a["text"] for a in sorted(alerts, key=lambda x: x["ts"], reverse=True)[:n]]
\ No newline at end of file
+    rows = fetchall("SELECT text FROM internship_alerts ORDER BY ts DESC, id DESC LIMIT ?", (n,))
+    return [r[0] for r in rows]
@@ -0,0 +1,96 @@
+# llm_gateway.py  –  async access to the Groq chat API
+#
+# Uses groq.AsyncGroq so a pending completion never blocks the event loop.
+# A semaphore caps how many completions are in flight at once and every call
+# has its own timeout; cancelling the awaiting task cancels the HTTP request.
+# stream() yields the answer piece by piece as Groq produces it.
+import os
+import asyncio
+import logging
+from typing import List, Dict, Optional, AsyncIterator
+
+from groq import AsyncGroq
+
+logger = logging.getLogger("aaes-bot")
+
+DEFAULT_MODEL = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+
+_client = None
+_slots = None
+
+
+def _get_client() -> AsyncGroq:
+    global _client
+    if _client is None:
+        # retries are bounded by our own per-call timeout
+        _client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"), max_retries=1, timeout=TIMEOUT)
+    return _client
+
+
+def _get_slots() -> asyncio.Semaphore:
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(MAX_CONCURRENCY)
+    return _slots
+
+
+async def complete(messages: List[Dict],
+                   model: str = DEFAULT_MODEL,
+                   temperature: float = 0.4,
+                   max_tokens: int = 400,
+                   timeout: Optional[float] = None) -> str:
+    """
+    One chat completion. Raises asyncio.TimeoutError if it takes longer than
+    `timeout` seconds (default TIMEOUT; time spent waiting for a slot included).
+    """
+    async def _call():
+        async with _get_slots():
+            resp = await _get_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+        return (resp.choices[0].message.content or "").strip()
+
+    return await asyncio.wait_for(_call(), TIMEOUT if timeout is None else timeout)
+
+
+async def stream(messages: List[Dict],
+                 model: str = DEFAULT_MODEL,
+                 temperature: float = 0.4,
+                 max_tokens: int = 400,
+                 timeout: Optional[float] = None) -> AsyncIterator[str]:
+    """
+    Yield text deltas of one streamed completion. `timeout` (default TIMEOUT)
+    bounds the wait for a slot and for each next chunk, not the whole answer.
+    """
+    timeout = TIMEOUT if timeout is None else timeout
+    slots = _get_slots()
+    await asyncio.wait_for(slots.acquire(), timeout)
+    try:
+        chunks = await asyncio.wait_for(
+            _get_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True
+            ),
+            timeout
+        )
+        try:
+            it = chunks.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(it.__anext__(), timeout)
+                except StopAsyncIteration:
+                    break
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await chunks.close()
+    finally:
+        slots.release()
@@ -1,66 +1,37 @@
-import os
 import json
+from state_db import execute, fetchone, transaction
 
-PATH = "data/profiles.json"
-
-def _init():
-    if not os.path.exists("data"):
-        os.makedirs("data")
-    if not os.path.exists(PATH):
-        with open(PATH, "w") as f:
-            json.dump({}, f)
-
-def load_profiles():
-    _init()
-    with open(PATH, "r") as f:
-        return json.load(f)
-
-def save_profiles(data):
-    with open(PATH, "w") as f:
-        json.dump(data, f, indent=4)
+FIELDS = ("name", "program", "level")
+DEFAULT = {"name": "unknown", "program": "None", "level": "NONE"}
 
 def get_profile(user_id):
-    _init()
-    data = load_profiles()
-
-    uid = str(user_id)
-    if uid not in data:
-        data[uid] = {
-            "name": "unknown",
-            "program": "None",
-            "level": "NONE",
-            "recent": []
-        }
-        save_profiles(data)
-        
-    return data[uid]
+    uid = int(user_id)
+    execute("INSERT OR IGNORE INTO profiles(user_id) VALUES (?)", (uid,))
+    row = fetchone("SELECT name, program, level, recent FROM profiles WHERE user_id=?", (uid,))
+    return {
+        "name": row[0],
+        "program": row[1],
+        "level": row[2],
+        "recent": json.loads(row[3])
+    }
 
 def update_profile(user_id, field, value):
-    data = load_profiles()
-    uid = str(user_id)
-
-    if uid not in data:
-        data[uid] = {}
-    
-    data[uid][field] = value
-    save_profiles(data)
+    if field not in FIELDS:
+        raise ValueError(f"Unknown profile field: {field}")
+    execute(
+        f"INSERT INTO profiles(user_id, {field}) VALUES (?,?) "
+        f"ON CONFLICT(user_id) DO UPDATE SET {field}=excluded.{field}",
+        (int(user_id), value)
+    )
 
 def log_question(user_id, question):
-    data = load_profiles()
-
-    uid = str(user_id)
-    if uid not in data:
-        data[uid] = {
-            "name": "unknown",
-            "program": "None",
-            "level": "NONE",
-            "recent": []
-        }
-    if "recent" not in data[uid]:
-        data[uid]["recent"] = []
-
-    data[uid]["recent"].append(question)
-    data[uid]["recent"] = data[uid]["recent"][-5:]
-
-    save_profiles(data)
-
+    uid = int(user_id)
+    with transaction() as conn:
+        conn.execute("INSERT OR IGNORE INTO profiles(user_id) VALUES (?)", (uid,))
+        row = conn.execute("SELECT recent FROM profiles WHERE user_id=?", (uid,)).fetchone()
+        recent = json.loads(row[0])
+        recent.append(question)
+        conn.execute(
+            "UPDATE profiles SET recent=? WHERE user_id=?",
+            (json.dumps(recent[-5:]), uid)
+        )
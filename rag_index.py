@@ -0,0 +1,187 @@
+# rag_index.py  –  full-text index over slide / past-question content
+#
+# Offline: every PDF/DOCX listed in data/drive_index.json is downloaded,
+# its text extracted (file_ai.extract_text_from_file) and split into
+# passages, which go into an SQLite FTS5 table. Online: search() ranks
+# passages with bm25 for the AI prompt, typically in a few milliseconds.
+#
+# Ingestion is incremental: rag_files remembers each document's md5Checksum
+# (or modifiedTime), so only new or changed files are downloaded again.
+# Passages of files no longer in the Drive index are dropped only when the
+# caller vouches that the index came from a complete crawl (prune=True):
+# a folder that failed to list must not wipe its documents.
+#
+#   python rag_index.py            # bring the index up to date
+#   python rag_index.py --full     # re-extract everything
+#   python rag_index.py --prune    # also drop files missing from the index
+import os
+import json
+import logging
+import tempfile
+from pathlib import Path
+from typing import List, Dict
+
+from googleapiclient.http import MediaIoBaseDownload
+
+import answer_cache
+import context_builder
+import drive_gateway
+import text_cache
+from file_ai import extract_text_from_file
+from state_db import Database
+
+logger = logging.getLogger("aaes-bot")
+
+INDEX_PATH = "data/drive_index.json"
+MAX_FILE_BYTES = 30 * 1024 * 1024
+PROGRESS_EVERY = 25
+TEXT_TYPES = (".pdf", ".docx")
+
+SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS passages USING fts5(
+    text,
+    name,
+    file_id UNINDEXED,
+    link    UNINDEXED,
+    tokenize = 'porter unicode61'
+);
+CREATE TABLE IF NOT EXISTS rag_files (
+    file_id  TEXT PRIMARY KEY,
+    name     TEXT NOT NULL,
+    version  TEXT NOT NULL,
+    passages INTEGER NOT NULL
+);
+"""
+
+DB = Database(Path(__file__).with_name("rag_index.db"), SCHEMA)
+
+
+# ----------------------------------------------------
+# Ingestion
+# ----------------------------------------------------
+def _extract(file_id: str, name: str, md5: str = "") -> str:
+    """Download one Drive file to a temp file and pull its text out."""
+    if md5:
+        cached = text_cache.get(text_cache.drive_key(md5))
+        if cached and cached[1]:        # passages are kept, so skip partial text
+            return cached[0]
+    suffix = Path(name).suffix.lower()
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            request = drive_gateway.service().files().get_media(fileId=file_id)
+            downloader = MediaIoBaseDownload(fh, request, chunksize=4 * 1024 * 1024)
+            done = False
+            while not done:
+                _, done = downloader.next_chunk()
+        text = extract_text_from_file(path)
+    finally:
+        os.remove(path)
+    if md5 and text:
+        text_cache.put(text_cache.drive_key(md5), text)
+    return text
+
+def _version(entry: Dict) -> str:
+    return entry.get("md5") or entry.get("modified") or ""
+
+def _store(conn, entry: Dict, text: str) -> int:
+    conn.execute("DELETE FROM passages WHERE file_id=?", (entry["id"],))
+    chunks = context_builder.chunk_text(text)
+    conn.executemany(
+        "INSERT INTO passages(text, name, file_id, link) VALUES (?,?,?,?)",
+        [(c, entry["name"], entry["id"], entry.get("link", "")) for c in chunks]
+    )
+    conn.execute(
+        "INSERT OR REPLACE INTO rag_files(file_id, name, version, passages) VALUES (?,?,?,?)",
+        (entry["id"], entry["name"], _version(entry), len(chunks))
+    )
+    return len(chunks)
+
+def _load_entries(path: str = INDEX_PATH) -> List[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    return [e for e in entries
+            if e.get("id") and e.get("name", "").lower().endswith(TEXT_TYPES)
+            and int(e.get("size") or 0) <= MAX_FILE_BYTES]
+
+def _remove(conn, file_id: str):
+    conn.execute("DELETE FROM passages WHERE file_id=?", (file_id,))
+    conn.execute("DELETE FROM rag_files WHERE file_id=?", (file_id,))
+
+def update_index(path: str = INDEX_PATH, force: bool = False, prune: bool = False) -> Dict:
+    """
+    Bring the passage table in line with the Drive index: extract new or
+    changed documents (every document with force=True), skip unchanged
+    ones and, with prune=True, drop ones that disappeared. Each document's
+    passages are replaced in one transaction, so search never sees it
+    half-indexed or missing.
+    """
+    entries = _load_entries(path)
+    known = dict(DB.fetchall("SELECT file_id, version FROM rag_files"))
+    report = {"processed": 0, "skipped": 0, "removed": 0, "failed": 0, "passages": 0}
+
+    live = {e["id"] for e in entries}
+    gone = [fid for fid in known if fid not in live]
+    if gone and not prune:
+        logger.info("RAG: %d indexed files are not in %s; kept (no prune)", len(gone), path)
+    elif gone:
+        with DB.transaction() as conn:
+            for fid in gone:
+                _remove(conn, fid)
+        report["removed"] = len(gone)
+
+    for n, entry in enumerate(entries, 1):
+        version = _version(entry)
+        if not force and version and known.get(entry["id"]) == version:
+            report["skipped"] += 1
+        else:
+            try:
+                text = _extract(entry["id"], entry["name"], entry.get("md5", ""))
+                if not text.strip():
+                    # unreadable or image-only; no version row, so the next run retries
+                    raise ValueError("no text extracted")
+                with DB.transaction() as conn:
+                    report["passages"] += _store(conn, entry, text)
+                report["processed"] += 1
+            except Exception as e:
+                logger.warning("RAG: could not read %s: %s", entry["name"], e)
+                report["failed"] += 1
+        if n % PROGRESS_EVERY == 0:
+            logger.info("RAG ingest %d/%d: %d processed, %d skipped",
+                        n, len(entries), report["processed"], report["skipped"])
+
+    logger.info("RAG index updated: %(processed)d processed, %(skipped)d skipped, "
+                "%(removed)d removed, %(failed)d failed, %(passages)d new passages", report)
+    return report
+
+def build_index(path: str = INDEX_PATH, prune: bool = False) -> Dict:
+    """Extract every document again, replacing the old passages file by file."""
+    return update_index(path, force=True, prune=prune)
+
+
+# ----------------------------------------------------
+# Query
+# ----------------------------------------------------
+def search(question: str, k: int = 3) -> List[Dict]:
+    """Top-k passages for the question: [{"name", "link", "text"}]."""
+    words = answer_cache.content_words(answer_cache.normalize(question))
+    if not words:
+        return []
+    match = " OR ".join(f'"{w}"' for w in sorted(words))
+    try:
+        rows = DB.fetchall(
+            "SELECT name, link, text FROM passages WHERE passages MATCH ? "
+            "ORDER BY bm25(passages, 1.0, 0.5) LIMIT ?",
+            (match, k)
+        )
+    except Exception as e:
+        logger.warning("RAG search failed: %s", e)
+        return []
+    return [{"name": r[0], "link": r[1], "text": r[2]} for r in rows]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    import sys
+    prune = "--prune" in sys.argv
+    print(f"✅ RAG index: {build_index(prune=prune) if '--full' in sys.argv else update_index(prune=prune)}")
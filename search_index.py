@@ -0,0 +1,255 @@
+# search_index.py  –  in-memory index over data/drive_index.json
+#
+# The index file is parsed once (and again only when its mtime/size changes).
+# Names are normalised into tokens with an inverted token -> doc map, course
+# codes such as "ME 461" are extracted as single tokens, and every doc is
+# pre-bucketed by level and resource type, so a query only scores the small
+# candidate set instead of scanning every name. A trigram index over the
+# vocabulary finds tokens that contain a query word anywhere, so "dynamics"
+# still matches "thermodynamics".
+import os
+import re
+import json
+import bisect
+import logging
+import threading
+from typing import List, Dict, Optional
+from rapidfuzz import process, fuzz
+
+logger = logging.getLogger("aaes-bot")
+
+INDEX_PATH = "data/drive_index.json"
+FUZZY_SCORE_MIN = 60
+TOKEN_SCORE_MIN = 80
+MAX_RESULTS = 10
+
+LEVELS = ("L100", "L200", "L300", "L400")
+MODES = ("slides", "pastq", "skill", "other")
+
+_SPLIT = re.compile(r"[^a-z0-9]+")
+_ALNUM = re.compile(r"[a-z]+|\d+")
+_COURSE = re.compile(r"\b([a-z]{2,4})\s*[-_]?\s*(\d{3})\b")
+
+
+# ----------------------------------------------------
+# Normalisation
+# ----------------------------------------------------
+def normalize(text: str) -> str:
+    return " ".join(_SPLIT.split(text.lower())).strip()
+
+def course_codes(text: str) -> List[str]:
+    """'ME 461', 'me-461', 'ME461' -> ['me461']"""
+    return [a + b for a, b in _COURSE.findall(normalize(text))]
+
+def tokenize(text: str) -> set:
+    norm = normalize(text)
+    tokens = set()
+    for word in norm.split():
+        tokens.add(word)
+        tokens.update(_ALNUM.findall(word))     # "me461" -> "me", "461"
+    tokens.update(course_codes(norm))
+    return {t for t in tokens if len(t) >= 2}
+
+def normalize_level(level_raw: Optional[str]) -> Optional[str]:
+    if not level_raw:
+        return None
+    s = level_raw.lower()
+    for num, label in [("100", "L100"), ("200", "L200"), ("300", "L300"), ("400", "L400")]:
+        if num in s or f"l{num}" in s:
+            return label
+    return None
+
+def _doc_modes(doc_type: str) -> List[str]:
+    t = (doc_type or "").lower()
+    modes = []
+    if "slide" in t:
+        modes.append("slides")
+    if "past" in t or "question" in t:
+        modes.append("pastq")
+    if "skill" in t:
+        modes.append("skill")
+    if t not in ("slides", "pastq", "skill"):
+        modes.append("other")
+    return modes
+
+def _trigrams(token: str) -> set:
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+def _mode_key(mode: Optional[str]) -> Optional[str]:
+    if not mode or mode == "all":
+        return None
+    key = mode.lower()
+    if key in ("pastq", "past", "past questions"):
+        return "pastq"
+    return key
+
+
+# ----------------------------------------------------
+# Index
+# ----------------------------------------------------
+class SearchIndex:
+    def __init__(self, path: str = INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp = None
+        self.docs = []
+        self.names = []          # normalised names, parallel to docs
+        self.postings = {}       # token -> set(doc ids)
+        self.vocab = []          # sorted tokens for prefix lookups
+        self.grams = {}          # trigram -> set(tokens containing it)
+        self.levels = {}         # "L100" -> set(doc ids)
+        self.modes = {}          # "slides" -> set(doc ids)
+
+    def _load(self, docs: List[Dict]):
+        names, postings = [], {}
+        levels = {lv: set() for lv in LEVELS}
+        modes = {m: set() for m in MODES}
+        for i, doc in enumerate(docs):
+            name = doc.get("name") or ""
+            names.append(normalize(name))
+            for tok in tokenize(name):
+                postings.setdefault(tok, set()).add(i)
+            lv = (doc.get("level") or "").upper()
+            if lv in levels:
+                levels[lv].add(i)
+            for m in _doc_modes(doc.get("type")):
+                modes[m].add(i)
+        self.docs, self.names, self.postings = docs, names, postings
+        self.vocab = sorted(postings)
+        grams = {}
+        for tok in self.vocab:
+            for g in _trigrams(tok):
+                grams.setdefault(g, set()).add(tok)
+        self.grams = grams
+        self.levels, self.modes = levels, modes
+
+    def refresh(self):
+        """Re-read the index file if it changed since the last load."""
+        try:
+            st = os.stat(self.path)
+            stamp = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stamp = None
+        if stamp == self._stamp:
+            return
+        with self._lock:
+            if stamp == self._stamp:
+                return
+            docs = []
+            if stamp:
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        docs = json.load(f)
+                except Exception as e:
+                    logger.warning("Could not load %s: %s", self.path, e)
+            self._load(docs)
+            self._stamp = stamp
+            logger.info("Search index loaded: %d docs, %d tokens", len(docs), len(self.vocab))
+
+    # ---------- candidate generation ----------
+    def _prefix_postings(self, token: str) -> set:
+        out = set()
+        i = bisect.bisect_left(self.vocab, token)
+        while i < len(self.vocab) and self.vocab[i].startswith(token):
+            out |= self.postings[self.vocab[i]]
+            i += 1
+        return out
+
+    def _substring_postings(self, token: str) -> set:
+        """Docs with a token containing `token` anywhere."""
+        if len(token) < 3:
+            return self._prefix_postings(token)
+        words = None
+        for g in _trigrams(token):
+            found = self.grams.get(g)
+            if not found:
+                return set()
+            words = set(found) if words is None else words & found
+        out = set()
+        for tok in words:
+            if token in tok:
+                out |= self.postings[tok]
+        return out
+
+    def _fuzzy_postings(self, token: str) -> set:
+        out = set()
+        for tok, score, _ in process.extract(token, self.vocab, scorer=fuzz.ratio, limit=5):
+            if score >= TOKEN_SCORE_MIN:
+                out |= self.postings[tok]
+        return out
+
+    def _allowed(self, mode: Optional[str], level: Optional[str]) -> Optional[set]:
+        allowed = None
+        key = _mode_key(mode)
+        if key:
+            allowed = self.modes.get(key, set())
+        lv = normalize_level(level)
+        if lv:
+            allowed = self.levels[lv] if allowed is None else allowed & self.levels[lv]
+        return allowed
+
+    # ---------- search ----------
+    def search(self, term: str, mode: Optional[str] = None, level: Optional[str] = None,
+               limit: int = MAX_RESULTS) -> List[Dict]:
+        self.refresh()
+        if not self.docs:
+            return []
+        allowed = self._allowed(mode, level)
+        term_n = normalize(term)
+        tokens = [t for t in tokenize(term) if len(t) >= 2]
+        if not term_n or not tokens:
+            return []
+
+        # a course code in the query pins the candidate set
+        codes = [c for c in course_codes(term) if c in self.postings]
+        if codes:
+            pinned = set().union(*(self.postings[c] for c in codes))
+            if allowed is not None:
+                pinned &= allowed
+            if pinned:
+                allowed = pinned
+
+        # exact / substring pass
+        per_token = [self._substring_postings(t) for t in tokens]
+        candidates = set().union(*per_token)
+        if allowed is not None:
+            candidates &= allowed
+        scored = []
+        for i in candidates:
+            hits = sum(1 for p in per_token if i in p)
+            score = 100 if term_n in self.names[i] else 60 + 30 * hits // len(tokens)
+            scored.append((score, i))
+        if scored:
+            scored.sort(key=lambda x: (-x[0], self.names[x[1]]))
+            return self._unique([i for _, i in scored], limit)
+
+        # fuzzy pass, only over docs sharing a near-matching token
+        candidates = set().union(*(self._fuzzy_postings(t) for t in tokens))
+        if allowed is not None:
+            candidates &= allowed
+        if not candidates:
+            return []
+        ids = list(candidates)
+        raw = process.extract(term, [self.docs[i].get("name", "") for i in ids],
+                              scorer=fuzz.WRatio, limit=limit)
+        return self._unique([ids[idx] for _, score, idx in raw if score >= FUZZY_SCORE_MIN], limit)
+
+    def _unique(self, ids: List[int], limit: int) -> List[Dict]:
+        seen, out = set(), []
+        for i in ids:
+            doc = self.docs[i]
+            key = doc.get("link") or doc.get("name")
+            if key in seen:
+                continue
+            seen.add(key)
+            out.append(doc)
+            if len(out) >= limit:
+                break
+        return out
+
+
+INDEX = SearchIndex()
+
+def search(term: str, mode: Optional[str] = None, level: Optional[str] = None,
+           limit: int = MAX_RESULTS) -> List[Dict]:
+    return INDEX.search(term, mode=mode, level=level, limit=limit)
@@ -7,6 +7,9 @@ import os, json, random
 from datetime import datetime
 from typing import List, Dict
 from drive_search import _find_folder_id, _files_in_folder
+from state_db import fetchall
+import drive_gateway
+from skill_progress import set_last_lesson, clear_progress
 
 SKILL_ROOT = {
     "arduino programming":   "1la4ALy-ENwAgJS1GGWMj5Z62TSyBczqS",   # ← replace with real Drive folder IDs
@@ -19,7 +22,6 @@ SKILL_ROOT = {
 }
 
 QUIZ_PATH = "data/skill_quizzes.json"
-PROGRESS_PATH = "data/skill_progress.json"
 os.makedirs("data", exist_ok=True)
 
 # ---------- helpers ----------
@@ -49,22 +51,11 @@ def get_lessons(skill: str) -> List[Dict]:
     return [{"id": f["id"], "name": f["name"], "link": f["link"]} for f in files]
 
 def get_progress(uid: int) -> Dict:
-    return load_json(PROGRESS_PATH, {}).get(str(uid), {})
+    rows = fetchall("SELECT skill, last, ts FROM skill_progress WHERE user_id=?", (int(uid),))
+    return {skill: {"last": last, "ts": ts} for skill, last, ts in rows}
 
 def set_progress(uid: int, skill: str, lesson_idx: int):
-    prog = load_json(PROGRESS_PATH, {})
-    uid_str = str(uid)
-    if uid_str not in prog:
-        prog[uid_str] = {}
-    prog[uid_str][skill] = {"last": lesson_idx, "ts": datetime.utcnow().isoformat()}
-    save_json(PROGRESS_PATH, prog)
-
-def clear_progress(uid: int, skill: str):
-    prog = load_json(PROGRESS_PATH, {})
-    uid_str = str(uid)
-    if uid_str in prog and skill in prog[uid_str]:
-        del prog[uid_str][skill]
-        save_json(PROGRESS_PATH, prog)
+    set_last_lesson(uid, skill, lesson_idx)
 
 # ---------- quizzes ----------
 def load_quizzes() -> Dict:
@@ -106,8 +97,7 @@ def get_skill_intro(skill: str) -> tuple[str | None, str | None]:
     txt_file = next((f for f in files if f["name"].lower() == "intro.txt"), None)
     if txt_file:
         try:
-            from utils import _drive_service   # reuse the same service
-            data = _drive_service().files().get_media(fileId=txt_file["id"]).execute()
+            data = drive_gateway.service().files().get_media(fileId=txt_file["id"]).execute()
             caption = data.decode("utf-8", errors="ignore").strip()
         except Exception:
             pass
@@ -117,7 +107,7 @@ def get_skill_intro(skill: str) -> tuple[str | None, str | None]:
         img_file = next((f for f in files if f["name"].lower() == f"intro.{ext}"), None)
         if img_file:
             try:
-                request = _drive_service().files().get_media(fileId=img_file["id"])
+                request = drive_gateway.service().files().get_media(fileId=img_file["id"])
                 fh = io.BytesIO()
                 downloader = MediaIoBaseDownload(fh, request)
                 done = False
@@ -150,7 +140,7 @@ def fetch_skill_intro(skill: str) -> tuple[str | None, str | None]:
     txt = next((f for f in files if f["name"].lower() == "intro.txt"), None)
     if txt:
         try:
-            data = _drive_service().files().get_media(fileId=txt["id"]).execute()
+            data = drive_gateway.service().files().get_media(fileId=txt["id"]).execute()
             caption = data.decode("utf-8", errors="ignore").strip()
             logger.info("Found intro.txt, caption=%s", caption[:50])
         except Exception as e:
@@ -161,7 +151,7 @@ def fetch_skill_intro(skill: str) -> tuple[str | None, str | None]:
         img = next((f for f in files if f["name"].lower() == f"intro.{ext}"), None)
         if img:
             try:
-                request = _drive_service().files().get_media(fileId=img["id"])
+                request = drive_gateway.service().files().get_media(fileId=img["id"])
                 fh = io.BytesIO()
                 downloader = MediaIoBaseDownload(fh, request)
                 done = False
@@ -1,51 +1,25 @@
-import os
-import json
-
-PATH = "data/skill_progress.json"
-
-
-def _init():
-    if not os.path.exists("data"):
-        os.makedirs("data")
-    if not os.path.exists(PATH):
-        with open(PATH, "w") as f:
-            json.dump({}, f)
-
-
-def load_progress():
-    _init()
-    with open(PATH, "r") as f:
-        return json.load(f)
-
-
-def save_progress(data):
-    _init()
-    with open(PATH, "w") as f:
-        json.dump(data, f, indent=4)
+from datetime import datetime
+from state_db import execute, fetchone
 
 
 def set_last_lesson(user_id: int, skill_key: str, lesson_number: int):
-    data = load_progress()
-    uid = str(user_id)
-    if uid not in data:
-        data[uid] = {}
-    data[uid][skill_key] = lesson_number
-    save_progress(data)
+    execute(
+        "INSERT INTO skill_progress(user_id, skill, last, ts) VALUES (?,?,?,?) "
+        "ON CONFLICT(user_id, skill) DO UPDATE SET last=excluded.last, ts=excluded.ts",
+        (int(user_id), skill_key, lesson_number, datetime.utcnow().isoformat())
+    )
 
 
 def get_last_lesson(user_id: int, skill_key: str) -> int:
-    data = load_progress()
-    uid = str(user_id)
-    return data.get(uid, {}).get(skill_key, 0)
+    row = fetchone(
+        "SELECT last FROM skill_progress WHERE user_id=? AND skill=?",
+        (int(user_id), skill_key)
+    )
+    return row[0] if row else 0
 
 
 def clear_progress(user_id: int, skill_key: str = None):
-    data = load_progress()
-    uid = str(user_id)
-    if uid not in data:
-        return
     if skill_key:
-        data[uid].pop(skill_key, None)
+        execute("DELETE FROM skill_progress WHERE user_id=? AND skill=?", (int(user_id), skill_key))
     else:
-        data.pop(uid, None)
-    save_progress(data)
+        execute("DELETE FROM skill_progress WHERE user_id=?", (int(user_id),))
@@ -1,31 +1,399 @@
-import sqlite3, json, os
+import sqlite3, json, os, logging, threading, asyncio, atexit
+from contextlib import contextmanager
+from datetime import datetime
 from pathlib import Path
 
 DB_FILE = Path(__file__).with_name("bot_state.db")
+DATA_DIR = "data"
 
-def _get_conn():
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS user_state (
-            user_id INTEGER PRIMARY KEY,
-            state   TEXT,
-            data    TEXT
+logger = logging.getLogger("aaes-bot")
+
+# ----------------------------------------------------
+# Schema
+# ----------------------------------------------------
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_state (
+    user_id INTEGER PRIMARY KEY,
+    state   TEXT,
+    data    TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS settings (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS activity (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    text    TEXT    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS activity_user ON activity(user_id, id);
+CREATE TABLE IF NOT EXISTS user_memory (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    text    TEXT    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS user_memory_user ON user_memory(user_id, id);
+CREATE TABLE IF NOT EXISTS streaks (
+    user_id     INTEGER PRIMARY KEY,
+    streak      INTEGER NOT NULL,
+    last_active TEXT    NOT NULL
+);
+CREATE TABLE IF NOT EXISTS subscribers (
+    user_id INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS profiles (
+    user_id INTEGER PRIMARY KEY,
+    name    TEXT NOT NULL DEFAULT 'unknown',
+    program TEXT NOT NULL DEFAULT 'None',
+    level   TEXT NOT NULL DEFAULT 'NONE',
+    recent  TEXT NOT NULL DEFAULT '[]'
+);
+CREATE TABLE IF NOT EXISTS helpdesk_tickets (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id   INTEGER,
+    name      TEXT,
+    text      TEXT NOT NULL,
+    status    TEXT NOT NULL DEFAULT 'pending',
+    timestamp TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS announcements (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    author    TEXT NOT NULL,
+    text      TEXT NOT NULL,
+    tag       TEXT NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS skill_progress (
+    user_id INTEGER NOT NULL,
+    skill   TEXT    NOT NULL,
+    last    INTEGER NOT NULL,
+    ts      TEXT,
+    PRIMARY KEY (user_id, skill)
+);
+CREATE TABLE IF NOT EXISTS exam_quizzes (
+    id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    question TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS internship_alerts (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    text      TEXT    NOT NULL,
+    ts        INTEGER NOT NULL,
+    posted_by INTEGER
+);
+CREATE INDEX IF NOT EXISTS internship_alerts_ts ON internship_alerts(ts);
+CREATE TABLE IF NOT EXISTS conversation_turns (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    role    TEXT    NOT NULL,
+    text    TEXT    NOT NULL,
+    file    BLOB,
+    ts      INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS conversation_turns_user ON conversation_turns(user_id, id);
+CREATE TABLE IF NOT EXISTS conversation_summary (
+    user_id INTEGER PRIMARY KEY,
+    summary TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS telegram_files (
+    drive_id   TEXT PRIMARY KEY,
+    version    TEXT NOT NULL,
+    tg_file_id TEXT NOT NULL,
+    ts         INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS broadcast_jobs (
+    id             INTEGER PRIMARY KEY AUTOINCREMENT,
+    key            TEXT    NOT NULL UNIQUE,
+    label          TEXT    NOT NULL,
+    text           TEXT    NOT NULL,
+    options        TEXT    NOT NULL,
+    report_chat_id INTEGER,
+    on_done        TEXT,
+    status         TEXT    NOT NULL DEFAULT 'running',
+    created        INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS broadcast_recipients (
+    job_id  INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    status  TEXT    NOT NULL DEFAULT 'pending',
+    PRIMARY KEY (job_id, user_id)
+) WITHOUT ROWID;
+"""
+
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE = 256
+
+
+# ----------------------------------------------------
+# Connection manager
+# ----------------------------------------------------
+class Database:
+    """
+    Long-lived SQLite connections, one per thread.
+    Each connection is opened once with WAL, synchronous=NORMAL and a busy
+    timeout, and keeps its prepared-statement cache for the life of the
+    process. The schema (and optional on_create hook) runs once.
+    """
+
+    def __init__(self, path, schema: str = "", on_create=None):
+        self.path = path
+        self.schema = schema
+        self.on_create = on_create
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conns = []
+        self._ready = False
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            cached_statements=STATEMENT_CACHE,
         )
-    """)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        with self._lock:
+            if not self._ready:
+                if self.schema:
+                    conn.executescript(self.schema)
+                    conn.commit()
+                if self.on_create:
+                    try:
+                        self.on_create(conn)
+                    except Exception as e:
+                        conn.rollback()
+                        logger.error("Database init hook failed for %s: %s", self.path, e)
+                self._ready = True
+            self._conns.append(conn)
+        return conn
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Yield this thread's connection; commit on success, roll back on error."""
+        conn = self.connection()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def execute(self, sql: str, params=()) -> int:
+        """Run a single write statement and return the affected row count."""
+        with self.transaction() as conn:
+            return conn.execute(sql, params).rowcount
+
+    def fetchone(self, sql: str, params=()):
+        return self.connection().execute(sql, params).fetchone()
+
+    def fetchall(self, sql: str, params=()) -> list:
+        return self.connection().execute(sql, params).fetchall()
+
+    def close(self):
+        with self._lock:
+            for conn in self._conns:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._conns.clear()
+        self._local = threading.local()
+
+
+def _on_create(conn):
+    import_legacy_json(conn)   # defined further down
+
+DB = Database(DB_FILE, SCHEMA, on_create=_on_create)
+atexit.register(DB.close)
+
+
+def init_db():
+    """Open the connection at startup so the first update doesn't pay for it."""
+    DB.connection()
+
+
+def _get_conn():
+    return DB.connection()
+
+
+# ----------------------------------------------------
+# Query helpers (used by the feature modules)
+# ----------------------------------------------------
+transaction = DB.transaction
+execute = DB.execute
+fetchone = DB.fetchone
+fetchall = DB.fetchall
+
+
+# ----------------------------------------------------
+# Async API – runs queries off the event loop thread
+# ----------------------------------------------------
+async def aexecute(sql: str, params=()) -> int:
+    return await asyncio.to_thread(execute, sql, params)
+
+async def afetchone(sql: str, params=()):
+    return await asyncio.to_thread(fetchone, sql, params)
+
+async def afetchall(sql: str, params=()) -> list:
+    return await asyncio.to_thread(fetchall, sql, params)
+
+async def arun(fn, *args, **kwargs):
+    """Call a blocking helper built on this module (profiles.get_profile, ...) in a worker thread."""
+    return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+# Conversation state (the user_state table) is read and written only
+# through flow_state, which keeps an LRU in front of it.
+
+
+# ----------------------------------------------------
+# Settings (small global key/value flags)
+# ----------------------------------------------------
+def get_setting(key: str, default=None):
+    row = fetchone("SELECT value FROM settings WHERE key=?", (key,))
+    if not row:
+        return default
+    return json.loads(row[0])
+
+def set_setting(key: str, value):
+    execute(
+        "INSERT INTO settings(key, value) VALUES (?,?) "
+        "ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+        (key, json.dumps(value))
+    )
+
+
+# ----------------------------------------------------
+# One-shot importer for the old data/*.json files
+# ----------------------------------------------------
+def _load_json(name: str, default):
+    path = os.path.join(DATA_DIR, name)
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning("Skipping unreadable %s: %s", path, e)
+        return default
+
+def _uid(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def import_legacy_json(conn) -> bool:
+    """
+    Copy the per-module JSON stores into their tables.
+    Runs once per database (recorded in `meta`); the JSON files are left untouched.
+    """
+    if conn.execute("SELECT value FROM meta WHERE key='json_import'").fetchone():
+        return False
+
+    for uid, texts in _load_json("activity.json", {}).items():
+        if _uid(uid) is not None:
+            conn.executemany(
+                "INSERT INTO activity(user_id, text) VALUES (?,?)",
+                [(_uid(uid), t) for t in texts[-20:]]
+            )
+
+    for uid, texts in _load_json("user_memory.json", {}).items():
+        if _uid(uid) is not None:
+            conn.executemany(
+                "INSERT INTO user_memory(user_id, text) VALUES (?,?)",
+                [(_uid(uid), t) for t in texts[-20:]]
+            )
+
+    for uid, row in _load_json("streaks.json", {}).items():
+        if _uid(uid) is not None and row.get("last_active"):
+            conn.execute(
+                "INSERT OR REPLACE INTO streaks(user_id, streak, last_active) VALUES (?,?,?)",
+                (_uid(uid), int(row.get("streak", 1)), row["last_active"])
+            )
+
+    conn.executemany(
+        "INSERT OR IGNORE INTO subscribers(user_id) VALUES (?)",
+        [(_uid(u),) for u in _load_json("subscribers.json", []) if _uid(u) is not None]
+    )
+
+    for uid, p in _load_json("profiles.json", {}).items():
+        if _uid(uid) is not None:
+            conn.execute(
+                "INSERT OR REPLACE INTO profiles(user_id, name, program, level, recent) VALUES (?,?,?,?,?)",
+                (_uid(uid), p.get("name", "unknown"), p.get("program", "None"),
+                 p.get("level", "NONE"), json.dumps(p.get("recent", [])[-5:]))
+            )
+
+    conn.executemany(
+        "INSERT INTO helpdesk_tickets(user_id, name, text, status, timestamp) VALUES (?,?,?,?,?)",
+        [(_uid(t.get("user_id")), t.get("name"), t.get("text", ""), t.get("status", "pending"),
+          t.get("timestamp", "")) for t in _load_json("helpdesk.json", [])]
+    )
+
+    conn.executemany(
+        "INSERT INTO announcements(author, text, tag, timestamp) VALUES (?,?,?,?)",
+        [(a.get("author", "AAES Bot"), a.get("text", ""), a.get("tag", "general"),
+          a.get("timestamp", "")) for a in _load_json("announcements.json", [])]
+    )
+
+    for uid, skills in _load_json("skill_progress.json", {}).items():
+        if _uid(uid) is None:
+            continue
+        for skill, prog in skills.items():
+            if isinstance(prog, dict):
+                last, ts = prog.get("last", 0), prog.get("ts")
+            else:
+                last, ts = prog, None
+            conn.execute(
+                "INSERT OR REPLACE INTO skill_progress(user_id, skill, last, ts) VALUES (?,?,?,?)",
+                (_uid(uid), skill, int(last), ts)
+            )
+
+    exam = _load_json("exam_mode.json", {})
+    for key in ("active", "exam_date", "last_quiz_sent"):
+        if key in exam:
+            conn.execute(
+                "INSERT OR REPLACE INTO settings(key, value) VALUES (?,?)",
+                (f"exam.{key}", json.dumps(exam[key]))
+            )
+    conn.executemany(
+        "INSERT INTO exam_quizzes(question) VALUES (?)",
+        [(q,) for q in exam.get("quizzes", [])]
+    )
+
+    conn.executemany(
+        "INSERT INTO internship_alerts(text, ts, posted_by) VALUES (?,?,?)",
+        [(a.get("text", ""), int(a.get("ts", 0)), _uid(a.get("posted_by")))
+         for a in _load_json("internship_alerts.json", [])]
+    )
+
+    conn.execute(
+        "INSERT OR REPLACE INTO meta(key, value) VALUES ('json_import', ?)",
+        (datetime.now().isoformat(timespec="seconds"),)
+    )
     conn.commit()
-    return conn
-
-def get_state(user_id: int) -> dict:
-    with _get_conn() as conn:
-        row = conn.execute("SELECT state, data FROM user_state WHERE user_id=?", (user_id,)).fetchone()
-        if not row:
-            return {}
-        return {"state": row[0], "data": json.loads(row[1] or "{}")}
-
-def set_state(user_id: int, state: str, data: dict | None = None):
-    with _get_conn() as conn:
-        conn.execute(
-            "REPLACE INTO user_state(user_id, state, data) VALUES (?,?,?)",
-            (user_id, state, json.dumps(data or {}))
-        )
-        conn.commit()
\ No newline at end of file
+    logger.info("Imported legacy JSON stores into %s", DB_FILE)
+    return True
+
+
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:] == ["import"]:
+        ts = fetchone("SELECT value FROM meta WHERE key='json_import'")
+        print(f"✅ JSON stores imported into {DB_FILE} ({ts[0] if ts else 'failed'})")
+    else:
+        print("Usage: python state_db.py import   (benchmark: python bench_state_db.py)")
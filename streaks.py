@@ -1,95 +1,78 @@
-import os
-import json
 from datetime import datetime, timedelta
+from state_db import fetchone, fetchall
+import write_behind
 
-PATH = "data/streaks.json"
 
-
-# ----------------------------------------------------
-# Initialise storage
 # ----------------------------------------------------
-def _init():
-    if not os.path.exists("data"):
-        os.makedirs("data")
-    if not os.path.exists(PATH):
-        with open(PATH, "w") as f:
-            json.dump({}, f)
-
-
-# ----------------------------------------------------
-# Load and save
+# Load (whole table, for leaderboards)
 # ----------------------------------------------------
 def load_streaks():
-    _init()
-    with open(PATH, "r") as f:
-        return json.load(f)
+    write_behind.flush()
+    rows = fetchall("SELECT user_id, streak, last_active FROM streaks")
+    return {str(uid): {"streak": streak, "last_active": last} for uid, streak, last in rows}
 
 
-def save_streaks(data):
-    with open(PATH, "w") as f:
-        json.dump(data, f, indent=4)
+def _get_row(user_id):
+    uid = int(user_id)
+    row = write_behind.cached_streak(uid)
+    if row is None:
+        row = fetchone("SELECT streak, last_active FROM streaks WHERE user_id=?", (uid,))
+        if row:
+            write_behind.remember_streak(uid, *row)
+    return row
 
 
 # ----------------------------------------------------
 # Update streak when user interacts
 # ----------------------------------------------------
-def update_streak(user_id):
-    user_id = str(user_id)
-    data = load_streaks()
-
-    today = datetime.now().date()
-
-    if user_id not in data:
-        data[user_id] = {
-            "streak": 1,
-            "last_active": str(today)
-        }
-        save_streaks(data)
-        return 1
+def _advance(row, today):
+    if not row:
+        return 1, str(today)
 
-    last_active = datetime.fromisoformat(data[user_id]["last_active"]).date()
+    streak, last = row
+    last_active = datetime.fromisoformat(last).date()
 
     if last_active == today:
         # Already counted today
-        return data[user_id]["streak"]
+        return None
 
     if last_active == today - timedelta(days=1):
         # Continue streak
-        data[user_id]["streak"] += 1
+        streak += 1
     else:
         # Streak broken
-        data[user_id]["streak"] = 1
+        streak = 1
+    return streak, str(today)
 
-    data[user_id]["last_active"] = str(today)
-    save_streaks(data)
 
-    return data[user_id]["streak"]
+def update_streak(user_id):
+    uid = int(user_id)
+    today = datetime.now().date()
+    # read and write happen under one lock in write_behind; buffered and
+    # written to the streaks table by the write-behind flusher
+    row = write_behind.update_streak(uid, _get_row(uid), lambda row: _advance(row, today))
+    return row[0]
 
 
 # ----------------------------------------------------
 # Get current streak
 # ----------------------------------------------------
 def get_streak(user_id):
-    data = load_streaks()
-    user_id = str(user_id)
-
-    if user_id not in data:
+    row = _get_row(user_id)
+    if not row:
         return 0
-
-    return data[user_id]["streak"]
+    return row[0]
 
 
 # ----------------------------------------------------
 # Detect inactivity for comeback messages
 # ----------------------------------------------------
 def days_inactive(user_id):
-    data = load_streaks()
-    user_id = str(user_id)
-
-    if user_id not in data:
+    row = _get_row(user_id)
+    if not row:
         return 999  # treat as long inactive
 
-    last_active = datetime.fromisoformat(data[user_id]["last_active"]).date()
+    last_active = datetime.fromisoformat(row[1]).date()
     today = datetime.now().date()
 
     return (today - last_active).days
@@ -1,66 +1,128 @@
 import json
 import os
 import time
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
+import random
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from googleapiclient.errors import HttpError
+
+import drive_gateway
 
-SERVICE_ACCOUNT_FILE = "service_account.json"
-SCOPES = ["https://www.googleapis.com/auth/drive.readonly"]
 ROOT = {"slides": "1DjQGc-ibDQXxMTrSnLJwBij5JOCGqw7U",
         "pastquestions": "1nouwo54jay8vFbyYgtPIBmbn5AwBE0Vo",
         "others": "1jGU77fuh-B5AoiXp12vP9QUCdEQqcaPr",
         "skills": "1i6a1lfKcC_F5Vgqr6zHBYn_zBAhHnSsf"
-        }  
+        }
 
 # example IDs
 
-creds = service_account.Credentials.from_service_account_file(
-    SERVICE_ACCOUNT_FILE, 
-    scopes=SCOPES
-)
+FOLDER_MIME = "application/vnd.google-apps.folder"
+CRAWL_WORKERS = int(os.getenv("DRIVE_CRAWL_WORKERS", "8"))
+MAX_RETRIES = 5
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+logger = logging.getLogger("aaes-bot")
 
-drive = build("drive", "v3", credentials=creds)
 
+# ----------------------------------------------------
+# Listing one folder (all pages, with backoff)
+# ----------------------------------------------------
+def _retryable(e: HttpError) -> bool:
+    status = e.resp.status
+    if status in RETRY_STATUS:
+        return True
+    # 403 is also how Drive reports rate limiting
+    return status == 403 and b"ratelimit" in (e.content or b"").lower()
 
 def get_children(folder_id):
-    try:
-        results = drive.files().list(
-            q=f"'{folder_id}' in parents and trashed = false",
-            pageSize=1000,
-            fields="files(id,name,mimeType,webViewLink)"
-        ).execute()
-        return results.get("files", [])
-    except HttpError:
-        return []
-
-def go_four_levels_down(root_id,tag):
+    """Every child of the folder; raises HttpError once retries run out."""
     out = []
-    level1 = get_children(root_id)
-    for a in level1:
-        if a["mimeType"] != "application/vnd.google-apps.folder":
-            continue
-        level2 = get_children(a["id"])
-        for b in level2:
-            if b["mimeType"] != "application/vnd.google-apps.folder":
-                continue
-            level3 = get_children(b["id"])
-            for c in level3:
-                if c["mimeType"] != "application/vnd.google-apps.folder":
+    page_token = None
+    while True:
+        for attempt in range(MAX_RETRIES):
+            try:
+                res = drive_gateway.service().files().list(
+                    q=f"'{folder_id}' in parents and trashed = false",
+                    pageSize=1000,
+                    pageToken=page_token,
+                    fields="nextPageToken, files(id,name,mimeType,webViewLink,size,md5Checksum,modifiedTime)"
+                ).execute()
+                break
+            except HttpError as e:
+                if not _retryable(e) or attempt == MAX_RETRIES - 1:
+                    logger.warning("Listing %s failed: %s", folder_id, e)
+                    raise
+                time.sleep(min(2 ** attempt, 32) + random.random())
+        out.extend(res.get("files", []))
+        page_token = res.get("nextPageToken")
+        if not page_token:
+            return out
+
+
+# ----------------------------------------------------
+# Breadth-first crawler with a bounded worker pool
+# ----------------------------------------------------
+def crawl(roots, max_depth=None, workers=CRAWL_WORKERS):
+    """
+    Walk folders breadth-first, listing up to `workers` folders at a time.
+    roots: {tag: folder_id}. Returns (items, stats) where every item is the
+    Drive file dict plus "tag", "path" and "depth" (1 = direct child of a root).
+    Folders that could not be listed are counted in stats["failed"]; their
+    contents are missing from items.
+    """
+    items = []
+    folders = 0
+    failed = 0
+    started = time.monotonic()
+    queue = deque((folder_id, tag, "", 1) for tag, folder_id in roots.items())
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        running = {}
+        while queue or running:
+            while queue and len(running) < workers:
+                folder_id, tag, path, depth = queue.popleft()
+                running[pool.submit(get_children, folder_id)] = (tag, path, depth)
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                tag, path, depth = running.pop(fut)
+                folders += 1
+                try:
+                    children = fut.result()
+                except Exception as e:
+                    if not isinstance(e, HttpError):
+                        logger.warning("Listing %s/%s failed: %s", tag, path, e)
+                    failed += 1
                     continue
-                level4 = get_children(c["id"])
-                for d in level4:
-                    if d["mimeType"] != "application/vnd.google-apps.folder":
-                        continue
-
-                    out.append({
-                        "id': d["id"],
-                        "name": d["name"]
-                        "folder":c["name"]
-                        "path": a["name"] + "/" + b["name"] + "/" + c["name"] + "/" + d["name"]
-                        "link": d.get("webViewLink","")
-                        "type": tag
-                    })
-                  
+                for child in children:
+                    child_path = f"{path}/{child['name']}" if path else child["name"]
+                    items.append({**child, "tag": tag, "path": child_path, "depth": depth})
+                    if child["mimeType"] == FOLDER_MIME and (max_depth is None or depth < max_depth):
+                        queue.append((child["id"], tag, child_path, depth + 1))
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    stats = {"folders": folders, "failed": failed, "items": len(items), "seconds": round(elapsed, 2),
+             "folders_per_second": round(folders / elapsed, 1)}
+    logger.info("Crawled %(folders)d folders / %(items)d items in %(seconds)ss "
+                "(%(folders_per_second)s folders/s, %(failed)d failed)", stats)
+    return items, stats
+
+
+def go_four_levels_down(root_id, tag):
+    """Folders exactly four levels below root_id."""
+    items, _ = crawl({tag: root_id}, max_depth=4)
+    out = []
+    for d in items:
+        if d["mimeType"] != FOLDER_MIME or d["depth"] != 4:
+            continue
+        out.append({
+            "id": d["id"],
+            "name": d["name"],
+            "folder": d["path"].split("/")[-2],
+            "path": d["path"],
+            "link": d.get("webViewLink", ""),
+            "type": tag
+        })
     return out
 
 def clean_text(name):
@@ -75,24 +137,37 @@ def clean_text(name):
     )
 
 
-def build_universal_index():
-    """Builds the single JSON file the bot expects."""
+def build_universal_index() -> bool:
+    """
+    Builds the single JSON file the bot expects. If any folder could not be
+    listed the crawl is incomplete and the old file is kept; returns whether
+    it was written.
+    """
+    items, stats = crawl(ROOT)
+    if stats["failed"]:
+        print(f"❌ {stats['failed']} folder(s) could not be listed; keeping the old index")
+        return False
     index = []
-    for tag, folder_id in ROOT.items():
-        files = list_all_files_recursive(folder_id)   # reuse your existing helper
-        for f in files:
-            index.append({
-                "name": f["name"],
-                "link": f["link"],
-                "type": tag,          # slides / pastquestions / skills / others
-                "level": _guess_level(f["name"]),
-                "id": f["id"]
-            })
+    for f in items:
+        if f["mimeType"] == FOLDER_MIME:
+            continue
+        index.append({
+            "name": f["name"],
+            "link": f.get("webViewLink", f"https://drive.google.com/file/d/{f['id']}/view"),
+            "type": f["tag"],     # slides / pastquestions / skills / others
+            "level": _guess_level(f["name"]),
+            "id": f["id"],
+            "size": int(f.get("size", 0)),
+            "md5": f.get("md5Checksum", ""),
+            "modified": f.get("modifiedTime", "")
+        })
 
     os.makedirs("data", exist_ok=True)
     with open("data/drive_index.json", "w", encoding="utf-8") as fh:
         json.dump(index, fh, indent=2)
-    print(f"✅ Universal index built: {len(index)} files")
+    print(f"✅ Universal index built: {len(index)} files "
+          f"({stats['folders']} folders in {stats['seconds']}s, {stats['folders_per_second']} folders/s)")
+    return True
 
 def _guess_level(name: str):
     name = name.lower()
@@ -102,18 +177,24 @@ def _guess_level(name: str):
     return ""
 
 def list_all_files_recursive(folder_id):
-    out = []
-    children = list_files(folder_id)
-    for item in children:
-        if item["mimeType"] == "application/vnd.google-apps.folder":
-            out.extend(list_all_files_recursive(item["id"]))
-        else:
-            out.append({
-                "id": item["id"],
-                "name": item["name"],
-                "link": item.get("webViewLink", f"https://drive.google.com/file/d/{item['id']}/view")
-            })
-    return out
+    items, _ = crawl({"": folder_id})
+    return [
+        {
+            "id": item["id"],
+            "name": item["name"],
+            "link": item.get("webViewLink", f"https://drive.google.com/file/d/{item['id']}/view")
+        }
+        for item in items if item["mimeType"] != FOLDER_MIME
+    ]
 
 if __name__ == "__main__":
-    build_universal_index()
\ No newline at end of file
+    import sys
+    import rag_index
+    logging.basicConfig(level=logging.INFO)
+    complete = build_universal_index()
+    if complete and "--no-text" not in sys.argv:
+        # re-extract only documents whose md5/modifiedTime changed; the crawl
+        # was complete, so files missing from it really are gone
+        r = rag_index.update_index(prune=True)
+        print(f"✅ Text index: {r['processed']} processed, {r['skipped']} unchanged, "
+              f"{r['removed']} removed, {r['failed']} failed")
@@ -0,0 +1,74 @@
+import pytest
+
+import answer_cache
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    answer_cache.clear()
+    yield
+    answer_cache.clear()
+
+
+def test_exact_hit_ignores_case_and_punctuation():
+    answer_cache.put("What is a Nozzle?", "A duct.")
+    assert answer_cache.get("what is a nozzle") == "A duct."
+
+
+BASE = "what is the lift equation for a thin airfoil wing"      # lift equation thin airfoil wing
+
+
+def test_near_duplicate_above_threshold_hits():
+    answer_cache.put(BASE, "L = ½ρv²SCL")
+    # one extra content word: Jaccard 5/6 = 0.83
+    assert answer_cache.get("what is the lift equation derivation for thin airfoil wings") == "L = ½ρv²SCL"
+    assert answer_cache.stats()["near_hits"] == 1
+
+
+def test_near_duplicate_below_threshold_misses():
+    answer_cache.put(BASE, "L = ½ρv²SCL")
+    # one content word swapped: Jaccard 4/6 = 0.67
+    assert answer_cache.get("what is the lift equation for a thick airfoil wing") is None
+
+
+def test_different_question_words_do_not_collide():
+    answer_cache.put("what is a wing stall", "A loss of lift past the critical angle.")
+    assert answer_cache.content_words(answer_cache.normalize("why does a wing stall")) == \
+        answer_cache.content_words(answer_cache.normalize("what is a wing stall"))
+    assert answer_cache.get("why does a wing stall") is None
+    assert answer_cache.get("what's a wing stall") == "A loss of lift past the critical angle."
+
+
+def test_lru_bound(monkeypatch):
+    monkeypatch.setattr(answer_cache, "MAX_ENTRIES", 2)
+    answer_cache.put("what is thrust", "1")
+    answer_cache.put("what is drag", "2")
+    answer_cache.put("what is weight", "3")
+    assert answer_cache.get("what is thrust") is None
+    assert answer_cache.stats()["size"] == 2
+
+
+def test_near_duplicate_at_threshold_hits():
+    answer_cache.put(BASE, "L = ½ρv²SCL")
+    # one content word dropped: Jaccard 4/5 = NEAR_THRESHOLD
+    assert answer_cache.get("what is the lift equation for a thin airfoil") == "L = ½ρv²SCL"
+
+
+def _estimate(a, b):
+    sa, sb = answer_cache._signature(frozenset(a)), answer_cache._signature(frozenset(b))
+    return sum(x == y for x, y in zip(sa, sb)) / answer_cache.NUM_PERM
+
+
+def test_minhash_estimate_tracks_jaccard():
+    words = [f"w{i}" for i in range(40)]
+    assert _estimate(words, words) == 1.0
+    assert abs(_estimate(words, words[4:] + ["x1", "x2", "x3", "x4"]) - 36 / 44) < 0.15
+    assert _estimate(words, [f"v{i}" for i in range(40)]) < 0.1
+
+
+def test_lsh_buckets_similar_questions_together():
+    near = answer_cache._signature(frozenset(["lift", "equation", "thin", "airfoil", "wing"]))
+    also = answer_cache._signature(frozenset(["lift", "equation", "thin", "airfoil", "wing", "derivation"]))
+    other = answer_cache._signature(frozenset(["bernoulli", "pressure", "pipe", "flow"]))
+    assert set(answer_cache._band_keys(near)) & set(answer_cache._band_keys(also))
+    assert not set(answer_cache._band_keys(near)) & set(answer_cache._band_keys(other))
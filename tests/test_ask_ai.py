@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+import answer_cache
+import conversation_store
+import state_db
+import utils
+
+
+@pytest.fixture(autouse=True)
+def scratch(tmp_path, monkeypatch):
+    db = state_db.Database(tmp_path / "state.db", state_db.SCHEMA)
+    for name in ("transaction", "fetchall", "fetchone", "execute"):
+        monkeypatch.setattr(conversation_store, name, getattr(db, name))
+    monkeypatch.setattr(conversation_store, "_users", type(conversation_store._users)())
+    monkeypatch.setattr(conversation_store, "_bytes", 0)
+    answer_cache.clear()
+    yield db
+    answer_cache.clear()
+    db.close()
+
+
+@pytest.fixture
+def prompts(monkeypatch):
+    seen = []
+
+    async def complete(messages, **kwargs):
+        prompt = messages[-1]["content"]
+        seen.append(prompt)
+        return f"answer to: {prompt}"
+
+    async def no_hint(prompt):
+        return ""
+
+    monkeypatch.setattr(utils.llm_gateway, "complete", complete)
+    monkeypatch.setattr(utils, "reference_hint", no_hint)
+    return seen
+
+
+def ask(uid, question):
+    async def turn():
+        await utils.add_turn(uid, "user", question)
+        answer = await utils.ask_ai(uid, question)
+        await utils.add_turn(uid, "assistant", answer)
+        return answer
+    return asyncio.run(turn())
+
+
+def test_shared_answer_carries_no_history(scratch, prompts):
+    ask(1, "my thesis is on the Kumasi wind tunnel rig")
+    scratch.execute("UPDATE conversation_turns SET ts = ts - 3600")     # an earlier session
+    conversation_store._users.clear()
+    conversation_store._bytes = 0
+
+    first = ask(1, "what is a pitot tube")
+    assert prompts[-1] == "what is a pitot tube"
+    assert "Kumasi" not in first
+
+    assert ask(2, "what is a pitot tube") == first
+    assert len(prompts) == 2            # user 2 was served from the cache
+
+
+def test_follow_up_uses_history_and_skips_cache(prompts):
+    ask(1, "what is a pitot tube")
+    follow = ask(1, "and how is it calibrated")
+    assert "pitot tube" in prompts[-1]
+    assert answer_cache.get("and how is it calibrated") is None
+    assert follow.startswith("answer to:")
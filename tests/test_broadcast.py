@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+from telegram.error import Forbidden, RetryAfter
+
+import broadcast
+import notify
+import state_db
+
+
+@pytest.fixture
+def scratch(tmp_path, monkeypatch):
+    db = state_db.Database(tmp_path / "state.db", state_db.SCHEMA)
+
+    async def aexecute(sql, params=()):
+        return await asyncio.to_thread(db.execute, sql, params)
+
+    monkeypatch.setattr(broadcast, "transaction", db.transaction)
+    monkeypatch.setattr(broadcast, "fetchall", db.fetchall)
+    monkeypatch.setattr(broadcast, "aexecute", aexecute)
+    monkeypatch.setattr(notify, "execute", db.execute)
+    monkeypatch.setattr(notify, "fetchall", db.fetchall)
+    monkeypatch.setattr(broadcast, "_limiter", broadcast._RateLimiter(1000))
+    monkeypatch.setattr(broadcast, "_tasks", set())
+    monkeypatch.setattr(broadcast, "_running", set())
+    yield db
+    db.close()
+
+
+class StubBot:
+    """Records every send; `errors` maps chat_id -> exceptions raised on its next sends."""
+
+    def __init__(self, errors=None):
+        self.errors = {k: list(v) for k, v in (errors or {}).items()}
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, asyncio.get_running_loop().time()))
+        if self.errors.get(chat_id):
+            raise self.errors[chat_id].pop(0)
+
+
+def subscribe(db, *uids):
+    for uid in uids:
+        db.execute("INSERT INTO subscribers(user_id) VALUES (?)", (uid,))
+
+
+def test_retry_after_pauses_every_sender(scratch):
+    bot = StubBot()
+    first = {}
+
+    async def send_message(chat_id, text, **kwargs):
+        now = asyncio.get_running_loop().time()
+        bot.sent.append((chat_id, now))
+        if not first:
+            first["chat_id"], first["at"] = chat_id, now
+            raise RetryAfter(1)
+
+    bot.send_message = send_message
+    counts = asyncio.run(broadcast.run_broadcast(bot, "hello", recipients=[1, 2, 3], key="k"))
+
+    assert counts == {"sent": 3, "failed": 0, "removed": 0}
+    later = [at for _, at in bot.sent[1:]]
+    assert len(later) == 3
+    assert min(later) >= first["at"] + 0.95
+    assert [c for c, _ in bot.sent].count(first["chat_id"]) == 2
+
+
+def test_forbidden_unsubscribes(scratch):
+    subscribe(scratch, 1, 2, 3)
+    bot = StubBot(errors={2: [Forbidden("bot was blocked by the user")]})
+
+    counts = asyncio.run(broadcast.run_broadcast(bot, "hello", key="k"))
+
+    assert counts == {"sent": 2, "failed": 0, "removed": 1}
+    assert [c for c, _ in bot.sent].count(2) == 1
+    assert notify.list_subscribers() == ["1", "3"]
+
+
+def test_repeated_key_is_not_sent_again(scratch):
+    bot = StubBot()
+
+    async def twice():
+        await broadcast.run_broadcast(bot, "hello", recipients=[1, 2], key="k")
+        return await broadcast.run_broadcast(bot, "hello", recipients=[1, 2], key="k")
+
+    assert asyncio.run(twice()) is None
+    assert sorted(c for c, _ in bot.sent) == [1, 2]
+
+
+def test_resume_skips_recipients_in_flight(scratch):
+    job_id = broadcast._create_job("k", "Alert", "hello", "{}", None, None, [1, 2, 3])
+    scratch.execute("UPDATE broadcast_recipients SET status='sent' WHERE user_id=1")
+    scratch.execute("UPDATE broadcast_recipients SET status='sending' WHERE user_id=2")
+    bot = StubBot()
+
+    async def restart():
+        resumed = await broadcast.resume_broadcasts(bot)
+        results = await asyncio.gather(*broadcast._tasks)
+        return resumed, results
+
+    resumed, results = asyncio.run(restart())
+
+    assert resumed == 1
+    assert [c for c, _ in bot.sent] == [3]
+    assert results == [{"sent": 2, "failed": 1, "removed": 0}]
+    assert scratch.fetchone("SELECT status FROM broadcast_jobs WHERE id=?", (job_id,)) == ("done",)
+    assert scratch.fetchall("SELECT * FROM broadcast_recipients") == []
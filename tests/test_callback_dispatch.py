@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from callback_dispatch import CallbackRouter
+
+
+@pytest.fixture
+def router():
+    router = CallbackRouter()
+    calls = router.calls = []
+
+    @router.exact("menu", "back")
+    async def menu(update, context):
+        calls.append(("menu",))
+
+    @router.prefix("skill_", str)
+    async def skill(update, context, name):
+        calls.append(("skill", name))
+
+    @router.prefix("skillpick_", str, int)
+    async def skillpick(update, context, name, step):
+        calls.append(("skillpick", name, step))
+
+    @router.prefix("formnav_", str, int)
+    async def formnav(update, context, name, page):
+        calls.append(("formnav", name, page))
+
+    @router.prefix("boom_")
+    async def boom(update, context):
+        raise RuntimeError("boom")
+
+    return router
+
+
+def dispatch(router, data):
+    return asyncio.run(router.dispatch(None, None, data))
+
+
+def test_exact_codes_win_over_prefixes(router):
+    route, rest = router.resolve("menu")
+    assert (route.name, rest) == ("menu", "")
+    assert router.resolve("back")[0].name == "back"
+
+
+def test_longest_prefix_wins(router):
+    route, rest = router.resolve("skillpick_Welding_2")
+    assert (route.name, rest) == ("skillpick_*", "Welding_2")
+    route, rest = router.resolve("skill_Welding")
+    assert (route.name, rest) == ("skill_*", "Welding")
+
+
+def test_unknown_data_resolves_to_nothing(router):
+    assert router.resolve("skil") == (None, "skil")
+    assert router.resolve("") == (None, "")
+    assert dispatch(router, "nothing_here") is False
+
+
+@pytest.mark.parametrize("data, args", [
+    ("formnav_Fluid_Flow_3", ("Fluid_Flow", 3)),
+    ("formnav_Statics_0", ("Statics", 0)),
+    ("skillpick__7", ("", 7)),
+])
+def test_payload_round_trip(router, data, args):
+    route, rest = router.resolve(data)
+    assert CallbackRouter.parse(route, rest) == args
+    assert dispatch(router, data) is True
+    assert router.calls[-1][1:] == args
+
+
+@pytest.mark.parametrize("data", ["formnav_Statics", "formnav_Statics_x"])
+def test_malformed_payload_is_rejected(router, data):
+    assert dispatch(router, data) is False
+    assert router.calls == []
+
+
+def test_stats_count_calls_and_errors(router):
+    dispatch(router, "menu")
+    dispatch(router, "menu")
+    dispatch(router, "skill_Welding")
+    with pytest.raises(RuntimeError):
+        dispatch(router, "boom_")
+
+    stats = {s["route"]: s for s in router.stats()}
+    assert router.stats()[0]["route"] == "menu"
+    assert stats["menu"]["calls"] == 2
+    assert stats["boom_*"]["errors"] == 1
+    assert "back" not in stats
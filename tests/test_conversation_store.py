@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+import conversation_store
+import state_db
+
+
+@pytest.fixture(autouse=True)
+def scratch_db(tmp_path, monkeypatch):
+    db = state_db.Database(tmp_path / "state.db", state_db.SCHEMA)
+    for name in ("transaction", "fetchall", "fetchone", "execute"):
+        monkeypatch.setattr(conversation_store, name, getattr(db, name))
+    monkeypatch.setattr(conversation_store, "_users", type(conversation_store._users)())
+    monkeypatch.setattr(conversation_store, "_bytes", 0)
+    yield db
+    db.close()
+
+
+def age_turns(db, uid, seconds):
+    db.execute("UPDATE conversation_turns SET ts = ts - ? WHERE user_id=?", (seconds, uid))
+    conversation_store._users.pop(uid, None)
+    conversation_store._bytes = sum(h.size for h in conversation_store._users.values())
+
+
+def test_last_user_text_only_within_session(scratch_db):
+    conversation_store.add_turn(1, "user", "what is lift?")
+    conversation_store.add_turn(1, "assistant", "a force")
+    assert conversation_store.last_user_text(1, max_age=600) == "what is lift?"
+
+    age_turns(scratch_db, 1, 3600)
+    assert conversation_store.last_user_text(1, max_age=600) is None
+    assert conversation_store.last_user_text(1) == "what is lift?"
+
+
+def test_session_length_ignores_old_turns(scratch_db):
+    conversation_store.add_turn(1, "user", "old question")
+    age_turns(scratch_db, 1, conversation_store.SESSION_SECONDS + 1)
+    conversation_store.add_turn(1, "user", "new question")
+    assert conversation_store.length(1) == 2
+    assert conversation_store.session_length(1) == 1
+
+
+def test_growing_history_stays_under_byte_cap(monkeypatch):
+    monkeypatch.setattr(conversation_store, "MAX_BYTES", 4000)
+    conversation_store.add_turn(1, "user", "x" * 1500)
+    conversation_store.add_turn(2, "user", "y" * 1500)
+    conversation_store.add_turn(2, "user", "y" * 1500)    # user 2 grows past the cap
+
+    assert list(conversation_store._users) == [2]
+    assert conversation_store._bytes == conversation_store._users[2].size
+    assert conversation_store.get_turns(1)[0]["text"] == "x" * 1500     # reloaded from SQLite
+
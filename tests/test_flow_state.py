@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+import flow_state
+import state_db
+from flow_state import StateRouter, STAY, goto
+
+
+@pytest.fixture(autouse=True)
+def scratch_db(tmp_path, monkeypatch):
+    db = state_db.Database(tmp_path / "state.db", state_db.SCHEMA)
+    monkeypatch.setattr(flow_state, "fetchone", db.fetchone)
+    monkeypatch.setattr(flow_state, "execute", db.execute)
+    flow_state._cache.clear()
+    yield db
+    flow_state._cache.clear()
+    db.close()
+
+
+class Update:
+    def __init__(self, text):
+        self.text = text
+
+
+def make_router(log):
+    router = StateRouter()
+
+    @router.on("counting")
+    async def counting(update, context, data):
+        data.setdefault("seen", []).append(update.text)
+        log.append(update.text)
+        if update.text == "done":
+            return None
+        if update.text == "same":
+            return STAY
+        return goto("counting", data)
+
+    return router
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_idle_user_is_not_dispatched():
+    router = make_router([])
+    assert run(router.dispatch(Update("hi"), None, 1)) is False
+    assert flow_state.load(1) == flow_state.State(None, {})
+
+
+def test_goto_stay_and_finish(scratch_db):
+    router = make_router([])
+    flow_state.save(1, "counting")
+    assert run(router.dispatch(Update("a"), None, 1))
+    assert flow_state.load(1) == flow_state.State("counting", {"seen": ["a"]})
+
+    # STAY keeps the stored data untouched, even though the handler mutated its copy
+    run(router.dispatch(Update("same"), None, 1))
+    assert flow_state.load(1).data == {"seen": ["a"]}
+
+    run(router.dispatch(Update("done"), None, 1))
+    assert flow_state.load(1).name is None
+    assert scratch_db.fetchone("SELECT * FROM user_state WHERE user_id=1") is None
+
+
+def test_state_survives_cache_eviction(scratch_db):
+    flow_state.save(2, "counting", {"seen": ["x"]})
+    flow_state._cache.clear()
+    assert flow_state.load(2) == flow_state.State("counting", {"seen": ["x"]})
+
+
+def test_concurrent_messages_from_one_user_are_serialised():
+    log = []
+    router = StateRouter()
+
+    @router.on("collect")
+    async def collect(update, context, data):
+        items = data.setdefault("l", [])
+        await asyncio.sleep(0.01)       # yield mid-handler, like a reply would
+        items.append(update.text)
+        log.append(update.text)
+        return goto("collect", data)
+
+    flow_state.save(3, "collect")
+
+    async def both():
+        await asyncio.gather(
+            router.dispatch(Update(1), None, 3),
+            router.dispatch(Update(2), None, 3),
+        )
+
+    run(both())
+    assert sorted(flow_state.load(3).data["l"]) == [1, 2]
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+import rag_index
+from state_db import Database
+
+TEXT = "Bernoulli relates pressure and velocity along a streamline in pipe flow. " * 20
+
+
+@pytest.fixture(autouse=True)
+def scratch_db(tmp_path, monkeypatch):
+    db = Database(tmp_path / "rag.db", rag_index.SCHEMA)
+    monkeypatch.setattr(rag_index, "DB", db)
+    monkeypatch.setattr(rag_index, "_extract", lambda file_id, name, md5="": TEXT)
+    yield db
+    db.close()
+
+
+def write_index(tmp_path, ids):
+    path = tmp_path / "drive_index.json"
+    path.write_text(json.dumps([
+        {"id": i, "name": f"{i}.pdf", "md5": f"md5-{i}", "link": f"https://drive/{i}"} for i in ids
+    ]))
+    return str(path)
+
+
+def indexed(db):
+    return sorted(r[0] for r in db.fetchall("SELECT file_id FROM rag_files"))
+
+
+def test_missing_files_are_kept_unless_pruning(tmp_path, scratch_db):
+    rag_index.update_index(write_index(tmp_path, ["a", "b"]))
+    report = rag_index.update_index(write_index(tmp_path, ["a"]))
+    assert report["removed"] == 0
+    assert indexed(scratch_db) == ["a", "b"]
+
+    report = rag_index.update_index(write_index(tmp_path, ["a"]), prune=True)
+    assert report["removed"] == 1
+    assert indexed(scratch_db) == ["a"]
+    assert scratch_db.fetchone("SELECT count(*) FROM passages WHERE file_id='b'") == (0,)
+
+
+def test_unchanged_files_are_skipped(tmp_path):
+    path = write_index(tmp_path, ["a"])
+    rag_index.update_index(path)
+    assert rag_index.update_index(path)["skipped"] == 1
+    assert rag_index.build_index(path)["processed"] == 1
+
+
+def test_empty_extraction_is_retried(tmp_path, scratch_db, monkeypatch):
+    path = write_index(tmp_path, ["a"])
+    monkeypatch.setattr(rag_index, "_extract", lambda file_id, name, md5="": "")
+    report = rag_index.update_index(path)
+    assert (report["processed"], report["failed"]) == (0, 1)
+    assert indexed(scratch_db) == []
+
+    monkeypatch.setattr(rag_index, "_extract", lambda file_id, name, md5="": TEXT)
+    assert rag_index.update_index(path)["processed"] == 1
+    assert indexed(scratch_db) == ["a"]
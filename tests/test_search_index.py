@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from search_index import SearchIndex, course_codes, tokenize
+
+DOCS = [
+    {"name": "Thermodynamics I - Lecture 3.pdf", "type": "slides", "level": "L200", "link": "a"},
+    {"name": "Aerodynamics Past Questions 2021.pdf", "type": "pastq", "level": "L300", "link": "b"},
+    {"name": "ME 461 Heat Transfer.pdf", "type": "slides", "level": "L400", "link": "c"},
+    {"name": "Fluid Dynamics.pdf", "type": "slides", "level": "L200", "link": "d"},
+    {"name": "Engineering Drawing.pdf", "type": "slides", "level": "L100", "link": "e"},
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    path = tmp_path / "drive_index.json"
+    path.write_text(json.dumps(DOCS), encoding="utf-8")
+    return SearchIndex(str(path))
+
+
+def names(results):
+    return [d["name"] for d in results]
+
+
+def test_course_codes_and_tokens():
+    assert course_codes("ME 461") == course_codes("me-461") == ["me461"]
+    assert {"me461", "me", "461"} <= tokenize("ME461 notes")
+
+
+def test_substring_matches_inside_words(index):
+    found = names(index.search("dynamics"))
+    assert "Thermodynamics I - Lecture 3.pdf" in found
+    assert "Aerodynamics Past Questions 2021.pdf" in found
+    assert "Fluid Dynamics.pdf" in found
+
+
+def test_full_name_match_ranks_first(index):
+    assert names(index.search("fluid dynamics"))[0] == "Fluid Dynamics.pdf"
+
+
+def test_course_code_pins_results(index):
+    assert names(index.search("me461")) == ["ME 461 Heat Transfer.pdf"]
+
+
+def test_mode_and_level_filters(index):
+    assert names(index.search("dynamics", mode="pastq")) == ["Aerodynamics Past Questions 2021.pdf"]
+    assert names(index.search("dynamics", level="200")) == [
+        "Fluid Dynamics.pdf", "Thermodynamics I - Lecture 3.pdf"]
+
+
+def test_fuzzy_fallback_for_typos(index):
+    assert names(index.search("thermodynamcs"))[0] == "Thermodynamics I - Lecture 3.pdf"
+
+
+def test_reloads_when_file_changes(index, tmp_path):
+    assert index.search("drawing")
+    (tmp_path / "drive_index.json").write_text(json.dumps(DOCS[:1]), encoding="utf-8")
+    assert index.search("drawing") == []
@@ -0,0 +1,53 @@
+import json
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+import sync_index
+
+FOLDER = sync_index.FOLDER_MIME
+TREE = {
+    "root": [{"id": "l100", "name": "L100", "mimeType": FOLDER},
+             {"id": "broken", "name": "L200", "mimeType": FOLDER}],
+    "l100": [{"id": "f1", "name": "ME 161 slides.pdf", "mimeType": "application/pdf"}],
+}
+
+
+class FakeDrive:
+    def files(self):
+        return self
+
+    def list(self, q, **kwargs):
+        self.folder = q.split("'")[1]
+        return self
+
+    def execute(self):
+        if self.folder == "broken":
+            raise HttpError(httplib2.Response({"status": 404}), b"not found")
+        return {"files": TREE.get(self.folder, [])}
+
+
+@pytest.fixture(autouse=True)
+def fake_drive(monkeypatch, tmp_path):
+    monkeypatch.setattr(sync_index.drive_gateway, "service", FakeDrive)
+    monkeypatch.chdir(tmp_path)
+
+
+def test_crawl_counts_folders_it_could_not_list():
+    items, stats = sync_index.crawl({"slides": "root"})
+    assert stats["failed"] == 1
+    assert {i["id"] for i in items} == {"l100", "broken", "f1"}
+
+
+def test_incomplete_crawl_keeps_the_old_index(tmp_path, monkeypatch):
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "drive_index.json").write_text('[{"id": "old"}]')
+    monkeypatch.setattr(sync_index, "ROOT", {"slides": "root"})
+
+    assert sync_index.build_universal_index() is False
+    assert json.loads((tmp_path / "data" / "drive_index.json").read_text()) == [{"id": "old"}]
+
+    monkeypatch.setitem(TREE, "root", TREE["root"][:1])     # listing works again
+    assert sync_index.build_universal_index() is True
+    assert [d["id"] for d in json.loads((tmp_path / "data" / "drive_index.json").read_text())] == ["f1"]
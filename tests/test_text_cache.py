@@ -0,0 +1,61 @@
+import os
+import time
+
+import pytest
+
+import text_cache
+
+
+@pytest.fixture(autouse=True)
+def scratch_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(text_cache, "CACHE_DIR", str(tmp_path / "text_cache"))
+    monkeypatch.setattr(text_cache, "_size", None)
+    return tmp_path
+
+
+def test_round_trip():
+    key = text_cache.telegram_key("abc")
+    assert text_cache.get(key) is None
+    text_cache.put(key, "lift and drag")
+    assert text_cache.get(key) == ("lift and drag", True)
+
+
+def test_partial_text_expires():
+    key = text_cache.drive_key("d41d8cd9")
+    text_cache.put(key, "first pages", complete=False)
+    assert text_cache.get(key) == ("first pages", False)
+
+    old = time.time() - text_cache.PARTIAL_TTL - 1
+    os.utime(text_cache._path(key), (old, old))
+    assert text_cache.get(key) is None
+    assert not os.path.exists(text_cache._path(key))
+
+
+def test_eviction_drops_least_recently_used(monkeypatch):
+    blob = os.urandom(900).hex()        # barely compressible
+    keys = [text_cache.telegram_key(str(i)) for i in range(3)]
+    for n, key in enumerate(keys):
+        text_cache.put(key, blob)
+        if n == 0:
+            # room for three entries after trimming to 90%, not four
+            entry = os.path.getsize(text_cache._path(key))
+            monkeypatch.setattr(text_cache, "MAX_BYTES", int(entry * 3.5))
+        past = time.time() - 100 + n
+        os.utime(text_cache._path(key), (past, past))
+
+    text_cache.get(keys[0])             # now the most recently used
+    text_cache.put(text_cache.telegram_key("new"), blob)
+
+    assert text_cache.get(keys[1]) is None
+    assert text_cache.get(keys[0]) is not None
+    assert text_cache.get(text_cache.telegram_key("new")) is not None
+    assert text_cache._size <= text_cache.MAX_BYTES
+
+
+def test_unreadable_entry_is_dropped():
+    key = text_cache.telegram_key("bad")
+    text_cache.put(key, "ok")
+    with open(text_cache._path(key), "wb") as f:
+        f.write(b"not zlib")
+    assert text_cache.get(key) is None
+    assert not os.path.exists(text_cache._path(key))
@@ -0,0 +1,80 @@
+import asyncio
+import os
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "1:test")
+
+import app      # noqa: E402  (needs the token above)
+
+UPDATE = {
+    "update_id": 1,
+    "message": {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "hi"},
+}
+
+
+@pytest.fixture
+def webhook(monkeypatch):
+    """A client for /webhook with the Telegram side left stopped, so updates stay queued."""
+    monkeypatch.setattr(app, "MAX_BODY_BYTES", 4096)
+    monkeypatch.setattr(app, "_accepted", 0)
+    monkeypatch.setattr(app.telegram_app, "update_queue", asyncio.Queue(maxsize=2))
+
+    def post(secret=app.WEBHOOK_SECRET, times=1, **body):
+        async def run():
+            web_app = app.make_web_app()
+            web_app.on_startup.clear()
+            web_app.on_cleanup.clear()
+            headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret is not None else {}
+            async with TestClient(TestServer(web_app)) as client:
+                statuses = []
+                for _ in range(times):
+                    r = await client.post("/webhook", headers=headers, **body)
+                    statuses.append((r.status, r.headers.get("Retry-After")))
+                return statuses
+        return asyncio.run(run())
+
+    return post
+
+
+def test_update_is_queued(webhook):
+    assert webhook(json=UPDATE) == [(200, None)]
+    assert app.telegram_app.update_queue.get_nowait().update_id == 1
+    assert app._accepted == 1
+
+
+def test_wrong_or_missing_secret_is_forbidden(webhook):
+    assert webhook(json=UPDATE, secret="guess") == [(403, None)]
+    assert webhook(json=UPDATE, secret=None) == [(403, None)]
+    assert app.telegram_app.update_queue.empty()
+
+
+def test_oversized_body_is_rejected(webhook):
+    big = dict(UPDATE, message=dict(UPDATE["message"], text="x" * 8192))
+    assert webhook(json=big) == [(413, None)]
+
+
+def test_oversized_chunked_body_is_rejected(webhook):
+    async def chunks():
+        yield b'{"update_id": 1, "padding": "'
+        for _ in range(16):
+            yield b"x" * 1024
+        yield b'"}'
+
+    assert webhook(data=chunks()) == [(413, None)]
+    assert app.telegram_app.update_queue.empty()
+
+
+def test_full_queue_returns_429(webhook):
+    assert webhook(json=UPDATE, times=3) == [(200, None), (200, None), (429, "2")]
+    assert app._accepted == 2
+
+
+def test_saturated_handlers_return_429(webhook, monkeypatch):
+    processor = app.telegram_app.update_processor
+    backlog = processor.max_concurrent_updates + app.UPDATE_QUEUE_SIZE
+    monkeypatch.setattr(app, "_accepted", processor.finished + backlog)
+
+    assert webhook(json=UPDATE) == [(429, "2")]
+    assert app.telegram_app.update_queue.empty()
@@ -0,0 +1,108 @@
+import json
+import os
+
+import pytest
+
+import state_db
+import write_behind
+
+
+@pytest.fixture
+def scratch(tmp_path, monkeypatch):
+    db = state_db.Database(tmp_path / "state.db", state_db.SCHEMA)
+    monkeypatch.setattr(write_behind, "transaction", db.transaction)
+    monkeypatch.setattr(write_behind, "fetchone", db.fetchone)
+    monkeypatch.setattr(write_behind, "JOURNAL_DIR", str(tmp_path / "journal"))
+    monkeypatch.setattr(write_behind, "_streaks", type(write_behind._streaks)())
+    monkeypatch.setattr(write_behind, "_dirty_streaks", set())
+    monkeypatch.setattr(write_behind, "_pending", 0)
+    os.makedirs(write_behind.JOURNAL_DIR)
+    yield db
+    db.close()
+
+
+def write_journal(seq, records, torn=False):
+    with open(write_behind._journal_path(seq), "w", encoding="utf-8") as f:
+        for rec in records:
+            f.write(json.dumps(rec) + "\n")
+        if torn:
+            f.write('{"k": "a", "u": 1, "t": "half')
+
+
+def test_replay_applies_journals_in_order(scratch):
+    write_journal(3, [{"k": "a", "u": 1, "t": "opened menu"},
+                      {"k": "s", "u": 1, "s": 2, "d": "2026-10-01"}])
+    write_journal(4, [{"k": "s", "u": 1, "s": 3, "d": "2026-10-02"},
+                      {"k": "a", "u": 2, "t": "searched"}], torn=True)
+
+    assert write_behind._recover() == 5
+    assert scratch.fetchall("SELECT user_id, text FROM activity ORDER BY id") == [
+        (1, "opened menu"), (2, "searched")]
+    assert scratch.fetchone("SELECT streak, last_active FROM streaks WHERE user_id=1") == (3, "2026-10-02")
+    assert scratch.fetchone("SELECT value FROM meta WHERE key='write_behind_seq'") == ("4",)
+    assert os.listdir(write_behind.JOURNAL_DIR) == []
+
+
+def test_replay_skips_already_applied_journals(scratch):
+    scratch.execute("INSERT INTO meta(key, value) VALUES ('write_behind_seq', '7')")
+    write_journal(7, [{"k": "a", "u": 1, "t": "already flushed"}])
+
+    assert write_behind._recover() == 8
+    assert scratch.fetchall("SELECT text FROM activity") == []
+    assert os.listdir(write_behind.JOURNAL_DIR) == []
+
+
+def test_streak_cache_is_bounded_but_keeps_dirty_rows(scratch, monkeypatch):
+    monkeypatch.setattr(write_behind, "STREAK_CACHE_SIZE", 3)
+    with write_behind._lock:
+        write_behind._dirty_streaks.add(1)
+        write_behind._remember(1, (5, "2026-10-18"))    # unflushed
+    for uid in range(2, 7):
+        write_behind.remember_streak(uid, 1, "2026-10-18")
+
+    assert list(write_behind._streaks) == [1, 5, 6]
+    write_behind.cached_streak(5)
+    write_behind.remember_streak(7, 1, "2026-10-18")
+    assert list(write_behind._streaks) == [1, 5, 7]
+
+
+def test_update_streak_applies_step_once_under_lock(scratch, monkeypatch):
+    monkeypatch.setattr(write_behind, "_thread", object())      # no flusher thread
+    monkeypatch.setattr(write_behind, "_journal", open(write_behind._journal_path(0), "a"))
+
+    def bump(row):
+        if row and row[1] == "2026-10-18":
+            return None
+        return (row[0] if row else 0) + 1, "2026-10-18"
+
+    assert write_behind.update_streak(1, (4, "2026-10-17"), bump) == (5, "2026-10-18")
+    # a second message the same day sees the buffered row, not the stale database one
+    assert write_behind.update_streak(1, (4, "2026-10-17"), bump) == (5, "2026-10-18")
+    assert write_behind._dirty_streaks == {1}
+    write_behind._journal.close()
+
+
+def test_failed_flush_survives_eviction(scratch, monkeypatch):
+    monkeypatch.setattr(write_behind, "STREAK_CACHE_SIZE", 2)
+    monkeypatch.setattr(write_behind, "_thread", object())
+    monkeypatch.setattr(write_behind, "_unflushed", [])
+    monkeypatch.setattr(write_behind, "_journal", open(write_behind._journal_path(0), "a"))
+    monkeypatch.setattr(write_behind, "_seq", 0)
+    write_behind.update_streak(1, None, lambda row: (3, "2026-10-18"))
+
+    apply = write_behind._apply
+
+    def failing_apply(activity, streaks, seq):
+        for uid in (2, 3, 4):       # other users' reads push the in-flight row out
+            write_behind.remember_streak(uid, 1, "2026-10-18")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(write_behind, "_apply", failing_apply)
+    write_behind.flush()
+    assert write_behind.cached_streak(1) == (3, "2026-10-18")
+
+    monkeypatch.setattr(write_behind, "_apply", apply)
+    write_behind.flush()
+    assert scratch.fetchone("SELECT streak FROM streaks WHERE user_id=1") == (3,)
+    assert write_behind._dirty_streaks == set()
+    write_behind._journal.close()
@@ -0,0 +1,118 @@
+# text_cache.py  –  extracted document text, content-addressed on disk
+#
+# Keys are Telegram file_unique_id ("tg:<id>") or Drive md5Checksum
+# ("md5:<hex>"), both stable for identical content, so the same lecture PDF
+# forwarded by a whole class is downloaded and parsed once. Entries are
+# zlib-compressed files under CACHE_DIR; reads refresh the mtime, and the
+# least recently used files are deleted once the directory passes MAX_BYTES.
+# Partial text (extraction cut short by the time budget or page cap) is only
+# served for PARTIAL_TTL seconds after it was written, so a slow moment
+# under load doesn't leave a document truncated for good.
+import os
+import time
+import zlib
+import hashlib
+import logging
+import threading
+from typing import Optional, Tuple
+
+logger = logging.getLogger("aaes-bot")
+
+CACHE_DIR = os.path.join("data", "text_cache")
+MAX_BYTES = int(os.getenv("TEXT_CACHE_MB", "200")) * 1024 * 1024
+PARTIAL_TTL = int(os.getenv("TEXT_CACHE_PARTIAL_TTL", "600"))
+
+_lock = threading.Lock()
+_size = None        # bytes on disk, computed on first write
+
+
+def telegram_key(file_unique_id: str) -> str:
+    return f"tg:{file_unique_id}"
+
+def drive_key(md5: str) -> str:
+    return f"md5:{md5}"
+
+def _path(key: str) -> str:
+    return os.path.join(CACHE_DIR, hashlib.sha1(key.encode()).hexdigest() + ".z")
+
+
+def get(key: str) -> Optional[Tuple[str, bool]]:
+    """(text, complete) or None."""
+    path = _path(key)
+    try:
+        with open(path, "rb") as f:
+            raw = zlib.decompress(f.read())
+        complete = raw[:1] == b"1"
+        if not complete:
+            # mtime of a partial entry is never refreshed, so it is the write time
+            if time.time() - os.path.getmtime(path) > PARTIAL_TTL:
+                _discard(path)
+                return None
+        else:
+            os.utime(path)      # LRU bookkeeping
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning("Dropping unreadable text cache entry %s: %s", path, e)
+        _discard(path)
+        return None
+    return raw[1:].decode("utf-8"), complete
+
+
+def put(key: str, text: str, complete: bool = True):
+    global _size
+    data = zlib.compress((b"1" if complete else b"0") + text.encode("utf-8"), 6)
+    path = _path(key)
+    with _lock:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        if _size is None:
+            _size = _scan_size()
+        try:
+            _size -= os.path.getsize(path)
+        except OSError:
+            pass
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        _size += len(data)
+        if _size > MAX_BYTES:
+            _evict()
+
+
+def _scan_size() -> int:
+    total = 0
+    for entry in os.scandir(CACHE_DIR):
+        if entry.name.endswith(".z"):
+            total += entry.stat().st_size
+    return total
+
+
+def _discard(path: str):
+    global _size
+    with _lock:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        if _size is not None:
+            _size -= size
+
+
+def _evict():
+    """Delete least recently used entries down to 90% of MAX_BYTES (caller holds _lock)."""
+    global _size
+    entries = sorted(
+        (e.stat().st_mtime, e.stat().st_size, e.path)
+        for e in os.scandir(CACHE_DIR) if e.name.endswith(".z")
+    )
+    target = int(MAX_BYTES * 0.9)
+    for _, size, path in entries:
+        if _size <= target:
+            break
+        try:
+            os.remove(path)
+            _size -= size
+        except OSError:
+            pass
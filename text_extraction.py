@@ -0,0 +1,115 @@
+# text_extraction.py  –  PDF / DOCX text extraction off the event loop
+#
+# PyPDF2 is pure Python and CPU-bound, so extraction runs in a small process
+# pool. Large PDFs are split into page ranges that are extracted in
+# parallel, and every document has a page cap and a time budget: whatever
+# was extracted when the budget runs out is returned as partial text.
+import os
+import time
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Tuple, List
+
+import PyPDF2
+from docx import Document
+
+logger = logging.getLogger("aaes-bot")
+
+WORKERS = int(os.getenv("EXTRACT_WORKERS", str(min(2, os.cpu_count() or 1))))
+MAX_PAGES = int(os.getenv("EXTRACT_MAX_PAGES", "300"))
+TIMEOUT = float(os.getenv("EXTRACT_TIMEOUT", "20"))
+PAGES_PER_TASK = 20
+
+_pool = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # the bot process has threads, which plain fork does not copy safely;
+        # forkserver forks from a clean single-threaded server that only has
+        # this module preloaded (spawn would re-import bot.py as __main__)
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            ctx = multiprocessing.get_context("forkserver")
+            ctx.set_forkserver_preload([__name__])
+        else:
+            ctx = multiprocessing.get_context("spawn")
+        _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=ctx)
+    return _pool
+
+
+# ----------------------------------------------------
+# Worker-side functions (run in the pool)
+# ----------------------------------------------------
+def _pdf_page_count(path: str) -> int:
+    with open(path, "rb") as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+def _pdf_range(path: str, start: int, stop: int, deadline: float) -> Tuple[List[str], bool]:
+    """Text of pages [start, stop); stops early (complete=False) at the deadline."""
+    out = []
+    with open(path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        for i in range(start, stop):
+            if time.time() > deadline:
+                return out, False
+            try:
+                out.append(reader.pages[i].extract_text() or "")
+            except Exception:
+                out.append("")
+    return out, True
+
+def _docx_text(path: str) -> str:
+    return "\n".join(p.text for p in Document(path).paragraphs)
+
+
+# ----------------------------------------------------
+# Public API
+# ----------------------------------------------------
+async def extract_text(path: str, max_pages: int = MAX_PAGES, timeout: float = TIMEOUT) -> Tuple[str, bool]:
+    """
+    Returns (text, complete). complete is False if the page cap or the time
+    budget cut the document short, or extraction failed part-way.
+    """
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    suffix = os.path.splitext(path)[1].lower()
+    deadline = time.time() + timeout
+
+    try:
+        if suffix == ".docx":
+            text = await asyncio.wait_for(loop.run_in_executor(pool, _docx_text, path), timeout)
+            return text.strip(), True
+        if suffix != ".pdf":
+            return "", True
+
+        total = await asyncio.wait_for(loop.run_in_executor(pool, _pdf_page_count, path), timeout)
+        pages = min(total, max_pages)
+        tasks = [
+            loop.run_in_executor(pool, _pdf_range, path, start, min(start + PAGES_PER_TASK, pages), deadline)
+            for start in range(0, pages, PAGES_PER_TASK)
+        ]
+        done, pending = await asyncio.wait(tasks, timeout=max(deadline - time.time(), 0) + 1)
+    except asyncio.TimeoutError:
+        logger.warning("Text extraction timed out for %s", path)
+        return "", False
+    except Exception as e:
+        logger.warning("Could not extract text from %s: %s", path, e)
+        return "", False
+
+    for t in pending:
+        t.cancel()
+    complete = not pending and pages == total
+    parts = []
+    for t in tasks:         # in page order
+        if t in done and not t.exception():
+            texts, finished = t.result()
+            parts.extend(texts)
+            complete = complete and finished
+        else:
+            complete = False
+    if not complete:
+        logger.info("Partial extraction of %s: %d of %d pages", path, len(parts), total)
+    return "\n".join(parts).strip(), complete
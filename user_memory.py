@@ -1,60 +1,31 @@
-import os
-import json
+from state_db import fetchall, transaction
 
-PATH = "data/user_memory.json"
-
-
-# ----------------------------------------------------
-# Initialise storage
-# ----------------------------------------------------
-def _init():
-    if not os.path.exists("data"):
-        os.makedirs("data")
-    if not os.path.exists(PATH):
-        with open(PATH, "w") as f:
-            json.dump({}, f)
-
-
-# ----------------------------------------------------
-# Load / Save
-# ----------------------------------------------------
-def load_memory():
-    _init()
-    with open(PATH, "r") as f:
-        return json.load(f)
-
-
-def save_memory(data):
-    with open(PATH, "w") as f:
-        json.dump(data, f, indent=4)
+MAX_ITEMS = 20
 
 
 # ----------------------------------------------------
 # Log a user interaction
 # ----------------------------------------------------
 def log_interaction(user_id, text):
-    user_id = str(user_id)
-    data = load_memory()
-
-    if user_id not in data:
-        data[user_id] = []
-
-    data[user_id].append(text)
-
-    # keep last 20 items
-    data[user_id] = data[user_id][-20:]
-
-    save_memory(data)
+    uid = int(user_id)
+    with transaction() as conn:
+        conn.execute("INSERT INTO user_memory(user_id, text) VALUES (?,?)", (uid, text))
+        # keep last 20 items
+        conn.execute(
+            "DELETE FROM user_memory WHERE user_id=? AND id <= "
+            "(SELECT id FROM user_memory WHERE user_id=? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+            (uid, uid, MAX_ITEMS)
+        )
 
 
 # ----------------------------------------------------
 # Retrieve a user's past questions
 # ----------------------------------------------------
 def get_user_history(user_id):
-    data = load_memory()
-    user_id = str(user_id)
-
-    if user_id not in data:
+    if user_id is None:
         return []
-
-    return data[user_id]
+    rows = fetchall(
+        "SELECT text FROM user_memory WHERE user_id=? ORDER BY id DESC LIMIT ?",
+        (int(user_id), MAX_ITEMS)
+    )
+    return [r[0] for r in reversed(rows)]
@@ -1,59 +1,84 @@
 # utils.py  –  clean version
 import os
 import io
+import asyncio
 import tempfile
 import logging
 from pathlib import Path
 import aiohttp
-from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload
-from docx import Document
 import PyPDF2
-from groq import Groq
-from google.oauth2 import service_account
+import llm_gateway
+import answer_cache
+import text_extraction
+import text_cache
+import search_index
+import rag_index
+import drive_gateway
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup,Update, InputFile
 from telegram.ext import ContextTypes
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+from telegram.error import BadRequest, RetryAfter
 logger = logging.getLogger("aaes-bot")
 
-SERVICE_ACCOUNT_FILE = os.getenv("GOOGLE_SA_PATH", "service_account.json")
-SCOPES = ["https://www.googleapis.com/auth/drive.readonly"]
-drive_service = build("drive", "v3", credentials=service_account.Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES))
 
-# ---------- Drive wrapper for AI ----------
-from drive_search import search_drive as _folder_search   # NEW folder-first search
-
-def search_drive(keyword: str) -> str:
+# ---------- Reference hint for the AI ----------
+HINT_BUDGET = float(os.getenv("AI_HINT_BUDGET", "0.25"))   # seconds
+HINT_MAX_FILES = 3
+HINT_PASSAGES = 3
+HINT_PASSAGE_CHARS = 700
+
+def _hint_query(prompt: str) -> str:
+    """Content words of the latest question in a build_prompt() transcript."""
+    last = prompt.rsplit("\n\n", 1)[-1]
+    return " ".join(sorted(answer_cache.content_words(answer_cache.normalize(last))))
+
+def _local_hint(query: str) -> str:
+    blocks = []
+    passages = rag_index.search(query, k=HINT_PASSAGES)
+    if passages:
+        quoted = [f"[{p['name']}]\n{p['text'][:HINT_PASSAGE_CHARS]}" for p in passages]
+        blocks.append("Passages from AAES slides / past questions (cite the file name when used):\n\n"
+                      + "\n\n".join(quoted))
+    files = search_index.search(query, limit=HINT_MAX_FILES)
+    if files:
+        lines = [f"- {f.get('name')} ({f.get('link')})" for f in files]
+        blocks.append("Related AAES course materials on Google Drive:\n" + "\n".join(lines))
+    return "\n\n".join(blocks)
+
+async def reference_hint(prompt: str) -> str:
     """
-    Wraps the folder-first search so the AI module keeps working.
-    Returns a plain-text list of files (or 'No matching slide found.').
+    Drive material related to the question: matching slide passages from
+    rag_index and file names from search_index, both local (never the
+    Drive API). Returns "" if nothing matches or the lookup
+    does not finish within HINT_BUDGET seconds.
     """
-    result = _folder_search(keyword, mode="all", level=None)
-    return result if result else "No matching slide found."
-
-# ---------- File readers ----------
-def read_file_content(file_path: str) -> str:
+    query = _hint_query(prompt)
+    if len(query) < 3:
+        return ""
     try:
-        if file_path.lower().endswith(".pdf"):
-            with open(file_path, "rb") as f:
-                reader = PyPDF2.PdfReader(f)
-                text = ""
-                for page in reader.pages:
-                    text += page.extract_text() or ""
-                return text.strip()
-        elif file_path.lower().endswith(".docx"):
-            doc = Document(file_path)
-            text = "\n".join([para.text for para in doc.paragraphs])
-            return text.strip()
+        return await asyncio.wait_for(asyncio.to_thread(_local_hint, query), HINT_BUDGET)
+    except asyncio.TimeoutError:
+        logger.info("Reference hint skipped: over %ss budget", HINT_BUDGET)
     except Exception as e:
-        logger.error(f"Error reading file content: {e}")
-        return "Failed to read file content."
+        logger.warning("Reference hint failed: %s", e)
+    return ""
 
 # ---------- AI chat ----------
-async def ai_chat_response(prompt: str) -> str:
+async def ai_chat_response(prompt: str, on_partial=None, use_cache: bool = False) -> str:
+    """
+    Answer a question with Groq. If `on_partial` is given the completion is
+    streamed and `await on_partial(text_so_far)` runs after every piece.
+    use_cache=True looks the prompt up in answer_cache and stores the answer
+    there for everyone, so the prompt must hold nothing user-specific (no
+    history, summary or file text); see ask_ai.
+    """
+    if use_cache:
+        cached = answer_cache.get(prompt)
+        if cached:
+            return cached
     try:
-        # Search for relevant information in Google Drive
-        drive_hint = search_drive(prompt)
+        # Local-only Drive lookup with a hard time budget
+        drive_hint = await reference_hint(prompt)
 
         # Define the system message for the AI
         system_msg = (
@@ -64,21 +89,32 @@ async def ai_chat_response(prompt: str) -> str:
         messages = [{"role": "system", "content": system_msg}]
 
         # Add the drive hint if available
-        if drive_hint and isinstance(drive_hint, str) and "No matching" not in drive_hint:
-            messages.append({"role": "system", "content": str(drive_hint)})
+        if drive_hint:
+            messages.append({"role": "system", "content": drive_hint})
 
         # Add the user's prompt
         messages.append({"role": "user", "content": str(prompt)})
 
         # Generate the response from the AI
-        resp = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=messages,
-            temperature=0.4,
-            max_tokens=400
+        if on_partial is None:
+            answer = await llm_gateway.complete(messages, temperature=0.4, max_tokens=400)
+        else:
+            answer = ""
+            async for piece in llm_gateway.stream(messages, temperature=0.4, max_tokens=400):
+                answer += piece
+                await on_partial(answer)
+            answer = answer.strip()
+
+        if use_cache and answer:
+            answer_cache.put(prompt, answer)
+        return answer
+
+    except asyncio.TimeoutError:
+        logger.error("Groq API timed out after %ss", llm_gateway.TIMEOUT)
+        return (
+            "⚠️ The AI service is taking too long right now.\n"
+            "Please try again in a few seconds or rephrase your question."
         )
-        return resp.choices[0].message.content.strip()
-
     except Exception as e:
         logger.error("Groq API error: %s", e)
         return (
@@ -86,11 +122,67 @@ async def ai_chat_response(prompt: str) -> str:
             "Please try again in a few seconds or rephrase your question."
         )
 
-async def read_file(doc, update) -> str:
+# ---------- Streaming replies ----------
+STREAM_EDIT_INTERVAL = float(os.getenv("AI_STREAM_EDIT_INTERVAL", "1.2"))
+TG_MAX_TEXT = 4096
+
+class MessageStreamer:
+    """
+    Progressively edits one Telegram message (e.g. the "Thinking…" reply)
+    while an answer streams in. Edits are throttled to one per `interval`
+    seconds so a chat stays well inside Telegram's edit rate limits.
+    """
+
+    def __init__(self, message, interval: float = STREAM_EDIT_INTERVAL):
+        self.message = message
+        self.interval = interval
+        self._last_edit = 0.0
+        self._shown = ""
+
+    async def update(self, text: str):
+        now = asyncio.get_running_loop().time()
+        if now - self._last_edit < self.interval:
+            return
+        self._last_edit = now
+        # partial Markdown is rarely valid, so drafts go out as plain text
+        await self._edit(text[:TG_MAX_TEXT - 2] + " ▌")
+
+    async def finish(self, text: str, **kwargs):
+        """Final edit with formatting; plain text if Telegram rejects the Markdown."""
+        try:
+            await self.message.edit_text(text[:TG_MAX_TEXT], **kwargs)
+        except BadRequest as e:
+            if "not modified" in str(e):
+                return
+            kwargs.pop("parse_mode", None)
+            await self.message.edit_text(text[:TG_MAX_TEXT], **kwargs)
+
+    async def _edit(self, text: str):
+        if text == self._shown:
+            return
+        try:
+            await self.message.edit_text(text)
+            self._shown = text
+        except RetryAfter as e:
+            self._last_edit += e.retry_after
+        except Exception as e:
+            # drafts are best-effort; only finish() may fail the answer
+            logger.debug("Draft edit skipped: %s", e)
+
+async def read_file(doc, update=None) -> str:
     """
     Download the Telegram document and return its text content.
     Supports PDF and DOCX; returns empty string for other types.
+    Text is cached by file_unique_id, so re-sent copies skip both steps.
     """
+    key = text_cache.telegram_key(doc.file_unique_id) if getattr(doc, "file_unique_id", None) else None
+    cached = await asyncio.to_thread(text_cache.get, key) if key else None
+    if cached:
+        text, complete = cached
+        if not complete and text and update is not None:
+            await update.message.reply_text("⏱ Large file: I only read the first part of it.")
+        return text
+
     # 1. Download the file to a temporary location
     tg_file = await doc.get_file()
     suffix = Path(doc.file_name or "file").suffix.lower()
@@ -98,20 +190,14 @@ async def read_file(doc, update) -> str:
         tmp_path = tmp.name
     await tg_file.download_to_drive(tmp_path)
 
-    # 2. Extract text
+    # 2. Extract text (process pool, page/time budget)
     text = ""
     try:
-        if suffix == ".pdf":
-            with open(tmp_path, "rb") as f:
-                reader = PyPDF2.PdfReader(f)
-                for page in reader.pages:
-                    text += page.extract_text() or ""
-        elif suffix == ".docx":
-            document = Document(tmp_path)
-            for para in document.paragraphs:
-                text += para.text + "\n"
-    except Exception as e:
-        logger.warning("Could not extract text from file: %s", e)
+        text, complete = await text_extraction.extract_text(tmp_path)
+        if key and text:
+            await asyncio.to_thread(text_cache.put, key, text.strip(), complete)
+        if not complete and text and update is not None:
+            await update.message.reply_text("⏱ Large file: I only read the first part of it.")
     finally:
         # 3. Clean up
         try:
@@ -120,6 +206,7 @@ async def read_file(doc, update) -> str:
             pass
 
     return text.strip()
+
 def prettify_answer(raw: str) -> str:
     """
     Converts a plain-text AI answer into a Telegram-friendly Markdown block.
@@ -158,12 +245,7 @@ def prettify_answer(raw: str) -> str:
 # ---------- File upload handler ----------
 async def handle_upload(doc, update):
     try:
-        file = await doc.get_file()
-        path = f"uploads/{doc.file_name}"
-        os.makedirs("uploads", exist_ok=True)
-        await file.download_to_drive(path)
-
-        extracted = read_file(path)
+        extracted = await read_file(doc, update)
         if not extracted:
             await update.message.reply_text("I could not read this file.")
             return
@@ -173,32 +255,9 @@ async def handle_upload(doc, update):
         logging.error(f"Upload error: {e}")
         await update.message.reply_text("Upload failed.")
 
-def read_file_content(file_id: str) -> str:
-    try:
-        request = drive_service.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-        fh.seek(0)
-        if file_id.endswith(".pdf"):
-            reader = PyPDF2.PdfReader(fh)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() or ""
-            return text.strip()
-        elif file_id.endswith(".docx"):
-            doc = Document(fh)
-            text = "\n".join([para.text for para in doc.paragraphs])
-            return text.strip()
-    except Exception as e:
-        logger.error(f"Error reading file content: {e}")
-    return "Failed to read file content."
-
 def list_files_in_folder(folder_id: str) -> list:
     query = f"'{folder_id}' in parents and trashed = false"
-    results = drive_service.files().list(q=query, fields="files(id, name)").execute()
+    results = drive_gateway.service().files().list(q=query, fields="files(id, name)").execute()
     return results.get("files", [])
 
 def create_buttons_from_files(file_ids: list) -> InlineKeyboardMarkup:
@@ -228,7 +287,7 @@ async def display_exec_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 def extract_picture_and_text(file_id: str) -> (str, str):
     try:
-        request = drive_service.files().get_media(fileId=file_id)
+        request = drive_gateway.service().files().get_media(fileId=file_id)
         fh = io.BytesIO()
         downloader = MediaIoBaseDownload(fh, request)
         done = False
@@ -252,18 +311,68 @@ def extract_picture_and_text(file_id: str) -> (str, str):
     return "default_image.png", "Failed to extract picture and text."
 
 # ---------- NEW: send actual file to Telegram (up to 1.9 GB) ----------
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-SERVICE_ACCOUNT_FILE = os.getenv("GOOGLE_SA_PATH", "service_account.json")
-SCOPES = ["https://www.googleapis.com/auth/drive.readonly"]   # removed trailing space
-def _drive_service():
-    creds = service_account.Credentials.from_service_account_file(
-        SERVICE_ACCOUNT_FILE, scopes=SCOPES
-    )
-    return build("drive", "v3", credentials=creds)
-
-import mimetypes
+import contextlib
 from telegram.constants import ParseMode
+import drive_catalog
+import file_id_cache
+
+MAX_UPLOAD = 49 * 1024 * 1024          # Telegram bot limit is 50 MB for send_document
+CHUNK_BYTES = 4 * 1024 * 1024
+SPOOL_BYTES = 1024 * 1024              # bodies above this spill to a temp file
+
+def _file_meta(file_id: str) -> dict:
+    """Size/version/link, from the local catalog when it has the file."""
+    meta = drive_catalog.get_file(file_id) if drive_catalog.is_ready() else None
+    if meta:
+        return meta
+    meta = drive_gateway.service().files().get(
+        fileId=file_id, fields="id,size,md5Checksum,modifiedTime,webViewLink"
+    ).execute()
+    meta["link"] = meta.get("webViewLink", "https://drive.google.com")
+    return meta
+
+def _download(file_id: str, limit: int = MAX_UPLOAD):
+    """
+    Stream a Drive file into a spooled temp file (RAM up to SPOOL_BYTES,
+    disk beyond). Returns None if the body grows past `limit`.
+    """
+    request = drive_gateway.service().files().get_media(fileId=file_id)
+    fh = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    downloader = MediaIoBaseDownload(fh, request, chunksize=CHUNK_BYTES)
+    done = False
+    while not done:
+        _, done = downloader.next_chunk()
+        if fh.tell() > limit:
+            fh.close()
+            return None
+    fh.seek(0)
+    return fh
+
+
+class _TransferBudget:
+    """Caps the bytes of Drive files being transferred at once across the process."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self._cond = None
+
+    @contextlib.asynccontextmanager
+    async def reserve(self, nbytes: int):
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        async with self._cond:
+            # a file bigger than the whole budget still goes through, alone
+            await self._cond.wait_for(lambda: self.used == 0 or self.used + nbytes <= self.limit)
+            self.used += nbytes
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self.used -= nbytes
+                self._cond.notify_all()
+
+TRANSFER_BUDGET = _TransferBudget(int(os.getenv("DRIVE_TRANSFER_BUDGET_MB", "100")) * 1024 * 1024)
 
 async def send_drive_file(file_id: str,
                           filename: str,
@@ -272,30 +381,35 @@ async def send_drive_file(file_id: str,
                           caption: str | None = None,
                           thumb_path: str | None = None):
     """
-    Download anything from Drive and send it to Telegram.
+    Send a Drive file to Telegram.
     Supports ZIP, RAR, MP4, PDF, DOCX, etc.
-    Falls back to a Drive link if the file is too big or Telegram rejects it.
+    Files sent before are re-sent by Telegram file_id (no download) until
+    the Drive copy changes. Falls back to a Drive link if the file is too
+    big or Telegram rejects it.
     """
+    link = "https://drive.google.com"
     try:
-        drive = _drive_service()
-        request = drive.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request, chunksize=10 * 1024 * 1024)
-        done = False
-        while not done:
-            _, done = downloader.next_chunk()
-        fh.seek(0)
-
-        # Guess MIME type
-        mime, _ = mimetypes.guess_type(filename)
-        if not mime:
-            mime = "application/octet-stream"
-
-        # Telegram bot limit is 50 MB for send_document
-        file_size = fh.getbuffer().nbytes
-        if file_size > 49 * 1024 * 1024:          # 49 MB safety margin
-            file = drive.files().get(fileId=file_id, fields="webViewLink").execute()
-            link = file.get("webViewLink", "https://drive.google.com")
+        meta = await asyncio.to_thread(_file_meta, file_id)
+        link = meta.get("link") or link
+        version = file_id_cache.file_version(meta)
+
+        cached = await asyncio.to_thread(file_id_cache.get_file_id, file_id, version)
+        if cached:
+            try:
+                await bot.send_document(
+                    chat_id=chat_id,
+                    document=cached,
+                    caption=caption or "",
+                    parse_mode=ParseMode.MARKDOWN
+                )
+                return
+            except BadRequest as e:
+                # file_id no longer valid on Telegram's side; upload again
+                logger.warning("Cached file_id for %s rejected: %s", file_id, e)
+                await asyncio.to_thread(file_id_cache.forget, file_id)
+
+        size = int(meta.get("size") or 0)
+        if size > MAX_UPLOAD:
             await bot.send_message(
                 chat_id=chat_id,
                 text=f"📁 *{filename}* is too large for Telegram.\n\n[Download here]({link})",
@@ -304,24 +418,40 @@ async def send_drive_file(file_id: str,
             )
             return
 
-        # Send the actual file
-        await bot.send_document(
-            chat_id=chat_id,
-            document=InputFile(fh, filename=filename),
-            caption=caption or "",
-            parse_mode=ParseMode.MARKDOWN,
-            read_timeout=300,
-            write_timeout=300,
-            thumb=open(thumb_path, "rb") if thumb_path and os.path.exists(thumb_path) else None
-        )
+        # no size (Google-native exports): _download may read up to MAX_UPLOAD
+        async with TRANSFER_BUDGET.reserve(size or MAX_UPLOAD):
+            fh = await asyncio.to_thread(_download, file_id)
+            if fh is None:      # Google-native exports report no size up front
+                await bot.send_message(
+                    chat_id=chat_id,
+                    text=f"📁 *{filename}* is too large for Telegram.\n\n[Download here]({link})",
+                    parse_mode=ParseMode.MARKDOWN,
+                    disable_web_page_preview=True
+                )
+                return
+
+            thumb = open(thumb_path, "rb") if thumb_path and os.path.exists(thumb_path) else None
+            try:
+                msg = await bot.send_document(
+                    chat_id=chat_id,
+                    document=InputFile(fh, filename=filename),
+                    caption=caption or "",
+                    parse_mode=ParseMode.MARKDOWN,
+                    read_timeout=300,
+                    write_timeout=300,
+                    thumbnail=thumb
+                )
+            finally:
+                fh.close()
+                if thumb:
+                    thumb.close()
+        if msg.document:
+            await asyncio.to_thread(file_id_cache.put_file_id, file_id, version, msg.document.file_id)
 
     except Exception as e:
         logger.error("send_drive_file failed: %s", e)
         # Fallback to Drive link
         try:
-            drive = _drive_service()
-            file = drive.files().get(fileId=file_id, fields="webViewLink").execute()
-            link = file.get("webViewLink", "https://drive.google.com")
             await bot.send_message(
                 chat_id=chat_id,
                 text=f"⚠️ Could not send *{filename}* directly.\n\n[Download here]({link})",
@@ -331,45 +461,6 @@ async def send_drive_file(file_id: str,
             logger.error("Fallback link also failed: %s", e2)
             await bot.send_message(chat_id=chat_id, text="❌ File unavailable.")
 
-from googleapiclient.discovery import build
-
-async def send_drive_file(file_id, filename, bot, chat_id, caption="", thumb_path=None):
-    try:
-        # Set up Google Drive service account
-        creds = service_account.Credentials.from_service_account_file(
-            'credentials.json', scopes=['https://www.googleapis.com/auth/drive.readonly']
-        )
-        drive_service = build('drive', 'v3', credentials=creds)
-
-        # Download the file from Google Drive
-        request = drive_service.files().get_media(fileId=file_id)
-        response = request.execute()
-        file_data = response.get('downloadUrl')
-
-        # Download the file content
-        async with aiohttp.ClientSession() as session:
-            async with session.get(file_data, timeout=60) as resp:
-                file_content = await resp.read()
-
-        # Send the file to Telegram
-        if thumb_path and os.path.exists(thumb_path):
-            thumb = InputFile(thumb_path)
-        else:
-            thumb = None
-
-        await bot.send_document(
-            chat_id=chat_id,
-            document=InputFile(io.BytesIO(file_content), filename=filename),
-            thumb=thumb,
-            caption=caption or "",
-            parse_mode='Markdown',
-            read_timeout=300,
-            write_timeout=300,
-        )
-
-    except Exception as e:
-        logger.error(f"Failed to send file: {e}")
-        await bot.send_message(chat_id=chat_id, text="Failed to send file.")
 from PIL import Image
 
 def extract_picture_and_text(file_path: str) -> (str, str):
@@ -422,25 +513,27 @@ async def display_exec_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 # ---------- conversation helpers ----------
-from collections import deque
-
-CONVERSATION = {}
-MAX_HISTORY = 10
+import context_builder
+import conversation_store
 
-def add_turn(uid: int, role: str, text: str, file_text: str | None = None):
-    """Add a message to the user’s rolling buffer."""
-    if uid not in CONVERSATION:
-        CONVERSATION[uid] = deque(maxlen=MAX_HISTORY)
-    CONVERSATION[uid].append({"role": role, "text": text, "file": file_text})
+async def add_turn(uid: int, role: str, text: str, file_text: str | None = None):
+    """Add a message to the user’s rolling buffer (an SQLite write, so off the loop)."""
+    await asyncio.to_thread(conversation_store.add_turn, uid, role, text, file_text)
 
 def build_prompt(uid: int) -> str:
-    """Assemble last 10 turns into a single prompt for the LLM."""
-    buf = CONVERSATION.get(uid, [])
-    lines = []
-    for m in buf:
-        if m["file"]:
-            lines.append(f"User (with file): {m['text']}\nFile content:\n{m['file'][:3000]}")
-        else:
-            lines.append(f"{m['role'].capitalize()}: {m['text']}")
-    return "\n\n".join(lines)
+    """Assemble the prompt for the LLM within context_builder.TOKEN_BUDGET."""
+    return context_builder.build_context(conversation_store.get_turns(uid), conversation_store.get_summary(uid))
+
+async def ask_ai(uid: int, question: str, on_partial=None) -> str:
+    """
+    Answer the question the user just added with add_turn.
+    A question that opens a session (the only turn of the last
+    CONVERSATION_SESSION_MIN minutes) is sent on its own and goes through
+    answer_cache, so a shared answer never carries anyone's history, summary
+    or files. Follow-ups get the full prompt and are never cached.
+    """
+    if await asyncio.to_thread(conversation_store.session_length, uid) == 1:
+        return await ai_chat_response(question, on_partial=on_partial, use_cache=True)
+    prompt = await asyncio.to_thread(build_prompt, uid)
+    return await ai_chat_response(prompt, on_partial=on_partial)
 # ---------- END OF utils.py ----------
\ No newline at end of file
@@ -3,7 +3,7 @@ import tempfile
 import logging
 from telegram import Update
 from telegram.ext import ContextTypes
-from utils import ai_chat_response, add_turn, build_prompt
+from utils import add_turn, MessageStreamer, ask_ai
 
 logger = logging.getLogger("aaes-bot")
 
@@ -48,12 +48,13 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Treat it like a normal AI question
-    add_turn(uid, "user", text)
-    await update.message.reply_text("🔍 *Thinking…*", parse_mode="Markdown")
+    await add_turn(uid, "user", text)
+    thinking = await update.message.reply_text("🔍 *Thinking…*", parse_mode="Markdown")
     try:
-        answer = await ai_chat_response(build_prompt(uid))
-        add_turn(uid, "assistant", answer)
-        await update.message.reply_text(answer, parse_mode="Markdown")
+        streamer = MessageStreamer(thinking)
+        answer = await ask_ai(uid, text, on_partial=streamer.update)
+        await add_turn(uid, "assistant", answer)
+        await streamer.finish(answer, parse_mode="Markdown")
     except Exception as e:
         logger.error("Voice AI failed: %s", e)
         await update.message.reply_text("❌ Could not process your question.")
\ No newline at end of file
@@ -0,0 +1,269 @@
+# write_behind.py  –  in-memory buffer for activity / streak bookkeeping
+#
+# log_activity and update_streak run on every incoming message. Instead of a
+# database write per call, updates are coalesced per user here and written in
+# one transaction every FLUSH_INTERVAL seconds (or sooner once MAX_PENDING
+# updates are waiting). Each update is also appended to a journal file so a
+# crash between flushes loses nothing: the journal is replayed on start-up.
+# Streak rows double as a read cache, bounded to STREAK_CACHE_SIZE users;
+# rows waiting for a flush are never evicted.
+import glob
+import itertools
+import json
+import logging
+import os
+import threading
+import atexit
+from collections import OrderedDict
+
+from state_db import transaction, fetchone
+
+logger = logging.getLogger("aaes-bot")
+
+JOURNAL_DIR = "data"
+JOURNAL_PREFIX = "write_behind"
+FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "5"))
+MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "200"))
+ACTIVITY_KEEP = 20
+STREAK_CACHE_SIZE = int(os.getenv("STREAK_CACHE_SIZE", "5000"))
+
+_lock = threading.Lock()
+_wake = threading.Event()
+_stop = threading.Event()
+_thread = None
+
+_activity = {}          # uid -> [text, ...] not yet flushed (newest last)
+_streaks = OrderedDict()    # uid -> (streak, last_active), least recently used first
+_dirty_streaks = set()  # uids whose streak changed since the last flush
+_pending = 0
+_seq = 0
+_journal = None
+_unflushed = []         # journal seqs whose batch failed and was re-queued
+
+
+# ----------------------------------------------------
+# Journal
+# ----------------------------------------------------
+def _journal_path(seq: int) -> str:
+    return os.path.join(JOURNAL_DIR, f"{JOURNAL_PREFIX}.{seq}.journal")
+
+def _open_journal(seq: int):
+    os.makedirs(JOURNAL_DIR, exist_ok=True)
+    return open(_journal_path(seq), "a", encoding="utf-8")
+
+def _log(record: dict):
+    # caller holds _lock; write() lands in the OS page cache, no fsync
+    _journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+    _journal.flush()
+
+
+# ----------------------------------------------------
+# Applying a batch
+# ----------------------------------------------------
+def _apply(activity: dict, streaks: dict, seq: int):
+    with transaction() as conn:
+        for uid, texts in activity.items():
+            conn.executemany(
+                "INSERT INTO activity(user_id, text) VALUES (?,?)",
+                [(uid, t) for t in texts]
+            )
+            conn.execute(
+                "DELETE FROM activity WHERE user_id=? AND id <= "
+                "(SELECT id FROM activity WHERE user_id=? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (uid, uid, ACTIVITY_KEEP)
+            )
+        conn.executemany(
+            "INSERT INTO streaks(user_id, streak, last_active) VALUES (?,?,?) "
+            "ON CONFLICT(user_id) DO UPDATE SET streak=excluded.streak, last_active=excluded.last_active",
+            [(uid, s, d) for uid, (s, d) in streaks.items()]
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO meta(key, value) VALUES ('write_behind_seq', ?)",
+            (str(seq),)
+        )
+
+
+def _recover() -> int:
+    """Replay journals left by a previous process; return the next sequence number."""
+    row = fetchone("SELECT value FROM meta WHERE key='write_behind_seq'")
+    applied = int(row[0]) if row else -1
+    next_seq = applied + 1
+
+    files = []
+    for path in glob.glob(os.path.join(JOURNAL_DIR, f"{JOURNAL_PREFIX}.*.journal")):
+        try:
+            files.append((int(path.rsplit(".", 2)[1]), path))
+        except ValueError:
+            continue
+
+    for seq, path in sorted(files):
+        next_seq = max(next_seq, seq + 1)
+        if seq <= applied:
+            os.remove(path)
+            continue
+        activity, streaks = {}, {}
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    break   # torn last line from a crash mid-write
+                if rec["k"] == "a":
+                    activity.setdefault(rec["u"], []).append(rec["t"])
+                elif rec["k"] == "s":
+                    streaks[rec["u"]] = (rec["s"], rec["d"])
+        _apply(activity, streaks, seq)
+        os.remove(path)
+        logger.info("Replayed write-behind journal %s (%d users)", path, len(activity) + len(streaks))
+
+    return next_seq
+
+
+# ----------------------------------------------------
+# Public API
+# ----------------------------------------------------
+def start():
+    """Replay old journals and start the background flusher (idempotent)."""
+    global _thread, _seq, _journal
+    with _lock:
+        if _thread is not None:
+            return
+        _seq = _recover()
+        _journal = _open_journal(_seq)
+        _thread = threading.Thread(target=_run, name="write-behind", daemon=True)
+        _thread.start()
+    atexit.register(stop)
+
+
+def record_activity(user_id: int, text: str):
+    global _pending
+    if _thread is None:
+        start()
+    with _lock:
+        texts = _activity.setdefault(user_id, [])
+        texts.append(text)
+        del texts[:-ACTIVITY_KEEP]
+        _log({"k": "a", "u": user_id, "t": text})
+        _pending += 1
+        if _pending >= MAX_PENDING:
+            _wake.set()
+
+
+def update_streak(user_id: int, loaded, step):
+    """
+    Read-modify-write of a streak row under the buffer lock, so concurrent
+    messages from one user can't both apply `step`. step(row) gets the
+    cached row (or `loaded`, the row read from the database) and returns
+    the new (streak, last_active), or None to leave it. Returns the result.
+    """
+    global _pending
+    if _thread is None:
+        start()
+    with _lock:
+        row = _streaks.get(user_id, loaded)
+        new = step(row)
+        if new is None:
+            return row
+        _dirty_streaks.add(user_id)
+        _remember(user_id, new)
+        _log({"k": "s", "u": user_id, "s": new[0], "d": new[1]})
+        _pending += 1
+        if _pending >= MAX_PENDING:
+            _wake.set()
+        return new
+
+
+def _remember(uid: int, row: tuple):
+    # caller holds _lock
+    _streaks[uid] = row
+    _streaks.move_to_end(uid)
+    excess = len(_streaks) - STREAK_CACHE_SIZE
+    if excess <= 0:
+        return
+    # the oldest excess + dirty entries always hold enough clean ones
+    for old in list(itertools.islice(_streaks, excess + len(_dirty_streaks))):
+        if old not in _dirty_streaks:
+            del _streaks[old]
+            excess -= 1
+            if not excess:
+                break
+
+
+def pending_activity(user_id: int) -> list:
+    with _lock:
+        return list(_activity.get(user_id, ()))
+
+
+def cached_streak(user_id: int):
+    """(streak, last_active) if known in memory, else None."""
+    with _lock:
+        row = _streaks.get(user_id)
+        if row is not None:
+            _streaks.move_to_end(user_id)
+        return row
+
+
+def remember_streak(user_id: int, streak: int, last_active: str):
+    """Cache a row read from the database (not marked dirty)."""
+    with _lock:
+        if user_id not in _streaks:
+            _remember(user_id, (streak, last_active))
+
+
+def flush():
+    """Write everything buffered so far in one transaction."""
+    global _activity, _pending, _seq, _journal
+    with _lock:
+        if not _pending or _journal is None:
+            return
+        activity = _activity
+        streaks = {uid: _streaks[uid] for uid in _dirty_streaks}
+        seq = _seq
+        _activity = {}
+        _dirty_streaks.clear()
+        _pending = 0
+        _journal.close()
+        _seq += 1
+        _journal = _open_journal(_seq)
+
+    try:
+        _apply(activity, streaks, seq)
+    except Exception as e:
+        # re-queue the batch and keep its journal until a later flush lands
+        logger.error("Write-behind flush %d failed: %s", seq, e)
+        with _lock:
+            for uid, texts in activity.items():
+                merged = texts + _activity.get(uid, [])
+                _activity[uid] = merged[-ACTIVITY_KEEP:]
+            # the rows were clean while in flight and may have been evicted
+            for uid, row in streaks.items():
+                if uid not in _dirty_streaks:       # a newer update wins
+                    _dirty_streaks.add(uid)
+                    _remember(uid, row)
+            _pending += len(activity) + len(streaks)
+            _unflushed.append(seq)
+        return
+
+    with _lock:
+        done, _unflushed[:] = _unflushed + [seq], []
+    for s in done:
+        try:
+            os.remove(_journal_path(s))
+        except OSError:
+            pass
+
+
+def stop():
+    _stop.set()
+    _wake.set()
+    flush()
+
+
+def _run():
+    while not _stop.is_set():
+        _wake.wait(FLUSH_INTERVAL)
+        _wake.clear()
+        try:
+            flush()
+        except Exception as e:
+            logger.error("Write-behind flusher error: %s", e)